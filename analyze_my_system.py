@@ -8,123 +8,124 @@ This script combines the exact code from the following files:
 * nouns_pps.py
 
 We did not streamline anything so as to prevent any discrepancies with the original code.
+The only exceptions are:
+* The annotation step, which uses the same annotation engine (annotation.py) as annotate_generated.py.
+* Novelty, which is computed with the hashed index of the training data (novelty.py)
+  instead of loading the full training data.
+* Global and local recall, which use precomputed indices of the val data
+  (CoverageIndex in global_recall.py, ImportanceIndex in local_recall.py).
+  The results are the same.
 
 This script does not:
-* Plot the TTR curve. It does compute the curve, with all points stored in stats.json.
+* Plot the TTR curve. It does compute the curve, with all points stored next to stats.json
+  (see stats_files.py).
 * Produce any tables. All results are stored in JSON format.
 """
 
 import json
-import spacy
 from collections import defaultdict
 import glob
 import argparse
 
-from methods import sentences_from_file, system_stats, load_json, save_json, sentence_stats, index_from_file
-from global_recall import most_frequent_omissions, get_count_list, percentiles
-from local_recall import local_recall_counts, local_recall_scores
+from annotation import annotate_entries, add_arguments, cache_from_args
+from corpus import Corpus
+from methods import system_stats, load_json, save_json, lower_sent, add_curve_arguments
+from global_recall import CoverageIndex
+from local_recall import local_recall, load_importance_index
 from nouns_pps import pp_stats, compound_stats
+from novelty import load_novelty_index
+from stats_files import load_stats, save_stats
 
-nlp = spacy.load('en_core_web_sm')
-
-def compounds_from_doc(doc):
-    "Return a list of compounds from the document."
-    compounds = []
-    current = []
-    for token in doc:
-        if token.tag_.startswith('NN'):
-            current.append(token.orth_)
-        elif len(current) == 1:
-            current = []
-        elif len(current) > 1:
-            compounds.append(current)
-            current = []
-    if len(current) > 1:
-        compounds.append(current)
-    return compounds
-
-
-def annotate_data(source_file, annotations_file, tag=False, compounds=False):
+
+def annotate_data(source_file, annotations_file, tag=False, compounds=False, parse=False,
+                  workers=1, batch_size=1000, cache=None):
     "Function to annotate existing coco data"
     data = load_json(source_file)
-    for entry in data:
-        raw_description = entry['caption']
-        doc = nlp.tokenizer(raw_description)
-        entry['tokenized'] = [tok.orth_ for tok in doc]
-        if tag:
-            # Call the tagger on the document.
-            nlp.tagger(doc)
-            entry['tagged'] = [(tok.orth_,tok.tag_) for tok in doc]
-        if compounds:
-            list_of_compounds = compounds_from_doc(doc)
-            entry['compounds'] = list_of_compounds
+    annotate_entries(data,
+                     tag=tag,
+                     compounds=compounds,
+                     parse=parse,
+                     workers=workers,
+                     batch_size=batch_size,
+                     cache=cache)
     save_json(data, annotations_file)
     return data
 
 
-def run_all(args):
-    "Run all metrics on the data and save JSON files with the results."
-    # Annotate generated data.
-    annotated = annotate_data(args.source_file,
-                              args.annotations_file,
-                              tag=True,
-                              compounds=True)
-    
-    # Load training data. (For computing novelty.)
-    train_data = load_json('./Data/COCO/Processed/tokenized_train2014.json')
-    train_descriptions = [entry['caption'] for entry in train_data['annotations']]
-    
-    # Load annotated data.
-    sentences = sentences_from_file(args.annotations_file)
-    
+def load_references():
+    """
+    Load the MS COCO data that all evaluations are compared against.
+
+    Computing these once (e.g. in evaluation_server.py) means that each evaluation
+    only has to process the generated descriptions.
+    """
+    train_stats = load_stats('./Data/COCO/Processed/train_stats.json')
+    val_stats = load_stats('./Data/COCO/Processed/val_stats.json')
+    return {'novelty_index': load_novelty_index(),    # For computing novelty.
+            'coverage_index': CoverageIndex(val_stats,      # For computing global recall.
+                                            set(train_stats['types']) & set(val_stats['types'])),
+            'importance_index': load_importance_index()}     # For computing local recall.
+
+
+def evaluate(annotated, references, curve_repeats=10, workers=1, cache=None):
+    """
+    Run all metrics on annotated system output (see annotate_data).
+
+    Returns a dictionary with the stats, global recall, local recall and noun/PP results.
+    """
     # Analyze the data.
-    stats = system_stats(sentences)
+    sentences = Corpus.from_sentences(lower_sent(entry['tokenized']) for entry in annotated)
+    stats = system_stats(sentences, curve_repeats=curve_repeats, workers=workers)
     
     # Get raw descriptions.
-    gen_descriptions = [entry['caption'] for entry in load_json(args.source_file)]
-    extra_stats = sentence_stats(train_descriptions, gen_descriptions)
+    gen_descriptions = [entry['caption'] for entry in annotated]
+    extra_stats = references['novelty_index'].novelty_stats(gen_descriptions, sentences)
     stats.update(extra_stats)
     
-    # Save statistics data.
-    save_json(stats, args.stats_file)
-    
     ################################
     # Global recall
     
-    train_stats = load_json('./Data/COCO/Processed/train_stats.json')
-    val_stats = load_json('./Data/COCO/Processed/val_stats.json')
-
-    train     = set(train_stats['types'])
-    val       = set(val_stats['types'])
-    learnable = train & val
-    
-    gen = set(stats['types'])
-    recalled = gen & val
-    
-    coverage = {"recalled": recalled,
-                "score": len(recalled)/len(learnable),
-                "not_in_val": gen - learnable}
-    
-    coverage['omissions'] = most_frequent_omissions(coverage['recalled'],
-                                                    val_stats,         # Use validation set as reference.
-                                                    n=None)
-    val_count_list = get_count_list(val_stats)
-    coverage['percentiles'] = percentiles(val_count_list, recalled)
-    save_json(coverage, args.global_coverage_file)
+    # All val words count as recalled, but the score is relative to the learnable words.
+    coverage = references['coverage_index'].coverage([stats['types']], learnable_only=False)[0]
     
     ####################################
     # Local recall
     
-    val_index = index_from_file('./Data/COCO/Processed/tagged_val2014.json', tagged=True, lower=True)
     generated = {entry['image_id']: entry['tokenized'] for entry in annotated}
-    local_recall_res = dict(scores = local_recall_scores(generated, val_index),
-                            counts = local_recall_counts(generated, val_index))
-    save_json(local_recall_res, args.local_coverage_file)
+    local_recall_res = local_recall(generated, references['importance_index'])
     
     ##################################
     # Nouns pps
-    npdata = {'pp_data': pp_stats(annotated), 'compound_data': compound_stats(annotated)}
-    save_json(npdata, args.noun_pp_file)
+    npdata = {'pp_data': pp_stats(annotated, cache), 'compound_data': compound_stats(annotated)}
+    
+    return {'stats': stats,
+            'global_recall': coverage,
+            'local_recall': local_recall_res,
+            'noun_pp': npdata}
+
+
+def run_all(args):
+    "Run all metrics on the data and save JSON files with the results."
+    # Annotate generated data.
+    # We also run the parser, so that the PPs do not have to be computed separately.
+    cache = cache_from_args(args)
+    annotated = annotate_data(args.source_file,
+                              args.annotations_file,
+                              tag=True,
+                              compounds=True,
+                              parse=True,
+                              workers=args.workers,
+                              batch_size=args.batch_size,
+                              cache=cache)
+    
+    results = evaluate(annotated, load_references(), curve_repeats=args.curve_repeats,
+                       workers=args.workers, cache=cache)
+    
+    # Save the results.
+    save_stats(results['stats'], args.stats_file)
+    save_json(results['global_recall'], args.global_coverage_file)
+    save_json(results['local_recall'], args.local_coverage_file)
+    save_json(results['noun_pp'], args.noun_pp_file)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Analyze diversity of your image description system.')
@@ -134,7 +135,7 @@ if __name__ == '__main__':
                         help="Where to store the annotated output. Should end in .json.",
                         default="annotations.json")
     parser.add_argument('--stats_file',
-                        help="Where to store the statistics. Should end in .json.",
+                        help="Where to store the statistics. Should end in .json. (Other values are stored next to it.)",
                         default="stats.json")
     parser.add_argument('--global_coverage_file',
                         help="Where to store the global coverage results. Should end in .json.",
@@ -145,5 +146,7 @@ if __name__ == '__main__':
     parser.add_argument('--noun_pp_file',
                         help="Where to store the noun & pp results. Should end in .json.",
                         default="noun_pp_data.json")
+    add_arguments(parser)
+    add_curve_arguments(parser)
     args = parser.parse_args()
     run_all(args)
@@ -1,84 +1,58 @@
-import json
-import spacy
-from collections import defaultdict
+import argparse
 import glob
+import os
 
-nlp = spacy.load('en_core_web_sm')
+from annotation import annotate_entries, add_arguments, cache_from_args
+from methods import load_json, save_json
 
 
-def load_json(filename):
-    "Wrapper function to load JSON data."
-    with open(filename) as f:
-        data = json.load(f)
-    return data
-
-
-def save_json(data, filename):
-    "Wrapper function to save the data as JSON."
-    with open(filename, 'w') as f:
-        json.dump(data, f)
-
-
-def compounds_from_doc(doc):
-    "Return a list of compounds from the document."
-    compounds = []
-    current = []
-    for token in doc:
-        if token.tag_.startswith('NN'):
-            current.append(token.orth_)
-        elif len(current) == 1:
-            current = []
-        elif len(current) > 1:
-            compounds.append(current)
-            current = []
-    if len(current) > 1:
-        compounds.append(current)
-    return compounds
-
-
-def annotate_data(filename, tag=False, compounds=False):
+def annotate_data(filename, tag=False, compounds=False, parse=False, workers=1, batch_size=1000, cache=None):
     "Function to annotate existing coco data"
     data = load_json(filename)
-    for entry in data:
-        raw_description = entry['caption']
-        doc = nlp.tokenizer(raw_description)
-        entry['tokenized'] = [tok.orth_ for tok in doc]
-        if tag:
-            # Call the tagger on the document.
-            nlp.tagger(doc)
-            entry['tagged'] = [(tok.orth_,tok.tag_) for tok in doc]
-        if compounds:
-            list_of_compounds = compounds_from_doc(doc)
-            entry['compounds'] = list_of_compounds
+    annotate_entries(data,
+                     tag=tag,
+                     compounds=compounds,
+                     parse=parse,
+                     workers=workers,
+                     batch_size=batch_size,
+                     cache=cache)
     return data
 
 
-def main(source_file, target_file):
+def main(source_file, target_file, parse=False, workers=1, batch_size=1000, cache=None):
     "Annotate data and save to file."
-    data = annotate_data(source_file, tag=True, compounds=True)
+    data = annotate_data(source_file, tag=True, compounds=True, parse=parse,
+                         workers=workers, batch_size=batch_size, cache=cache)
     save_json(data, target_file)
 
 
-for folder in ['Dai-et-al-2017',
-               'Liu-et-al-2017',
-               'Mun-et-al-2017',
-               'Shetty-et-al-2016',
-               'Shetty-et-al-2017',
-               'Tavakoli-et-al-2017',
-               'Vinyals-et-al-2017',
-               'Wu-et-al-2016',
-               'Zhou-et-al-2017']:
-    print('Processing:', folder)
-    
-    # Define source and target.
-    base = './Data/Systems/'
-    pattern = base + folder + '/Val/*.json'
-    files = glob.glob(pattern)
-    source = [path for path in glob.glob(pattern) if (not path.endswith('stats.json'))
-                                                  and (not path.endswith('annotated.json'))][0]
-    target = base + folder + '/Val/annotated.json'
-    main(source,target)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Annotate the generated descriptions.')
+    add_arguments(parser)
+    args = parser.parse_args()
+    cache = cache_from_args(args)
+
+    for folder in ['Dai-et-al-2017',
+                   'Liu-et-al-2017',
+                   'Mun-et-al-2017',
+                   'Shetty-et-al-2016',
+                   'Shetty-et-al-2017',
+                   'Tavakoli-et-al-2017',
+                   'Vinyals-et-al-2017',
+                   'Wu-et-al-2016',
+                   'Zhou-et-al-2017']:
+        print('Processing:', folder)
     
+        # Define source and target.
+        base = './Data/Systems/'
+        pattern = base + folder + '/Val/*.json'
+        files = glob.glob(pattern)
+        # Skip the annotated output and the stats files (stats.json and the files next to it).
+        source = [path for path in glob.glob(pattern) if (not os.path.basename(path).startswith('stats.'))
+                                                      and (not path.endswith('annotated.json'))][0]
+        target = base + folder + '/Val/annotated.json'
+        main(source, target, parse=args.parse, workers=args.workers, batch_size=args.batch_size, cache=cache)
+
 # main('./Data/Systems/Dai-et-al-2017/Val/gan_val2014.json',
 #      './Data/Systems/Dai-et-al-2017/Val/annotated.json')
 #
@@ -0,0 +1,226 @@
+"""
+Annotation engine shared by annotate_coco.py, annotate_generated.py and analyze_my_system.py.
+
+Captions are processed in batches using `nlp.pipe`, optionally spread over a pool
+of worker processes. Pipeline components that we do not use are disabled, so that
+spaCy only runs the tokenizer and (if requested) the tagger and the parser.
+
+If the parser is run, the PPs and their depths are stored for each caption (in the
+'pps' field), so that nouns_pps.pp_stats does not have to parse the captions again.
+
+The output is identical to calling `nlp.tokenizer` and `nlp.tagger` on each caption.
+Optionally, an AnnotationCache (see annotation_cache.py) is used to skip captions
+that have been annotated before.
+"""
+
+from multiprocessing import Pool
+
+from annotation_cache import AnnotationCache, DEFAULT_CACHE, caption_key, model_version
+from methods import chunks
+
+MODEL = 'en_core_web_sm'
+
+# Pipeline components that are never needed.
+UNUSED_PIPES = ['ner']
+
+# Model instance for worker processes. Loaded once per worker by `_init_worker`.
+_worker_nlp = None
+
+# Models loaded in this process, by the set of disabled components (see load_model).
+_models = dict()
+
+################################################################################
+# Model loading
+
+def disabled_pipes(tag=False, parse=False):
+    "Names of the pipeline components that can be disabled."
+    disabled = list(UNUSED_PIPES)
+    if not parse:
+        disabled.append('parser')
+    if not (tag or parse):
+        disabled.append('tagger')
+    return disabled
+
+
+def load_model(tag=False, parse=False):
+    """
+    Load the spaCy model, with all unused components disabled.
+
+    The model is only loaded once per process. If a model with more components has
+    already been loaded, that instance is shared; `pipe` disables the components that
+    are not needed. spaCy is only imported when the first model is loaded.
+    """
+    disabled = frozenset(disabled_pipes(tag, parse))
+    for loaded_disabled, nlp in _models.items():
+        if loaded_disabled <= disabled:
+            return nlp
+    import spacy
+    nlp = spacy.load(MODEL, disable=sorted(disabled))
+    _models[disabled] = nlp
+    return nlp
+
+
+def pipe(nlp, captions, tag=False, batch_size=1000, parse=False):
+    "Yield a Doc for each caption, without running unused components."
+    disable = [name for name in disabled_pipes(tag, parse) if name in nlp.pipe_names]
+    with nlp.disable_pipes(*disable):
+        for doc in nlp.pipe(captions, batch_size=batch_size):
+            yield doc
+
+################################################################################
+# Annotating documents
+
+def compounds_from_tagged(tagged, lower=False):
+    "Return a list of compounds from a list of (token, tag) pairs."
+    compounds = []
+    current = []
+    for token, tag in tagged:
+        if tag.startswith('NN'):
+            current.append(token.lower() if lower else token)
+        elif len(current) == 1:
+            current = []
+        elif len(current) > 1:
+            compounds.append(current)
+            current = []
+    if len(current) > 1:
+        compounds.append(current)
+    return compounds
+
+
+def compounds_from_doc(doc, lower=False):
+    "Return a list of compounds from the document."
+    return compounds_from_tagged(((tok.orth_, tok.tag_) for tok in doc), lower)
+
+
+def annotation_from_tagged(tagged, tag=False, compounds=False, lower=False):
+    """
+    Get the annotations for a single caption, from a list of (token, tag) pairs.
+
+    If lower is True, the words in the tagged output and the compounds are lowercased.
+    (This is what annotate_coco.py does.) The tokenized output is never lowercased.
+    """
+    annotation = {'tokenized': [token for token, _ in tagged]}
+    if tag:
+        annotation['tagged'] = [(token.lower() if lower else token, pos) for token, pos in tagged]
+    if compounds:
+        annotation['compounds'] = compounds_from_tagged(tagged, lower)
+    return annotation
+
+
+def pps_from_doc(doc):
+    """
+    Return a (PP, depth) pair for each preposition in a parsed document.
+
+    The PP is the lowercased subtree of the preposition, and the depth is the
+    number of prepositions in that subtree.
+    """
+    pps = []
+    for head in doc:
+        if head.tag_ == 'IN':
+            pp = ' '.join([token.orth_.lower() for token in head.subtree])
+            levels = len([token for token in head.subtree if token.tag_=='IN'])
+            pps.append((pp, levels))
+    return pps
+
+
+def annotate_doc(doc, tag=False, compounds=False, lower=False, parse=False):
+    "Get the annotations for a single document."
+    tagged = [(tok.orth_, tok.tag_) for tok in doc]
+    annotation = annotation_from_tagged(tagged, tag, compounds, lower)
+    if parse:
+        annotation['pps'] = pps_from_doc(doc)
+    return annotation
+
+################################################################################
+# Batched, multi-process annotation
+
+def _init_worker(tag, parse):
+    "Load the model once in each worker process."
+    global _worker_nlp
+    _worker_nlp = load_model(tag, parse)
+
+
+def _annotate_batch(task):
+    "Annotate one batch of captions in a worker process."
+    captions, tag, compounds, lower, parse, batch_size = task
+    return [annotate_doc(doc, tag, compounds, lower, parse)
+            for doc in pipe(_worker_nlp, captions, tag, batch_size, parse)]
+
+
+def _annotate_cached(captions, tag, compounds, lower, parse, workers, batch_size, nlp, cache):
+    "Annotate captions, only sending cache misses to spaCy (the model is only loaded for misses)."
+    version = model_version(MODEL)
+
+    def annotate_misses(misses):
+        annotations = annotate_captions(misses, tag=True, parse=parse, workers=workers,
+                                        batch_size=batch_size, nlp=nlp)
+        if parse:
+            # Store the PPs as well, so that we only parse the misses once.
+            cache.store('pps', {caption_key(caption, version): annotation['pps']
+                                for caption, annotation in zip(misses, annotations)})
+        return annotations
+
+    all_tagged = cache.cached('tagged', captions, version,
+                              lambda misses: [annotation['tagged'] for annotation in annotate_misses(misses)])
+    annotations = [annotation_from_tagged(tagged, tag, compounds, lower) for tagged in all_tagged]
+    if parse:
+        all_pps = cache.cached('pps', captions, version,
+                               lambda misses: [annotation['pps'] for annotation in annotate_misses(misses)])
+        for annotation, pps in zip(annotations, all_pps):
+            annotation['pps'] = pps
+    return annotations
+
+
+def annotate_captions(captions, tag=False, compounds=False, lower=False, parse=False,
+                      workers=1, batch_size=1000, nlp=None, cache=None):
+    """
+    Annotate a list of raw captions, and return a list of annotations in the same order.
+
+    With workers > 1, the captions are split into batches of batch_size captions,
+    which are annotated in parallel. Each worker loads its own copy of the model.
+
+    If an AnnotationCache is provided, only captions that are not in the cache are
+    sent to spaCy.
+    """
+    if cache is not None:
+        return _annotate_cached(captions, tag, compounds, lower, parse, workers, batch_size, nlp, cache)
+    if workers <= 1:
+        nlp = nlp or load_model(tag, parse)
+        return [annotate_doc(doc, tag, compounds, lower, parse)
+                for doc in pipe(nlp, captions, tag, batch_size, parse)]
+    tasks = ((batch, tag, compounds, lower, parse, batch_size)
+             for batch in chunks(captions, batch_size))
+    with Pool(workers, initializer=_init_worker, initargs=(tag, parse)) as pool:
+        return [annotation for batch in pool.imap(_annotate_batch, tasks)
+                           for annotation in batch]
+
+
+def annotate_entries(entries, tag=False, compounds=False, lower=False, parse=False,
+                     workers=1, batch_size=1000, nlp=None, cache=None):
+    "Add the annotations to each entry (in place), based on its caption."
+    captions = [entry['caption'] for entry in entries]
+    annotations = annotate_captions(captions, tag, compounds, lower, parse, workers=workers,
+                                    batch_size=batch_size, nlp=nlp, cache=cache)
+    for entry, annotation in zip(entries, annotations):
+        entry.update(annotation)
+    return entries
+
+
+def add_arguments(parser):
+    "Add the options for the annotation engine to an argument parser."
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes.")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="Number of captions per batch sent to spaCy.")
+    parser.add_argument('--parse', action='store_true',
+                        help="Also run the parser, and store the PPs for nouns_pps.py.")
+    parser.add_argument('--cache', default=DEFAULT_CACHE,
+                        help="Location of the annotation cache.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Do not use the annotation cache.")
+    return parser
+
+
+def cache_from_args(args):
+    "Open the annotation cache specified on the command line (or None)."
+    return None if args.no_cache else AnnotationCache(args.cache)
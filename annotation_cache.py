@@ -0,0 +1,132 @@
+"""
+Persistent, content-addressed cache for spaCy annotations.
+
+Annotations are stored in a local SQLite database, keyed by a hash of the caption
+text and the model version. This means that captions that were annotated before
+(e.g. in another system's output, or in a previous run of analyze_my_system.py)
+are not sent to spaCy again.
+
+The caption text is hashed as-is: spaCy's output depends on case and whitespace,
+so any further normalization would change the annotations.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+DEFAULT_CACHE = './Data/Cache/annotations.sqlite'
+
+# Each table maps a key to a JSON-encoded annotation.
+TABLES = ['tagged',     # List of (token, tag) pairs.
+          'pps']        # List of (PP, depth) pairs, one for each preposition.
+
+# Maximum number of keys per SQL query.
+QUERY_SIZE = 500
+
+
+def package_version(name):
+    "Return the version of an installed package, or None if it is not installed as a package."
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution(name).version
+        except pkg_resources.DistributionNotFound:
+            return None
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def model_meta(model):
+    """
+    Return the meta data of a spaCy model that is not installed as a package: from the
+    meta.json file of a model path or link, or (if there is none) by loading the model.
+    """
+    import spacy
+    paths = [model]
+    get_data_path = getattr(spacy.util, 'get_data_path', None)   # Model links (spaCy 2).
+    if get_data_path is not None and get_data_path() is not None:
+        paths.append(os.path.join(str(get_data_path()), model))
+    for path in paths:
+        meta_file = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                return json.load(f)
+    return spacy.load(model, disable=['tagger', 'parser', 'ner']).meta
+
+
+def model_version(model):
+    """
+    Return a string identifying the model and the spaCy version.
+
+    The versions are read from the metadata of the installed packages, so that the
+    model does not have to be loaded when all captions are in the cache.
+    """
+    version = package_version(model)
+    spacy_version = package_version('spacy')
+    if version is not None and spacy_version is not None:
+        return '{}-{}/spacy-{}'.format(model, version, spacy_version)
+    import spacy
+    meta = model_meta(model)
+    return '{}_{}-{}/spacy-{}'.format(meta['lang'], meta['name'], meta['version'],
+                                      spacy.about.__version__)
+
+
+def caption_key(caption, version):
+    "Hash the caption text together with the model version."
+    return hashlib.sha1((version + '\n' + caption).encode('utf-8')).hexdigest()
+
+
+class AnnotationCache(object):
+    "On-disk cache mapping captions to their annotations."
+
+    def __init__(self, filename=DEFAULT_CACHE):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(filename)
+        for table in TABLES:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS {} '
+                                    '(key TEXT PRIMARY KEY, value TEXT)'.format(table))
+        self.connection.commit()
+
+    def lookup(self, table, keys):
+        "Return a dictionary with the annotations for all keys that are in the cache."
+        found = dict()
+        for i in range(0, len(keys), QUERY_SIZE):
+            batch = keys[i:i + QUERY_SIZE]
+            query = 'SELECT key, value FROM {} WHERE key IN ({})'.format(table, ','.join('?' * len(batch)))
+            for key, value in self.connection.execute(query, batch):
+                found[key] = json.loads(value)
+        return found
+
+    def store(self, table, annotations):
+        "Store a dictionary mapping keys to annotations."
+        rows = ((key, json.dumps(value)) for key, value in annotations.items())
+        self.connection.executemany('INSERT OR REPLACE INTO {} VALUES (?, ?)'.format(table), rows)
+        self.connection.commit()
+
+    def cached(self, table, captions, version, compute):
+        """
+        Get annotations for a list of captions, in the same order.
+
+        Only the captions that are not in the cache are passed to compute (once per
+        unique caption), which should return a list of annotations for those captions.
+        """
+        keys = {caption: caption_key(caption, version) for caption in captions}
+        found = self.lookup(table, list(set(keys.values())))
+        misses = [caption for caption, key in keys.items() if key not in found]
+        if misses:
+            new = {keys[caption]: annotation for caption, annotation in zip(misses, compute(misses))}
+            self.store(table, new)
+            found.update(new)
+        return [found[keys[caption]] for caption in captions]
+
+    def close(self):
+        "Close the connection to the database."
+        self.connection.close()
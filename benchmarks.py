@@ -0,0 +1,172 @@
+"""
+Benchmarks comparing the current implementation with the original code.
+
+Usage:
+
+    python benchmarks.py annotation [--sample 20000] [--workers 4] [--batch-size 1000]
+    python benchmarks.py metrics [val] [train]
+    python benchmarks.py startup [--budget 0.5] [--repeats 5]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+from methods import load_json
+
+################################################################################
+# Helpers
+
+def timed(function, *args, **kwargs):
+    "Run function and return the result, along with the elapsed time in seconds."
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report(name, baseline_time, new_time, identical):
+    "Print the results of a benchmark."
+    print(name)
+    print('  Original:  {:.2f}s'.format(baseline_time))
+    print('  New:       {:.2f}s'.format(new_time))
+    print('  Speedup:   {:.1f}x'.format(baseline_time/new_time))
+    print('  Identical:', identical)
+
+################################################################################
+# Annotation
+
+def original_annotation(nlp, captions):
+    "The original annotation loop from annotate_coco.py, processing one document at a time."
+    from annotation import compounds_from_doc
+    results = []
+    for raw_description in captions:
+        doc = nlp.tokenizer(raw_description)
+        entry = {'tokenized': [tok.orth_ for tok in doc]}
+        nlp.tagger(doc)
+        entry['tagged'] = [(tok.orth_.lower(),tok.tag_) for tok in doc]
+        entry['compounds'] = compounds_from_doc(doc, lower=True)
+        results.append(entry)
+    return results
+
+
+def benchmark_annotation(args):
+    "Compare the original annotation loop with the annotation engine."
+    import spacy
+    from annotation import MODEL, annotate_captions
+    data = load_json('./Data/COCO/Raw/captions_val2014.json')
+    captions = [entry['caption'] for entry in data['annotations']][:args.sample]
+
+    nlp = spacy.load(MODEL)
+    baseline, baseline_time = timed(original_annotation, nlp, captions)
+    new, new_time = timed(annotate_captions, captions, tag=True, compounds=True, lower=True,
+                          workers=args.workers, batch_size=args.batch_size)
+    report('Annotation of {} captions'.format(len(captions)), baseline_time, new_time, baseline == new)
+
+################################################################################
+# Metrics
+
+def separate_metrics(sentences):
+    "Compute each metric separately, on lists of tokenized sentences."
+    import methods
+    data = methods.get_types_tokens(sentences)
+    for key, n, window in methods.CHUNKED_TTRS:
+        data[key] = (methods.type_token_ratio(sentences, window) if n == 1 else
+                     methods.ngram_ttr(sentences, n, window))
+    for key, n, window in methods.MOVING_TTRS:
+        data[key] = (methods.mattr(sentences, window) if n == 1 else
+                     methods.ngram_mattr(sentences, n, window))
+    data['average_sentence_length'] = methods.average_sentence_length(sentences)
+    data['std_sentence_length'] = methods.std_sentence_length(sentences)
+    return data
+
+
+def benchmark_metrics(args):
+    "Compare the separate metrics on lists of sentences with the fused metrics on a Corpus."
+    from methods import parallel_sentences_from_file, fused_stats, FUSED_METRICS
+    from corpus import Corpus
+    files = {'val': './Data/COCO/Processed/tagged_val2014.json',
+             'train': './Data/COCO/Processed/tokenized_train2014.json'}
+    for name in args.corpora:
+        parallel_sentences = parallel_sentences_from_file(files[name], tagged=False, lower=True)
+        baseline, baseline_time = timed(lambda: [separate_metrics(sentences)
+                                                 for sentences in parallel_sentences])
+        corpus, encoding_time = timed(Corpus.from_parallel, parallel_sentences)
+        new, new_time = timed(lambda: [fused_stats(sentences) for sentences in corpus.slots()])
+        identical = all(old[key] == result[key] for old, result in zip(baseline, new)
+                                                for key in FUSED_METRICS + ['counts'])
+        report('Metrics for MS COCO {} (excluding {:.2f}s to encode the corpus)'.format(name, encoding_time),
+               baseline_time, new_time, identical)
+
+################################################################################
+# Startup time
+
+# Modules that can be used as a library (e.g. by analyze_my_system.py).
+LIBRARY_MODULES = ['methods', 'corpus', 'novelty', 'stats_files', 'results_store',
+                   'global_recall', 'local_recall', 'nouns_pps', 'annotation', 'analyze_my_system']
+
+# Modules that should only be loaded when they are actually used.
+DEFERRED_MODULES = ['spacy', 'matplotlib', 'seaborn', 'tabulate', 'nltk', 'scipy']
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {modules}
+print(time.perf_counter() - start)
+print(' '.join(name for name in {deferred!r} if name in sys.modules))
+"""
+
+
+def import_time(modules):
+    "Time importing the modules in a fresh interpreter, and return the deferred modules that were loaded."
+    script = STARTUP_SCRIPT.format(modules=', '.join(modules), deferred=DEFERRED_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', script], universal_newlines=True)
+    elapsed, loaded = (output.splitlines() + [''])[:2]
+    return float(elapsed), loaded.split()
+
+
+def benchmark_startup(args):
+    "Check that importing the metrics library stays within the startup-time budget."
+    results = [import_time(LIBRARY_MODULES) for _ in range(args.repeats)]
+    best = min(elapsed for elapsed, _ in results)
+    loaded = sorted(set(name for _, names in results for name in names))
+    print('Importing:', ', '.join(LIBRARY_MODULES))
+    print('  Best of {}:  {:.3f}s'.format(args.repeats, best))
+    print('  Budget:     {:.3f}s'.format(args.budget))
+    print('  Loaded:    ', ', '.join(loaded) if loaded else 'none of ' + ', '.join(DEFERRED_MODULES))
+    within_budget = best <= args.budget and not loaded
+    print('  Within budget:', within_budget)
+    if not within_budget:
+        sys.exit(1)
+
+################################################################################
+# Main
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the MeasureDiversity code.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    annotation_parser = subparsers.add_parser('annotation', help='Benchmark the annotation engine.')
+    annotation_parser.add_argument('--sample', type=int, default=20000,
+                                   help="Number of COCO val captions to annotate.")
+    annotation_parser.add_argument('--workers', type=int, default=4)
+    annotation_parser.add_argument('--batch-size', type=int, default=1000)
+    annotation_parser.set_defaults(function=benchmark_annotation)
+
+    metrics_parser = subparsers.add_parser('metrics', help='Benchmark the fused metrics.')
+    metrics_parser.add_argument('corpora', nargs='*', default=['val', 'train'],
+                                help="The MS COCO data to use (val and/or train).")
+    metrics_parser.set_defaults(function=benchmark_metrics)
+
+    startup_parser = subparsers.add_parser('startup', help='Check the time it takes to import the metrics.')
+    startup_parser.add_argument('--budget', type=float, default=0.5,
+                                help="Maximum import time in seconds.")
+    startup_parser.add_argument('--repeats', type=int, default=5,
+                                help="Number of fresh interpreters to time (the best time is used).")
+    startup_parser.set_defaults(function=benchmark_startup)
+
+    args = parser.parse_args()
+    if args.benchmark is None:
+        parser.print_help()
+    else:
+        args.function(args)
@@ -0,0 +1,341 @@
+"""
+Compact binary format for annotated corpora.
+
+The annotated files (tokenized_train2014.json, tagged_val2014.json and the
+annotated.json files for each system) store every token and (token, tag) pair as
+JSON strings. A binary corpus is a directory with the same data as flat arrays:
+
+* meta.json:            format version, number of entries, and the stored fields.
+* vocab.json:           the vocabulary (all tokenized and tagged words).
+* tags.json:            the part-of-speech tags.
+* tokens.npy:           int32 word IDs of the tokenized descriptions, one after the other.
+* tagged_tokens.npy:    int32 word IDs of the tagged words (only if they are not the same
+                        as the tokenized words, or the lowercased tokenized words).
+* tag_ids.npy:          uint8 tag IDs, aligned with tokens.npy.
+* offsets.npy:          int64 start of each description in tokens.npy, plus the end.
+* image_ids.npy:        int64 image ID of each description (and ids.npy, if present).
+* captions.npy:         the raw captions as UTF-8 bytes, with caption_offsets.npy.
+* compound_spans.npy:   int64 (start, end) positions of the compounds in tokens.npy,
+                        with compound_offsets.npy (the first compound of each description).
+* pp_ids.npy:           int32 IDs of the PPs in pp_vocab.json, with their depths in
+                        pp_depths.npy and pp_offsets.npy (the first PP of each description).
+* header.json:          the other values in an MS COCO file (info, images, licenses).
+* extra.json:           any other fields of the entries (only if there are any).
+
+All arrays are memory-mapped when the corpus is loaded. The functions in methods.py
+that read annotated files (index_from_file, sentences_from_file, etc.) also accept
+a binary corpus directory instead of a JSON file.
+
+Usage (to convert between formats; the direction depends on the source):
+
+    python binary_corpus.py SOURCE TARGET
+
+For example:
+
+    python binary_corpus.py ./Data/COCO/Processed/tagged_val2014.json ./Data/COCO/Processed/tagged_val2014.corpus
+"""
+
+import argparse
+import json
+import os
+from array import array
+
+import numpy as np
+
+from corpus import Corpus, Vocabulary
+
+FORMAT_VERSION = 1
+OPTIONAL_FIELDS = ['id', 'caption', 'tokenized', 'tagged', 'compounds', 'pps']
+
+
+def is_binary_corpus(path):
+    "Check whether the path is a binary corpus directory."
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, 'meta.json'))
+
+
+def array_filename(directory, name):
+    "The file name of an array in the corpus directory."
+    return os.path.join(directory, name + '.npy')
+
+
+def save_json_file(data, filename):
+    "Save data as (compact) JSON."
+    with open(filename, 'w') as f:
+        json.dump(data, f)
+
+
+def load_json_file(filename):
+    "Load a JSON file."
+    with open(filename) as f:
+        return json.load(f)
+
+################################################################################
+# Writing
+
+def compound_spans(compounds, words, start):
+    "Find the (start, end) positions of the compounds in the list of tagged words."
+    spans = []
+    position = 0
+    for compound in compounds:
+        length = len(compound)
+        while position + length <= len(words) and words[position:position + length] != compound:
+            position += 1
+        if position + length > len(words):
+            raise ValueError('Compound {!r} does not occur in {!r}'.format(compound, words))
+        spans.append((start + position, start + position + length))
+        position += length
+    return spans
+
+
+def write_binary_corpus(entries, directory, header=None):
+    "Write an iterable of annotation entries to a binary corpus directory."
+    vocab = Vocabulary()
+    tags = Vocabulary()
+    pp_vocab = Vocabulary()
+    tokens, tagged_tokens, tag_ids = array('i'), array('i'), array('B')
+    offsets = array('q', [0])
+    image_ids, ids = array('q'), array('q')
+    captions = bytearray()
+    caption_offsets = array('q', [0])
+    spans, compound_offsets = array('q'), array('q', [0])
+    pp_ids, pp_depths, pp_offsets = array('i'), array('i'), array('q', [0])
+    extra = []
+    present = None
+    # Whether all tagged words are the same as the tokenized words, or the lowercased words.
+    same = lower = True
+
+    for entry in entries:
+        fields = [field for field in OPTIONAL_FIELDS if field in entry]
+        if present is None:
+            present = fields
+        elif fields != present:
+            raise ValueError('All entries should have the same fields: {} != {}'.format(fields, present))
+        image_ids.append(entry['image_id'])
+        extra.append({key: value for key, value in entry.items()
+                      if key not in OPTIONAL_FIELDS and key != 'image_id'})
+        if 'id' in entry:
+            ids.append(entry['id'])
+        if 'caption' in entry:
+            captions.extend(entry['caption'].encode('utf-8'))
+            caption_offsets.append(len(captions))
+        start = len(tokens)
+        tokenized = entry.get('tokenized', [])
+        tokens.extend(vocab.encode(tokenized))
+        offsets.append(len(tokens))
+        if 'tagged' in entry:
+            if len(entry['tagged']) != len(tokenized):
+                raise ValueError('The tagged and tokenized descriptions should have the same length.')
+            tagged_words = [word for word, _ in entry['tagged']]
+            same = same and tagged_words == tokenized
+            lower = lower and tagged_words == [token.lower() for token in tokenized]
+            tagged_tokens.extend(vocab.encode(tagged_words))
+            tag_ids.extend(tags.encode(tag for _, tag in entry['tagged']))
+            if len(tags) > 256:
+                raise ValueError('Too many different tags.')
+            if 'compounds' in entry:
+                for span in compound_spans(entry['compounds'], tagged_words, start):
+                    spans.extend(span)
+                compound_offsets.append(len(spans) // 2)
+        elif 'compounds' in entry:
+            raise ValueError('Compounds can only be stored for tagged descriptions.')
+        if 'pps' in entry:
+            for pp, depth in entry['pps']:
+                pp_ids.append(pp_vocab.add(pp))
+                pp_depths.append(depth)
+            pp_offsets.append(len(pp_ids))
+
+    present = present or []
+    mode = 'same' if same else 'lower' if lower else 'separate'
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    arrays = {'tokens': np.array(tokens, dtype=np.int32),
+              'offsets': np.array(offsets, dtype=np.int64),
+              'image_ids': np.array(image_ids, dtype=np.int64)}
+    if 'id' in present:
+        arrays['ids'] = np.array(ids, dtype=np.int64)
+    if 'caption' in present:
+        arrays['captions'] = np.frombuffer(bytes(captions), dtype=np.uint8)
+        arrays['caption_offsets'] = np.array(caption_offsets, dtype=np.int64)
+    if 'tagged' in present:
+        arrays['tag_ids'] = np.array(tag_ids, dtype=np.uint8)
+        if mode == 'separate':
+            arrays['tagged_tokens'] = np.array(tagged_tokens, dtype=np.int32)
+        save_json_file(tags.tokens, os.path.join(directory, 'tags.json'))
+    if 'compounds' in present:
+        arrays['compound_spans'] = np.array(spans, dtype=np.int64).reshape(-1, 2)
+        arrays['compound_offsets'] = np.array(compound_offsets, dtype=np.int64)
+    if 'pps' in present:
+        arrays['pp_ids'] = np.array(pp_ids, dtype=np.int32)
+        arrays['pp_depths'] = np.array(pp_depths, dtype=np.int32)
+        arrays['pp_offsets'] = np.array(pp_offsets, dtype=np.int64)
+        save_json_file(pp_vocab.tokens, os.path.join(directory, 'pp_vocab.json'))
+    for name, values in arrays.items():
+        np.save(array_filename(directory, name), values)
+
+    save_json_file(vocab.tokens, os.path.join(directory, 'vocab.json'))
+    if header is not None:
+        save_json_file(header, os.path.join(directory, 'header.json'))
+    if any(extra):
+        save_json_file(extra, os.path.join(directory, 'extra.json'))
+    meta = {'format_version': FORMAT_VERSION,
+            'size': len(image_ids),
+            'fields': present,
+            'tagged_words': mode}
+    # Write the metadata last, so that an incomplete directory is not recognized as a corpus.
+    save_json_file(meta, os.path.join(directory, 'meta.json'))
+
+
+def json_to_binary(filename, directory):
+    "Convert an MS COCO annotation file or system output to a binary corpus."
+    data = load_json_file(filename)
+    if isinstance(data, dict):
+        header = {key: value for key, value in data.items() if key != 'annotations'}
+        write_binary_corpus(data['annotations'], directory, header)
+    else:
+        write_binary_corpus(data, directory)
+
+################################################################################
+# Reading
+
+class BinaryCorpus(object):
+    "Memory-mapped binary corpus. Iterating over it yields the entries, as in the JSON file."
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = load_json_file(os.path.join(directory, 'meta.json'))
+        if self.meta['format_version'] != FORMAT_VERSION:
+            raise ValueError('Unsupported binary corpus version: {}'.format(self.meta['format_version']))
+        self.fields = self.meta['fields']
+        self.vocab = load_json_file(os.path.join(directory, 'vocab.json'))
+        self.tags = self.load_optional_json('tags.json', [])
+        self.pp_vocab = self.load_optional_json('pp_vocab.json', [])
+        self.header = self.load_optional_json('header.json', None)
+        self.extra = self.load_optional_json('extra.json', None)
+        self.arrays = {name[:-len('.npy')]: np.load(os.path.join(directory, name), mmap_mode='r')
+                       for name in os.listdir(directory) if name.endswith('.npy')}
+
+    def load_optional_json(self, name, default):
+        "Load a JSON file from the corpus directory, if it exists."
+        filename = os.path.join(self.directory, name)
+        return load_json_file(filename) if os.path.exists(filename) else default
+
+    def __len__(self):
+        return self.meta['size']
+
+    @property
+    def image_ids(self):
+        "The image ID of each description."
+        return self.arrays['image_ids']
+
+    def words(self, ids):
+        "Decode an array of word IDs."
+        return [self.vocab[i] for i in ids.tolist()]
+
+    def tokenized(self, i):
+        "The tokenized description with index i."
+        offsets = self.arrays['offsets']
+        return self.words(self.arrays['tokens'][offsets[i]:offsets[i + 1]])
+
+    def tagged_words(self, i, tokenized):
+        "The words in the tagged description with index i."
+        mode = self.meta['tagged_words']
+        if mode == 'same':
+            return tokenized
+        elif mode == 'lower':
+            return [token.lower() for token in tokenized]
+        offsets = self.arrays['offsets']
+        return self.words(self.arrays['tagged_tokens'][offsets[i]:offsets[i + 1]])
+
+    def entry(self, i):
+        "The entry with index i, as it is stored in the JSON file."
+        arrays = self.arrays
+        entry = {'image_id': int(arrays['image_ids'][i])}
+        if 'id' in self.fields:
+            entry['id'] = int(arrays['ids'][i])
+        if 'caption' in self.fields:
+            start, end = arrays['caption_offsets'][i:i + 2]
+            entry['caption'] = bytes(arrays['captions'][start:end]).decode('utf-8')
+        tokenized = self.tokenized(i)
+        if 'tokenized' in self.fields:
+            entry['tokenized'] = tokenized
+        if 'tagged' in self.fields:
+            start, end = arrays['offsets'][i:i + 2]
+            words = self.tagged_words(i, tokenized)
+            tags = [self.tags[tag] for tag in arrays['tag_ids'][start:end].tolist()]
+            entry['tagged'] = [[word, tag] for word, tag in zip(words, tags)]
+        if 'compounds' in self.fields:
+            first, last = arrays['compound_offsets'][i:i + 2]
+            entry['compounds'] = [words[a - start:b - start]
+                                  for a, b in arrays['compound_spans'][first:last].tolist()]
+        if 'pps' in self.fields:
+            first, last = arrays['pp_offsets'][i:i + 2]
+            entry['pps'] = [[self.pp_vocab[pp], depth] for pp, depth in
+                            zip(arrays['pp_ids'][first:last].tolist(), arrays['pp_depths'][first:last].tolist())]
+        if self.extra is not None:
+            entry.update(self.extra[i])
+        return entry
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.entry(i)
+
+    def to_json(self):
+        "The data, as it is stored in the JSON file."
+        entries = list(self)
+        if self.header is None:
+            return entries
+        data = dict(self.header)
+        data['annotations'] = entries
+        return data
+
+    def corpus(self, lower=True):
+        "The tokenized descriptions as a Corpus (see corpus.py), without decoding them."
+        tokens = np.asarray(self.arrays['tokens'])
+        if not lower:
+            return Corpus(tokens, np.asarray(self.arrays['offsets']), Vocabulary(self.vocab))
+        vocab = Vocabulary()
+        mapping = np.array([vocab.add(word.lower()) for word in self.vocab], dtype=np.int32)
+        return Corpus(mapping[tokens], np.asarray(self.arrays['offsets']), vocab)
+
+    def parallel_corpus(self, lower=True):
+        """
+        The descriptions as a parallel Corpus, with one slot per reference.
+        (The same as Corpus.from_index for the index of the descriptions.)
+        """
+        image_ids = np.asarray(self.image_ids)
+        _, first, inverse, counts = np.unique(image_ids, return_index=True,
+                                              return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        # Position of each image in order of first occurrence.
+        position = np.empty(len(first), dtype=np.int64)
+        position[np.argsort(first, kind='stable')] = np.arange(len(first))
+        # Rank of each description among the descriptions of its image.
+        order = np.argsort(inverse, kind='stable')
+        group_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        rank = np.empty(len(image_ids), dtype=np.int64)
+        rank[order] = np.arange(len(image_ids)) - group_starts[inverse[order]]
+        # Only complete slots are kept, as in zip(*index.values()).
+        num_slots = int(counts.min()) if len(counts) else 0
+        keep = np.flatnonzero(rank < num_slots)
+        keep = keep[np.argsort(rank[keep] * len(first) + position[inverse[keep]], kind='stable')]
+        corpus = self.corpus(lower).reorder(keep)
+        corpus.slot_bounds = [slot * len(first) for slot in range(num_slots + 1)]
+        return corpus
+
+
+def binary_to_json(directory, filename):
+    "Convert a binary corpus back to JSON."
+    save_json_file(BinaryCorpus(directory).to_json(), filename)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert annotated JSON files to binary corpora, and back.')
+    parser.add_argument('source', help="JSON file or binary corpus directory.")
+    parser.add_argument('target', help="Binary corpus directory or JSON file.")
+    args = parser.parse_args()
+
+    if is_binary_corpus(args.source):
+        binary_to_json(args.source, args.target)
+    else:
+        json_to_binary(args.source, args.target)
@@ -0,0 +1,328 @@
+"""
+Bootstrap confidence intervals for the diversity metrics, global recall, and local recall.
+
+The unit of resampling is the image: each resample draws as many images as there are
+in the system output (with replacement), and takes all descriptions for those images,
+in the order in which they were drawn. The metrics for each resample are computed
+exactly as for the full output (see fused_stats in methods.py, CoverageIndex in
+global_recall.py, and local_recall.py).
+
+The chunked TTRs and MATTRs depend on the order of the descriptions. The estimates
+(like the resamples) are computed for the system output grouped by image, so for these
+metrics they differ slightly from the values in stats.json and the main table, which
+use the original order. generate_main_table.py shows the bootstrap standard deviations
+next to the values in the main table.
+
+Resamples are processed in batches. A batch is a NumPy matrix with one row of image
+indices per resample. All resampled corpora in a batch are concatenated into one
+stream, and every ngram is keyed by its resample, so that the previous occurrences
+(from which the chunked TTRs, MATTRs, and types follow) are computed for the whole
+batch with a single sort. Local recall only needs the number of times each image is
+drawn, multiplied with the recall counts for each image. The batches are spread over
+worker processes; each batch has its own seed (derived from the master seed), so the
+results do not depend on the number of workers.
+
+Note that resampling with replacement repeats some descriptions, so the type-based
+metrics (types, TTRs, global recall) tend to be lower for the resamples than for the
+full output. The intervals are most useful to compare systems with each other.
+
+Usage:
+
+    python bootstrap.py [--resamples 1000] [--workers 4] [--confidence 0.95] [--systems NAME ...]
+"""
+
+import argparse
+from collections import OrderedDict
+from multiprocessing import Pool
+
+import numpy as np
+
+from corpus import Corpus
+from hashing import ngram_starts
+from methods import (CHUNKED_TTRS, MOVING_TTRS, FUSED_METRICS, iter_annotations, lower_sent,
+                     previous_occurrences, save_json)
+
+BOOTSTRAP_SEED = 1234
+
+SYSTEMS = ['Dai-et-al-2017',
+           'Liu-et-al-2017',
+           'Mun-et-al-2017',
+           'Shetty-et-al-2016',
+           'Shetty-et-al-2017',
+           'Tavakoli-et-al-2017',
+           'Vinyals-et-al-2017',
+           'Wu-et-al-2016',
+           'Zhou-et-al-2017']
+
+################################################################################
+# Data for one system.
+
+class BootstrapData(object):
+    """
+    System output grouped by image, with everything needed to compute the metrics
+    for a resample of the images.
+
+    - corpus:         lowercased descriptions, grouped by image.
+    - image_offsets:  the first description of each image, plus the total number of descriptions.
+    - learnable:      optional boolean array over corpus.vocab, marking the learnable words (for global recall).
+    - num_learnable:  total number of learnable words.
+    - recall_counts:  optional (recalled, total) arrays of shape (images, 5), see local_recall.image_recall_counts.
+    - novel:          optional boolean array marking the novel descriptions.
+    """
+
+    def __init__(self, corpus, image_offsets, learnable=None, num_learnable=None, recall_counts=None, novel=None):
+        self.corpus = corpus
+        self.image_offsets = image_offsets
+        self.learnable = learnable
+        self.num_learnable = num_learnable
+        self.recall_counts = recall_counts
+        self.novel = novel
+
+    @property
+    def num_images(self):
+        return len(self.image_offsets) - 1
+
+    @classmethod
+    def from_file(cls, filename, coverage_index=None, importance_index=None, novelty_index=None):
+        "Load the system output from an annotated file, and encode it for the optional indexes."
+        by_image = OrderedDict()
+        for entry in iter_annotations(filename):
+            by_image.setdefault(entry['image_id'], []).append(entry)
+        entries = [entry for image_entries in by_image.values() for entry in image_entries]
+        corpus = Corpus.from_sentences(lower_sent(entry['tokenized']) for entry in entries)
+        image_offsets = np.cumsum([0] + [len(image_entries) for image_entries in by_image.values()])
+        data = cls(corpus, image_offsets)
+        if coverage_index is not None:
+            learnable_words = {word for word, learnable in zip(coverage_index.words, coverage_index.learnable)
+                               if learnable}
+            data.learnable = np.array([word in learnable_words for word in corpus.vocab.tokens], dtype=bool)
+            data.num_learnable = len(learnable_words)
+        if importance_index is not None:
+            from local_recall import image_recall_counts
+            # As in local_recall: the (last) description for each image, not lowercased.
+            generated = {image: image_entries[-1]['tokenized'] for image, image_entries in by_image.items()}
+            recalled, total = image_recall_counts(generated, importance_index)
+            positions = {image: i for i, image in enumerate(importance_index.image_ids)}
+            rows = np.array([positions[image] for image in by_image], dtype=np.int64)
+            data.recall_counts = (recalled[rows], total[rows])
+        if novelty_index is not None:
+            data.novel = ~novelty_index.known_descriptions([entry['caption'] for entry in entries])
+        return data
+
+################################################################################
+# Metrics for a batch of resamples.
+
+def resampled_sentences(image_offsets, image_samples):
+    """
+    Sentence indices for a matrix of image samples (one resample per row), all rows
+    concatenated. Also returns the number of sentences in each resample.
+    """
+    images = image_samples.ravel()
+    counts = np.diff(image_offsets)[images]
+    starts = np.asarray(image_offsets)[images]
+    first = np.cumsum(counts) - counts
+    order = np.repeat(starts - first, counts) + np.arange(counts.sum())
+    return order, counts.reshape(image_samples.shape).sum(axis=1)
+
+
+def ngram_keys(tokens, positions, n, vocab_size):
+    "Integer identifying the ngram at each position (equal ngrams get the same key)."
+    if vocab_size ** n < 2 ** 63:
+        keys = np.zeros(len(positions), dtype=np.int64)
+        for i in range(n):
+            keys = keys * vocab_size + tokens[positions + i]
+        return keys
+    rows = np.stack([tokens[positions + i] for i in range(n)], axis=1)
+    return np.unique(rows, axis=0, return_inverse=True)[1].ravel()
+
+
+def divide(numerators, denominators):
+    "Element-wise division, with NaN where the denominator is zero (not enough tokens)."
+    numerators = np.asarray(numerators, dtype=np.float64)
+    denominators = np.asarray(denominators, dtype=np.float64)
+    results = np.full(len(numerators), np.nan)
+    valid = denominators > 0
+    results[valid] = numerators[valid] / denominators[valid]
+    return results
+
+
+def resample_metrics(data, image_samples):
+    """
+    Compute all metrics for a batch of resamples, given as a matrix with one row of
+    image indices per resample. Returns a dictionary with an array for each metric.
+    """
+    num_resamples = len(image_samples)
+    order, num_sentences = resampled_sentences(data.image_offsets, image_samples)
+    corpus = data.corpus.reorder(order)
+    tokens = corpus.flat.astype(np.int64)
+    lengths = corpus.lengths
+    sentence_resamples = np.repeat(np.arange(num_resamples), num_sentences)
+    results = dict()
+
+    # Sentence lengths.
+    mean = divide(np.bincount(sentence_resamples, weights=lengths, minlength=num_resamples), num_sentences)
+    deviations = (lengths - mean[sentence_resamples]) ** 2
+    results['average_sentence_length'] = mean
+    results['std_sentence_length'] = np.sqrt(divide(np.bincount(sentence_resamples, weights=deviations,
+                                                                minlength=num_resamples), num_sentences))
+
+    # Token boundaries of each resample.
+    token_bounds = np.zeros(num_resamples + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sentence_resamples, weights=lengths, minlength=num_resamples).astype(np.int64),
+              out=token_bounds[1:])
+    vocab_size = max(len(data.corpus.vocab), 1)
+    for n in sorted({n for _, n, _ in CHUNKED_TTRS + MOVING_TTRS}):
+        # All ngrams within each resample, keyed by their resample.
+        positions = ngram_starts(token_bounds, n)
+        sizes = np.maximum(np.diff(token_bounds) - n + 1, 0)
+        resamples = np.repeat(np.arange(num_resamples), sizes)
+        keys = ngram_keys(tokens, positions, n, vocab_size)
+        keys = np.unique(keys, return_inverse=True)[1].ravel()
+        prev = previous_occurrences(resamples * (int(keys.max()) + 1 if len(keys) else 1) + keys)
+        # Positions relative to the start of the resample.
+        starts = (np.cumsum(sizes) - sizes)[resamples]
+        relative = np.arange(len(keys)) - starts
+        prev = np.where(prev < 0, -1, prev - starts)
+        for key, size, window in CHUNKED_TTRS:
+            if size == n:
+                complete = sizes // window
+                new = (prev < relative - relative % window) & (relative < (complete * window)[resamples])
+                results[key] = divide(np.bincount(resamples, weights=new, minlength=num_resamples), complete * window)
+        for key, size, window in MOVING_TTRS:
+            if size == n:
+                num_windows = sizes - window + 1
+                first = np.maximum(prev + 1, relative - window + 1)
+                last = np.minimum(relative, num_windows[resamples] - 1)
+                added = np.clip(last - first + 1, 0, None)
+                totals = np.bincount(resamples, weights=added, minlength=num_resamples)
+                results[key] = divide(totals, np.maximum(num_windows, 0) * window)
+        if n == 1:
+            first_occurrence = prev < 0
+            results['num_types'] = np.bincount(resamples, weights=first_occurrence, minlength=num_resamples)
+            if data.learnable is not None:
+                recalled = first_occurrence & data.learnable[tokens]
+                results['global_recall'] = (np.bincount(resamples, weights=recalled, minlength=num_resamples)
+                                            / data.num_learnable)
+
+    if data.recall_counts is not None:
+        # Number of times each image is drawn in each resample.
+        draws = np.zeros((num_resamples, data.num_images), dtype=np.int64)
+        np.add.at(draws, (np.repeat(np.arange(num_resamples), image_samples.shape[1]), image_samples.ravel()), 1)
+        recalled, total = data.recall_counts
+        scores = (draws @ recalled) / np.maximum(draws @ total, 1)
+        for i in range(5):
+            results['local_recall_{}'.format(i + 1)] = scores[:, i]
+
+    if data.novel is not None:
+        novel = np.bincount(sentence_resamples, weights=data.novel[order], minlength=num_resamples)
+        results['percentage_novel'] = divide(novel, num_sentences) * 100
+    return results
+
+################################################################################
+# Bootstrap
+
+# Data shared with the worker processes (see _init_bootstrap_worker).
+_bootstrap_data = None
+
+
+def _init_bootstrap_worker(data):
+    "Make the data available to a worker process."
+    global _bootstrap_data
+    _bootstrap_data = data
+
+
+def _bootstrap_task(task):
+    "Draw one batch of resamples, and compute their metrics."
+    seed, size = task
+    num_images = _bootstrap_data.num_images
+    image_samples = np.random.default_rng(seed).integers(0, num_images, size=(size, num_images))
+    return resample_metrics(_bootstrap_data, image_samples)
+
+
+def bootstrap_metrics(data, resamples=1000, batch_size=20, seed=BOOTSTRAP_SEED, workers=1):
+    "Compute the metrics for the given number of resamples. Returns a dictionary with an array for each metric."
+    sizes = [min(batch_size, resamples - start) for start in range(0, resamples, batch_size)]
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+    if workers <= 1:
+        _init_bootstrap_worker(data)
+        batches = list(map(_bootstrap_task, tasks))
+    else:
+        with Pool(workers, initializer=_init_bootstrap_worker, initargs=(data,)) as pool:
+            batches = pool.map(_bootstrap_task, tasks)
+    return {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+
+
+def confidence_intervals(data, resamples=1000, confidence=0.95, batch_size=20, seed=BOOTSTRAP_SEED, workers=1):
+    """
+    Percentile bootstrap confidence intervals for all metrics.
+
+    Returns a dictionary mapping each metric to its value for the full output
+    ('estimate'), the bounds of the interval ('low' and 'high'), and the standard
+    deviation over the resamples ('std'). The estimates are computed for the output
+    grouped by image, like the resamples.
+    """
+    full = resample_metrics(data, np.arange(data.num_images)[None, :])
+    samples = bootstrap_metrics(data, resamples, batch_size, seed, workers)
+    alpha = (1 - confidence) / 2 * 100
+    intervals = dict()
+    for key, values in samples.items():
+        values = values[~np.isnan(values)]   # Resamples with too few tokens for the metric.
+        low, high = np.percentile(values, [alpha, 100 - alpha]) if len(values) else (np.nan, np.nan)
+        intervals[key] = {'estimate': float(full[key][0]),
+                          'low': float(low),
+                          'high': float(high),
+                          'std': float(np.std(values)) if len(values) else np.nan}
+    return intervals
+
+
+def bootstrap_keys():
+    "All metrics with confidence intervals (if the indexes are available), in table order."
+    return (FUSED_METRICS + ['num_types', 'percentage_novel', 'global_recall'] +
+            ['local_recall_{}'.format(i) for i in range(1, 6)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute bootstrap confidence intervals for all systems.')
+    parser.add_argument('--systems', nargs='+', default=SYSTEMS, metavar='NAME',
+                        help="Systems to compute the intervals for.")
+    parser.add_argument('--resamples', type=int, default=1000,
+                        help="Number of bootstrap resamples of the images.")
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help="Confidence level of the intervals.")
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help="Number of resamples in each batch.")
+    parser.add_argument('--seed', type=int, default=BOOTSTRAP_SEED,
+                        help="Master seed for the resamples.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes.")
+    args = parser.parse_args()
+
+    from global_recall import CoverageIndex
+    from local_recall import load_importance_index
+    from novelty import load_novelty_index
+    from results_store import ResultsStore
+    from stats_files import load_stats
+
+    train_stats = load_stats('./Data/COCO/Processed/train_stats.json')
+    val_stats = load_stats('./Data/COCO/Processed/val_stats.json')
+    coverage_index = CoverageIndex(val_stats, set(train_stats['types']) & set(val_stats['types']))
+    importance_index = load_importance_index()
+    novelty_index = load_novelty_index()
+    store = ResultsStore()
+
+    all_intervals = dict()
+    for system in args.systems:
+        print('Processing:', system)
+        data = BootstrapData.from_file('./Data/Systems/' + system + '/Val/annotated.json',
+                                       coverage_index, importance_index, novelty_index)
+        intervals = confidence_intervals(data, args.resamples, args.confidence, args.batch_size,
+                                         args.seed, args.workers)
+        all_intervals[system] = intervals
+        store.store(system, {key + '_ci_' + bound: value for key, interval in intervals.items()
+                             for bound, value in interval.items() if bound != 'estimate'})
+        for key in bootstrap_keys():
+            if key in intervals:
+                interval = intervals[key]
+                print('  {:<25} {:.4f} [{:.4f}, {:.4f}]'.format(key, interval['estimate'],
+                                                                 interval['low'], interval['high']))
+    save_json(all_intervals, './Data/Output/bootstrap.json')
@@ -1,28 +1,43 @@
-from methods import parallel_sentences_from_file, parallel_stats, load_json, save_json, sentence_stats
+import argparse
 
-train = parallel_sentences_from_file('./Data/COCO/Processed/tokenized_train2014.json',
-                                     tagged=False,  # Don't load tags.
-                                     lower=True)    # Lowercase all descriptions.
+from methods import parallel_corpus_from_file, parallel_stats, iter_annotations, add_curve_arguments
+from novelty import load_novelty_index
+from stats_files import save_stats
+from results_store import ResultsStore
 
-val   = parallel_sentences_from_file('./Data/COCO/Processed/tagged_val2014.json',
-                                     tagged=False,  # Don't load tags.
-                                     lower=True)    # Lowercase all descriptions.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute statistics for the MS COCO training and val data.')
+    add_curve_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes for the type-token curve.")
+    args = parser.parse_args()
 
-# Compute stats for train and val data.
-train_stats = parallel_stats(train)
-val_stats   = parallel_stats(val)
+    # Integer-encoded parallel corpora (see corpus.py).
+    train = parallel_corpus_from_file('./Data/COCO/Processed/tokenized_train2014.json',
+                                      lower=True)   # Lowercase all descriptions.
 
-# Extra stats.
-train_data = load_json('./Data/COCO/Processed/tokenized_train2014.json')
-train_descriptions = [entry['caption'] for entry in train_data['annotations']]
+    val   = parallel_corpus_from_file('./Data/COCO/Processed/tagged_val2014.json',
+                                      lower=True)   # Lowercase all descriptions.
 
-val_data = load_json('./Data/COCO/Processed/tagged_val2014.json')
-val_descriptions = [entry['caption'] for entry in val_data['annotations']]
+    # Compute stats for train and val data.
+    train_stats = parallel_stats(train, curve_repeats=args.curve_repeats, workers=args.workers)
+    val_stats   = parallel_stats(val, curve_repeats=args.curve_repeats, workers=args.workers)
 
-extra_stats = sentence_stats(train_descriptions, val_descriptions)
+    # Extra stats.
+    novelty_index = load_novelty_index()
 
-val_stats.update(extra_stats)
+    val_descriptions = [entry['caption'] for entry in
+                        iter_annotations('./Data/COCO/Processed/tagged_val2014.json')]
 
-# Save data to file.
-save_json(train_stats, './Data/COCO/Processed/train_stats.json')
-save_json(val_stats, './Data/COCO/Processed/val_stats.json')
+    extra_stats = novelty_index.novelty_stats(val_descriptions, val)
+
+    val_stats.update(extra_stats)
+
+    # Save data to file.
+    save_stats(train_stats, './Data/COCO/Processed/train_stats.json')
+    save_stats(val_stats, './Data/COCO/Processed/val_stats.json')
+
+    # Save the scalar results to the results store.
+    store = ResultsStore()
+    store.store('train', train_stats)
+    store.store('val', val_stats)
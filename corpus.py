@@ -0,0 +1,164 @@
+"""
+Integer-encoded corpus representation.
+
+All tokens are interned into a shared Vocabulary, and the sentences are stored as
+one flat int32 array, along with an array of sentence offsets. Sentences and
+parallel reference slots (the first description of each image, the second
+description of each image, etc.) are zero-copy views on the same array.
+
+Corpus objects can be passed to all the metrics in methods.py instead of lists of
+tokenized sentences.
+"""
+
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+
+class Vocabulary(object):
+    "Mapping between tokens and integer IDs, in order of first occurrence."
+
+    def __init__(self, tokens=()):
+        self.tokens = []
+        self.ids = dict()
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token):
+        "Return the ID for a token, adding it to the vocabulary if necessary."
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.ids[token] = token_id
+            self.tokens.append(token)
+        return token_id
+
+    def encode(self, sentence):
+        "Convert a list of tokens to a list of IDs."
+        return [self.add(token) for token in sentence]
+
+    def decode(self, ids):
+        "Convert a list of IDs to a list of tokens."
+        return [self.tokens[token_id] for token_id in ids]
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.ids
+
+
+class Corpus(Sequence):
+    """
+    A list of sentences, stored as a flat array of token IDs.
+
+    - tokens:      int32 array with the token IDs.
+    - offsets:     int64 array with the start of each sentence in tokens, plus the end
+                   of the last sentence. (So there are len(offsets) - 1 sentences.)
+    - vocab:       the Vocabulary used to encode the tokens.
+    - slot_bounds: for parallel corpora, the sentence index at which each slot starts,
+                   plus the total number of sentences. None for other corpora.
+
+    Indexing a Corpus returns a list of tokens, so that it can be used wherever a
+    list of tokenized sentences is expected.
+    """
+
+    def __init__(self, tokens, offsets, vocab, slot_bounds=None):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.vocab = vocab
+        self.slot_bounds = slot_bounds
+
+    @classmethod
+    def from_sentences(cls, sentences, vocab=None):
+        "Create a corpus from an iterable of tokenized sentences."
+        return cls.from_slots([sentences], vocab, parallel=False)
+
+    @classmethod
+    def from_parallel(cls, parallel_sentences, vocab=None):
+        "Create a parallel corpus from a list of lists of tokenized sentences."
+        return cls.from_slots(parallel_sentences, vocab, parallel=True)
+
+    @classmethod
+    def from_index(cls, index, vocab=None):
+        "Create a parallel corpus from an index mapping images to descriptions."
+        return cls.from_parallel(list(zip(*index.values())), vocab)
+
+    @classmethod
+    def from_slots(cls, slots, vocab=None, parallel=True, encoded=False):
+        """
+        Encode all sentences, storing the slots one after the other.
+
+        If encoded is True, the sentences are already lists (or arrays) of IDs in vocab.
+        """
+        vocab = vocab if vocab is not None else Vocabulary()
+        tokens = array('i')
+        offsets = array('q', [0])
+        slot_bounds = [0]
+        for sentences in slots:
+            for sentence in sentences:
+                tokens.extend(sentence if encoded else vocab.encode(sentence))
+                offsets.append(len(tokens))
+            slot_bounds.append(len(offsets) - 1)
+        return cls(np.array(tokens, dtype=np.int32),
+                   np.array(offsets, dtype=np.int64),
+                   vocab,
+                   slot_bounds if parallel else None)
+
+    ############################################################################
+    # Views
+
+    @property
+    def flat(self):
+        "All token IDs in this corpus, as a single array."
+        return self.tokens[self.offsets[0]:self.offsets[-1]]
+
+    @property
+    def lengths(self):
+        "Array with the length of each sentence."
+        return np.diff(self.offsets)
+
+    @property
+    def num_tokens(self):
+        return int(self.offsets[-1] - self.offsets[0])
+
+    def sentence_ids(self, i):
+        "Token IDs for sentence i."
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def view(self, start, end):
+        "Corpus containing sentences start to end."
+        return Corpus(self.tokens, self.offsets[start:end + 1], self.vocab)
+
+    def slots(self):
+        "List of corpora; one for each parallel slot."
+        if self.slot_bounds is None:
+            return [self]
+        return [self.view(start, end) for start, end in zip(self.slot_bounds, self.slot_bounds[1:])]
+
+    def reorder(self, order):
+        "Create a new corpus with the sentences in the given order."
+        order = np.asarray(order, dtype=np.int64)
+        starts = self.offsets[:-1][order]
+        lengths = self.lengths[order]
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Position of each token in the original array.
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return Corpus(self.tokens[positions], offsets, self.vocab)
+
+    ############################################################################
+    # Sequence interface
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('sentence index out of range')
+        return self.vocab.decode(self.sentence_ids(i).tolist())
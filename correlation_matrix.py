@@ -1,5 +1,5 @@
 import json
-from methods import load_json
+from results_store import open_store
 from tabulate import tabulate
 from scipy.stats import spearmanr
 from itertools import combinations
@@ -14,31 +14,28 @@ plt.subplots(figsize=(34,12))
 
 def load_system_stats(name):
     "Load system stats based on the system name."
-    base = './Data/Systems/'
-    path = base + name + '/Val/stats.json'
-    return load_json(path)
+    return store.system(name)
 
 systems = ['Dai-et-al-2017', 'Liu-et-al-2017', 'Mun-et-al-2017', 'Shetty-et-al-2016',
            'Shetty-et-al-2017', 'Tavakoli-et-al-2017', 'Vinyals-et-al-2017',
            'Wu-et-al-2016', 'Zhou-et-al-2017']
 
-# Load the data
-system_stats = {sys_name: load_system_stats(sys_name) for sys_name in systems}
-global_recall = load_json('./Data/Output/global_recall.json')
-local_recall = load_json('./Data/Output/local_recall.json')
-
 # Values to be correlated.
 system_keys = ["average_sentence_length", 'std_sentence_length', "num_types", "type_token_ratio", 'bittr', 'percentage_novel']
 
+# Load the data
+store = open_store({system: system_keys + ['global_recall', 'local_recall_5'] for system in systems})
+system_stats = {sys_name: load_system_stats(sys_name) for sys_name in systems}
+
 # Let's first index all scores by system.
 # This is easiest to inspect, and we don't care about efficiency here.
 result_rows = dict()
 for system in systems:
     result_rows[system] = [system_stats[system][key] for key in system_keys]
     
-    # Add local and global recall scores from their separate files.
-    global_recall_score = global_recall[system]['score']
-    local_recall_score  = local_recall[system]['scores'][-1]
+    # Add local and global recall scores.
+    global_recall_score = system_stats[system]['global_recall']
+    local_recall_score  = system_stats[system]['local_recall_5']
     
     result_rows[system].append(global_recall_score)
     result_rows[system].append(local_recall_score)
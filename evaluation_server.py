@@ -0,0 +1,114 @@
+"""
+Local evaluation server, to evaluate many sets of descriptions (e.g. one for each
+checkpoint during training) without reloading everything for each evaluation.
+
+The server loads the spaCy model and the MS COCO reference data once, and then
+accepts system output in the standard JSON format (a list of entries with an
+'image_id' and a 'caption'). It returns the same results as analyze_my_system.py,
+as one JSON object with the keys 'stats', 'global_recall', 'local_recall' and 'noun_pp'.
+
+Usage:
+
+    python evaluation_server.py [--port 8000]
+    curl --data @descriptions.json http://localhost:8000/evaluate
+
+Requests are handled one at a time.
+"""
+
+import argparse
+import json
+import traceback
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from annotation import annotate_entries, load_model, add_arguments, cache_from_args
+from analyze_my_system import load_references, evaluate
+from methods import SetEncoder, add_curve_arguments
+
+
+class EvaluationHandler(BaseHTTPRequestHandler):
+    "Handle requests to evaluate system output."
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, cls=SetEncoder).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/status':
+            self.send_json({'status': 'ready'})
+        else:
+            self.send_json({'error': 'Unknown path: ' + self.path}, status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/evaluate':
+            self.send_json({'error': 'Unknown path: ' + self.path}, status=404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(data, list) or not all(isinstance(entry, dict)
+                                                     and 'caption' in entry and 'image_id' in entry
+                                                     for entry in data):
+                raise ValueError("Expected a list of entries with an 'image_id' and a 'caption'.")
+            if not data:
+                raise ValueError("Expected at least one entry.")
+            curve_repeats = int(parse_qs(url.query).get('curve_repeats', [self.server.args.curve_repeats])[0])
+        except ValueError as error:
+            self.send_json({'error': str(error)}, status=400)
+            return
+        try:
+            results = self.server.evaluate(data, curve_repeats)
+        except Exception as error:
+            # Keep serving, but show what went wrong on both sides.
+            traceback.print_exc()
+            self.send_json({'error': 'Evaluation failed: {!r}'.format(error)}, status=500)
+            return
+        self.send_json(results)
+
+
+class EvaluationServer(HTTPServer):
+    "HTTP server that keeps the model and the reference data in memory."
+
+    def __init__(self, address, args):
+        HTTPServer.__init__(self, address, EvaluationHandler)
+        self.args = args
+        print('Loading the model and the reference data...')
+        self.nlp = load_model(tag=True, parse=True)
+        self.cache = cache_from_args(args)
+        self.references = load_references()
+
+    def evaluate(self, data, curve_repeats):
+        "Annotate and evaluate the system output."
+        annotated = annotate_entries(data,
+                                     tag=True,
+                                     compounds=True,
+                                     parse=True,
+                                     workers=self.args.workers,
+                                     batch_size=self.args.batch_size,
+                                     nlp=self.nlp,
+                                     cache=self.cache)
+        return evaluate(annotated, self.references, curve_repeats=curve_repeats,
+                        workers=self.args.workers, cache=self.cache)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve evaluations of image description systems.')
+    parser.add_argument('--host', default='localhost',
+                        help="Address to listen on.")
+    parser.add_argument('--port', type=int, default=8000,
+                        help="Port to listen on.")
+    add_arguments(parser)
+    add_curve_arguments(parser)
+    args = parser.parse_args()
+
+    server = EvaluationServer((args.host, args.port), args)
+    print('Listening on http://{}:{}/evaluate'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
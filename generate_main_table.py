@@ -5,13 +5,12 @@ table caption.
 
 import json
 from methods import load_json
+from results_store import open_store
 from tabulate import tabulate
 
 def load_system_stats(name):
     "Load system stats based on the system name."
-    base = './Data/Systems/'
-    path = base + name + '/Val/stats.json'
-    return load_json(path)
+    return store.system(name)
 
 
 def format_vals(stats):
@@ -50,18 +49,23 @@ systems = {'Dai-et-al-2017': "Dai et al. 2017",
            'Wu-et-al-2016': 'Wu et al. 2016',
            'Zhou-et-al-2017': 'Zhou et al. 2017'}
 
-train_stats  = load_json('./Data/COCO/Processed/train_stats.json')
-val_stats    = load_json('./Data/COCO/Processed/val_stats.json')
-system_stats = {sys_name: load_system_stats(sys_name) for sys_name in systems}
-bleu_meteor  = load_json('./Data/Systems/bleu_meteor.json')
-global_recall = load_json('./Data/Output/global_recall.json')
-local_recall = load_json('./Data/Output/local_recall.json')
-
 headers     = ['System', 'BLEU', 'Meteor', "ASL", "SDSL", "Types", "TTR1", 'TTR2', 'Novel', 'Cov', 'Loc5']
 system_keys = ["average_sentence_length", 'std_sentence_length', "num_types", "type_token_ratio", 'bittr', 'percentage_novel']
 corpus_keys = ["average_sentence_length", 'std_sentence_length', "avg_types", "type_token_ratio", 'bittr', 'percentage_novel']
 train_keys  = corpus_keys[:-1] + ["total_types", "total_tokens"]
 
+# All keys that are used (or formatted, see format_vals) for each row.
+formatted_keys = ['trittr', 'ttr10k', 'ttr100k']
+required = {system: system_keys + formatted_keys + ['global_recall', 'local_recall_5'] for system in systems}
+required['train'] = train_keys + formatted_keys
+required['val'] = corpus_keys + formatted_keys + ['total_types', 'total_tokens']
+store = open_store(required)
+
+train_stats  = load_system_stats('train')
+val_stats    = load_system_stats('val')
+system_stats = {sys_name: load_system_stats(sys_name) for sys_name in systems}
+bleu_meteor  = load_json('./Data/Systems/bleu_meteor.json')
+
 train_results = list(zip(train_keys, get_values(train_stats, train_keys)))
 
 rows = []
@@ -69,8 +73,8 @@ for system in systems:
     lead = [system]
     reported_scores = [bleu_meteor[system]['BLEU'], bleu_meteor[system]['Meteor']]
     general_metrics = get_system_row(system, system_stats, system_keys)
-    global_recall_score = ['{:.2f}'.format(global_recall[system]['score'])]
-    local_recall_score = ['{:.2f}'.format(local_recall[system]['scores'][-1])]
+    global_recall_score = ['{:.2f}'.format(system_stats[system]['global_recall'])]
+    local_recall_score = ['{:.2f}'.format(system_stats[system]['local_recall_5'])]
     row = lead + reported_scores + general_metrics + global_recall_score + local_recall_score
     rows.append(row)
 
@@ -92,6 +96,32 @@ def modify_table(main_table):
 
 main_table = modify_table(main_table)
 
+# Bootstrap standard deviations (see bootstrap.py), if they have been computed.
+std_metrics = [('ASL', 'average_sentence_length', '{:.1f}'),
+               ('SDSL', 'std_sentence_length', '{:.2f}'),
+               ('Types', 'num_types', '{:.0f}'),
+               ('TTR1', 'type_token_ratio', '{:.2f}'),
+               ('TTR2', 'bittr', '{:.2f}'),
+               ('Novel', 'percentage_novel', '{:.1f}'),
+               ('Cov', 'global_recall', '{:.2f}'),
+               ('Loc5', 'local_recall_5', '{:.2f}')]
+
+def format_std(system, key, fmt):
+    "Format the value for a system, with the bootstrap standard deviation (if available)."
+    value = store.get(system, key)
+    std = store.get(system, key + '_ci_std')
+    if std is None:
+        return fmt.format(value)
+    return (fmt + ' ± ' + fmt).format(value, std)
+
+std_table = None
+if any(store.get(system, 'type_token_ratio_ci_std') is not None for system in systems):
+    std_rows = [[system] + [format_std(system, key, fmt) for _, key, fmt in std_metrics] for system in systems]
+    std_table = tabulate(std_rows, ['System'] + [header for header, _, _ in std_metrics], tablefmt="latex_booktabs")
+    for system, latex in systems.items():
+        std_table = std_table.replace(system, latex)
+    std_table = std_table.replace('±', '$\\pm$')
+
 caption = f"""The number of Types and Tokens, Average Sentence Length (ASL), and
 normalized Type-Token Ratio (nTTR, number of types per 1K tokens). Note that the
 results for the validation set are averaged over the parallel descriptions. The total
@@ -106,6 +136,9 @@ print("Train stats:")
 for key,val in train_results:
     print(key, '\t', val)
 print("------------")
+if std_table:
+    print("Bootstrap standard deviations:")
+    print(std_table)
 
 with open('./Data/Output/main_table.txt','w') as f:
     f.write(main_table)
@@ -115,4 +148,8 @@ with open('./Data/Output/main_table.txt','w') as f:
     for key,val in train_results:
         f.write(f'{key}\t\t{val}\n')
     f.write("------------")
+    if std_table:
+        f.write("\nBootstrap standard deviations:\n")
+        f.write(std_table)
+        f.write('\n')
     
@@ -1,4 +1,5 @@
 from methods import load_json
+from stats_files import load_stats
 from collections import Counter
 from string import punctuation
 from tabulate import tabulate
@@ -7,7 +8,7 @@ def name_to_stats_path(name):
     "Get mapping based on system name."
     base = './Data/Systems/'
     path = base + name + '/Val/stats.json'
-    return load_json(path)
+    return load_stats(path)
 
 
 def list_from_counts(count_tuples):
@@ -52,8 +53,8 @@ def get_top_n_omitted(stats, not_learned, n=10):
     return list_from_counts(top_n)
 
 
-train_stats = load_json('./Data/COCO/Processed/train_stats.json')
-val_stats = load_json('./Data/COCO/Processed/val_stats.json')
+train_stats = load_stats('./Data/COCO/Processed/train_stats.json')
+val_stats = load_stats('./Data/COCO/Processed/val_stats.json')
 
 train     = set(train_stats['types'])
 val       = set(val_stats['types'])
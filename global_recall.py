@@ -1,17 +1,14 @@
-from methods import load_json, save_json, chunks
+from methods import save_json, chunks
+from stats_files import load_stats
+from results_store import ResultsStore
 from collections import Counter
 from math import ceil
+import os
 
-# External libs:
-from tabulate import tabulate
-from matplotlib import pyplot as plt
-from matplotlib.lines import Line2D
-import seaborn as sns
+import numpy as np
 
-sns.set_style("white")
-sns.set_context('paper', font_scale=7)
-my_palette = sns.color_palette("cubehelix", 10)
-sns.set_palette(my_palette)
+# Plotting libraries are only loaded when the figure is made.
+from plotting import setup_plots, palette, legend_markers
 
 ################################################################################
 # Main score
@@ -25,7 +22,7 @@ def coverage(name, target):
     """
     base = './Data/Systems/'
     path = base + name + '/Val/stats.json'
-    system = load_json(path)
+    system = load_stats(path)
     gen = set(system['types'])
     recalled = gen & target
     return {"recalled": recalled,
@@ -76,8 +73,92 @@ def get_count_list(stats):
     c = Counter(stats['total_counts'])
     return c.most_common()
 
+################################################################################
+# Vocabulary bitsets
+
+class CoverageIndex(object):
+    """
+    The val vocabulary, sorted by frequency (as in get_count_list), with a boolean
+    mask for the learnable words.
+
+    The types of each system are represented as a boolean array over this vocabulary,
+    so that the coverage, the omissions and the percentile scores for any number of
+    systems can be computed with a few vectorized operations.
+    """
+
+    def __init__(self, val_stats, learnable):
+        self.val_stats = val_stats
+        count_list = get_count_list(val_stats)
+        self.words = [word for word, count in count_list]
+        self.counts = [count for word, count in count_list]
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.learnable = np.array([word in learnable for word in self.words], dtype=bool)
+        self.chunk_size = ceil(float(len(self.words))/10)
+
+    def bitsets(self, all_types):
+        """
+        Encode the types of each system as a row in a boolean matrix.
+
+        Also returns, for each system, the set of types that are not in val.
+        """
+        bitsets = np.zeros((len(all_types), len(self.words)), dtype=bool)
+        outside = []
+        for row, types in zip(bitsets, all_types):
+            ids = [self.word_ids[word] for word in types if word in self.word_ids]
+            row[ids] = True
+            outside.append({word for word in types if word not in self.word_ids})
+        return bitsets, outside
+
+    def coverage(self, all_types, learnable_only=True):
+        """
+        Compute global recall for a list of systems, given the types of each system.
+
+        With learnable_only, the recalled words are limited to the learnable words (as
+        in coverage). Otherwise, all val words count as recalled (as in analyze_my_system.py).
+        The score is always relative to the number of learnable words.
+        """
+        bitsets, outside = self.bitsets(all_types)
+        recalled = bitsets & self.learnable if learnable_only else bitsets
+        scores = recalled.sum(axis=1) / self.learnable.sum()
+        not_in_val = bitsets & ~self.learnable
+        # Number of recalled words in each decile of the frequency-sorted vocabulary.
+        bounds = np.arange(0, len(self.words), self.chunk_size)
+        chunk_lengths = np.diff(np.append(bounds, len(self.words)))
+        chunk_recalled = np.add.reduceat(recalled.astype(np.int64), bounds, axis=1)
+
+        results = []
+        for i in range(len(all_types)):
+            recalled_ids = np.flatnonzero(recalled[i]).tolist()
+            results.append({"recalled": {self.words[j] for j in recalled_ids},
+                            "score": float(scores[i]),
+                            "not_in_val": {self.words[j] for j in np.flatnonzero(not_in_val[i])} | outside[i],
+                            # Each recalled word occurs once, so this is the same as most_frequent_omissions.
+                            "omissions": [((self.words[j], self.counts[j]), 1) for j in recalled_ids],
+                            "percentiles": {'val_scores': [(int(n)/int(length)) * 100 for n, length
+                                                           in zip(chunk_recalled[i], chunk_lengths)],
+                                            'num_percentiles': 10}})
+        return results
+
+
+def load_types(name, base='./Data/Systems/'):
+    "Load the types for a system."
+    return set(load_stats(base + name + '/Val/stats.json')['types'])
+
+
+def systems_coverage(systems, index, base='./Data/Systems/'):
+    "Compute global recall for a list of systems, against the learnable words."
+    return dict(zip(systems, index.coverage([load_types(name, base) for name in systems])))
+
+
+def directory_coverage(index, base='./Data/Systems/'):
+    "Compute global recall for all systems in a directory (all folders with a Val/stats.json file)."
+    systems = sorted(name for name in os.listdir(base)
+                     if os.path.exists(os.path.join(base, name, 'Val', 'stats.json')))
+    return systems_coverage(systems, index, base)
+
 
 def plot_percentiles(results):
+    plt, sns = setup_plots()
     fig, ax = plt.subplots(figsize=(28,20))
     lw = 8.0
     ms = 25.0
@@ -101,12 +182,8 @@ def plot_percentiles(results):
     #plt.legend(ncol=2, loc=1, bbox_to_anchor=(1.05, 1))
     
     labels = [system2label[name] for name,_ in ordered_systems]
-    legend_markers = [Line2D(range(1), range(1),
-                         linewidth=0,   # Invisible line
-                         marker='o',
-                         markersize=40,
-                         markerfacecolor=system2color[name]) for name,_ in ordered_systems]
-    plt.legend(legend_markers, labels, numpoints=1, loc=1, handletextpad=-0.3, bbox_to_anchor=(1.05, 0.85))
+    markers = legend_markers([system2color[name] for name,_ in ordered_systems])
+    plt.legend(markers, labels, numpoints=1, loc=1, handletextpad=-0.3, bbox_to_anchor=(1.05, 0.85))
     
     # labels = ['-'.join(map(str,tup)) for tup in zip(range(0,100,10),range(10,110,10))]
     # labels = list(reversed(labels))
@@ -121,6 +198,8 @@ def plot_percentiles(results):
 ################################################################################
 # Main definitions.
 if __name__ == "__main__":
+    from tabulate import tabulate
+
     system2label  = {'Dai-et-al-2017': 'Dai et al. 2017',
                      'Liu-et-al-2017': 'Liu et al. 2017',
                      'Mun-et-al-2017': 'Mun et al. 2017',
@@ -131,10 +210,10 @@ if __name__ == "__main__":
                      'Wu-et-al-2016': 'Wu et al. 2016',
                      'Zhou-et-al-2017': 'Zhou et al. 2017'}
 
-    system2color = dict(zip(sorted(system2label),my_palette))
+    system2color = dict(zip(sorted(system2label),palette()))
 
-    train_stats = load_json('./Data/COCO/Processed/train_stats.json')
-    val_stats = load_json('./Data/COCO/Processed/val_stats.json')
+    train_stats = load_stats('./Data/COCO/Processed/train_stats.json')
+    val_stats = load_stats('./Data/COCO/Processed/val_stats.json')
 
     train     = set(train_stats['types'])
     val       = set(val_stats['types'])
@@ -157,26 +236,20 @@ if __name__ == "__main__":
                'Wu-et-al-2016',
                'Zhou-et-al-2017']
 
-    # Get coverage results
-    coverage_results = {system:coverage(system, learnable) for system in systems}
-
-    # Add global omission ranking
-    for entry in coverage_results.values():
-        entry['omissions'] = most_frequent_omissions(entry['recalled'],
-                                                     val_stats,         # Use validation set as reference.
-                                                     n=None)            # Rank everything
-
-    # Add percentile scores.
-    val_count_list = get_count_list(val_stats)
-    for entry in coverage_results.values():
-        recalled = entry['recalled']
-        entry['percentiles'] = percentiles(val_count_list, recalled)
+    # Get coverage results, including the global omission ranking and the percentile scores.
+    coverage_index = CoverageIndex(val_stats, learnable)     # Use validation set as reference.
+    coverage_results = systems_coverage(systems, coverage_index)
 
     plot_percentiles(coverage_results)
 
     # Save the data
     save_json(coverage_results, './Data/Output/global_recall.json')
 
+    store = ResultsStore()
+    for system, entry in coverage_results.items():
+        store.store(system, {'global_recall': entry['score'],
+                             'global_recall_percentile': entry['percentiles']['val_scores']})
+
     # Show a table with the results.
     table = tabulate(tabular_data=[(system, entry['score']) for system, entry in coverage_results.items()],
                      headers=['System', 'Coverage'],
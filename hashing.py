@@ -0,0 +1,75 @@
+"""
+Stable 64-bit hashes for strings and ngrams.
+
+Python's built-in hash is randomized for each process, so we use blake2b to hash
+strings. Ngrams are hashed by combining the hashes of their tokens, which is
+vectorized with NumPy. (All arithmetic is modulo 2**64.)
+"""
+
+import hashlib
+
+import numpy as np
+
+MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def hash_string(string):
+    "Hash a single string."
+    digest = hashlib.blake2b(string.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def hash_strings(strings):
+    "Hash a list of strings, returning a uint64 array."
+    return np.array([hash_string(string) for string in strings], dtype=np.uint64)
+
+
+def mix(hashes):
+    "Scramble the bits of a uint64 array (the splitmix64 finalizer)."
+    hashes = hashes ^ (hashes >> np.uint64(30))
+    hashes = hashes * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = hashes ^ (hashes >> np.uint64(27))
+    hashes = hashes * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def ngram_starts(offsets, n):
+    "Positions of all ngrams that lie within one sentence, given the sentence offsets."
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    counts = np.maximum(lengths - n + 1, 0)
+    # For each ngram: the start of its sentence, plus its position within the sentence.
+    sentence_starts = np.repeat(offsets[:-1], counts)
+    first_ngram = np.cumsum(counts) - counts
+    return sentence_starts + np.arange(counts.sum()) - np.repeat(first_ngram, counts)
+
+
+def hash_ngrams(token_hashes, offsets, n):
+    """
+    Hash all ngrams that lie within one sentence.
+
+    token_hashes contains the hash of the token at each position, and offsets contains
+    the start of each sentence (plus the end of the last one), as in a Corpus.
+    """
+    token_hashes = np.asarray(token_hashes, dtype=np.uint64)
+    starts = ngram_starts(np.asarray(offsets) - offsets[0], n)
+    hashes = np.full(len(starts), n, dtype=np.uint64)
+    for i in range(n):
+        hashes = mix(hashes * MULTIPLIER + token_hashes[starts + i])
+    return hashes
+
+
+def corpus_ngram_hashes(corpus, n):
+    "Hash all ngrams in a Corpus that lie within one sentence."
+    vocab_hashes = hash_strings(corpus.vocab.tokens)
+    return hash_ngrams(vocab_hashes[corpus.flat], corpus.offsets, n)
+
+
+def contains(sorted_hashes, hashes):
+    "Boolean array indicating which hashes occur in the sorted array of hashes."
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    if len(sorted_hashes) == 0:
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.searchsorted(sorted_hashes, hashes)
+    positions = np.minimum(positions, len(sorted_hashes) - 1)
+    return np.asarray(sorted_hashes)[positions] == hashes
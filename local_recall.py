@@ -1,13 +1,14 @@
 from methods import index_from_file, mapping_from_file, save_json
+from results_store import ResultsStore
 from collections import Counter, defaultdict
+from multiprocessing import Pool
+import argparse
+import os
 
-from matplotlib import pyplot as plt
-from matplotlib.lines import Line2D
-import seaborn as sns
-sns.set_style("white")
-sns.set_context('paper', font_scale=7)
-my_palette = sns.color_palette("cubehelix", 10)
-sns.set_palette(my_palette)
+import numpy as np
+
+# Plotting libraries are only loaded when the figure is made.
+from plotting import setup_plots, palette, legend_markers
 
 ################################################################################
 # Helper function.
@@ -87,10 +88,233 @@ def local_recall_counts(generated, ref_data):
                 missed_counter[count][word] += 1
     return recalled_counter, missed_counter
 
+################################################################################
+# Importance index.
+
+IMPORTANCE_INDEX = './Data/COCO/Processed/val_importance_index.npz'
+
+class ImportanceIndex(object):
+    """
+    Content words for each image, with their importance class.
+
+    The importance class of a word is the number of references that contain it (as a
+    content word). This is the same information that local_recall_scores and
+    local_recall_counts compute from the references, but it only has to be computed once.
+
+    - image_ids: list of image IDs.
+    - offsets:   int64 array with the start of each image in words/classes, plus the end.
+    - words:     int32 array with word IDs (indices into vocab).
+    - classes:   int8 array with the importance class of each word.
+    - vocab:     list of content words.
+    """
+
+    def __init__(self, image_ids, offsets, words, classes, vocab):
+        self.image_ids = image_ids
+        self.offsets = offsets
+        self.words = words
+        self.classes = classes
+        self.vocab = vocab
+        self.word_ids = {word: i for i, word in enumerate(vocab)}
+
+    @classmethod
+    def from_references(cls, ref_data):
+        "Build the index from a tagged index mapping images to references."
+        word_ids = dict()
+        image_ids, offsets, words, classes = [], [0], [], []
+        for image, references in ref_data.items():
+            word_counter = Counter()
+            for reference in references:
+                word_counter.update({word for word, tag in reference if content_pos(tag)})
+            for word, count in word_counter.items():
+                words.append(word_ids.setdefault(word, len(word_ids)))
+                classes.append(count)
+            image_ids.append(image)
+            offsets.append(len(words))
+        return cls(image_ids,
+                   np.array(offsets, dtype=np.int64),
+                   np.array(words, dtype=np.int32),
+                   np.array(classes, dtype=np.int8),
+                   list(word_ids))
+
+    def save(self, filename=IMPORTANCE_INDEX):
+        "Save the index as a NumPy .npz file."
+        np.savez(filename,
+                 image_ids=np.array(self.image_ids),
+                 offsets=self.offsets,
+                 words=self.words,
+                 classes=self.classes,
+                 vocab=np.array(self.vocab, dtype=str))
+
+    @classmethod
+    def load(cls, filename=IMPORTANCE_INDEX):
+        "Load an index saved with save."
+        with np.load(filename) as data:
+            return cls(data['image_ids'].tolist(),
+                       data['offsets'],
+                       data['words'],
+                       data['classes'],
+                       data['vocab'].tolist())
+
+
+def load_importance_index(filename=IMPORTANCE_INDEX,
+                          source='./Data/COCO/Processed/tagged_val2014.json'):
+    "Load the importance index, building it from the tagged references first if necessary."
+    if not os.path.exists(filename):
+        ref_data = index_from_file(source, tagged=True, lower=True)
+        ImportanceIndex.from_references(ref_data).save(filename)
+    return ImportanceIndex.load(filename)
+
+################################################################################
+# Fused local recall.
+
+def generated_content_words(generated, importance_index):
+    """
+    Find the generated words that are content words in the references for the same image.
+
+    Returns two int64 arrays: the position of each image in the index, and the word ID.
+    """
+    positions, word_ids = [], []
+    for position, image in enumerate(importance_index.image_ids):
+        for word in set(generated[image]):
+            word_id = importance_index.word_ids.get(word)
+            if word_id is not None:
+                positions.append(position)
+                word_ids.append(word_id)
+    return np.array(positions, dtype=np.int64), np.array(word_ids, dtype=np.int64)
+
+
+def local_recall(generated, importance_index):
+    """
+    Compute the local recall scores and counts in one pass.
+
+    Returns the same results as local_recall_scores and local_recall_counts, with
+    the references given as an ImportanceIndex.
+    """
+    index = importance_index
+    num_words = len(index.vocab)
+    # Encode all (image, word) pairs as a single integer, for both the generated
+    # content words and the content words in the references.
+    generated_positions, generated_words = generated_content_words(generated, index)
+    generated_keys = generated_positions * num_words + generated_words
+    positions = np.repeat(np.arange(len(index.image_ids), dtype=np.int64), np.diff(index.offsets))
+    reference_keys = positions * num_words + index.words
+    is_recalled = np.isin(reference_keys, generated_keys)
+
+    # Scores: the fraction of recalled words in each importance class.
+    classes = index.classes.astype(np.int64)
+    total = np.bincount(classes, minlength=6)
+    recalled = np.bincount(classes[is_recalled], minlength=6)
+    scores = [float(recalled[count])/int(total[count]) for count in [1,2,3,4,5]]
+
+    # Counts: how often each word is recalled or missed, by importance class.
+    recalled_counter = defaultdict(Counter)
+    missed_counter = defaultdict(Counter)
+    for counter, mask in [(recalled_counter, is_recalled), (missed_counter, ~is_recalled)]:
+        pairs, counts = np.unique(classes[mask] * num_words + index.words[mask], return_counts=True)
+        for pair, n in zip(pairs.tolist(), counts.tolist()):
+            count, word_id = divmod(pair, num_words)
+            counter[count][index.vocab[word_id]] = n
+    return dict(scores=scores, counts=(recalled_counter, missed_counter))
+
+
+def image_recall_counts(generated, importance_index):
+    """
+    Number of recalled content words and the total number of content words in each
+    importance class, for each image (in the order of the index).
+
+    Returns two int64 arrays of shape (images, 5). Summing them over any (multi)set of
+    images gives the local recall scores for those images, as in local_recall.
+    """
+    index = importance_index
+    num_words = len(index.vocab)
+    generated_positions, generated_words = generated_content_words(generated, index)
+    positions = np.repeat(np.arange(len(index.image_ids), dtype=np.int64), np.diff(index.offsets))
+    is_recalled = np.isin(positions * num_words + index.words, generated_positions * num_words + generated_words)
+    # Some images have more than five references, so there are more than five classes.
+    classes = index.classes.astype(np.int64)
+    stride = max(int(classes.max(initial=0)) + 1, 6)
+    keys = positions * stride + classes
+    size = len(index.image_ids) * stride
+    recalled = np.bincount(keys[is_recalled], minlength=size).reshape(-1, stride)
+    total = np.bincount(keys, minlength=size).reshape(-1, stride)
+    return recalled[:, 1:6], total[:, 1:6]
+
+# Importance index for worker processes. Loaded once per worker by `_init_worker`.
+_worker_index = None
+
+def _init_worker(filename):
+    global _worker_index
+    _worker_index = ImportanceIndex.load(filename)
+
+
+def _system_local_recall(system):
+    "Compute local recall for one system (in a worker process)."
+    return system, local_recall(name_to_mapping(system), _worker_index)
+
+
+def systems_local_recall(systems, filename=IMPORTANCE_INDEX, workers=1):
+    "Compute local recall for all systems in parallel, against the saved importance index."
+    results = dict()
+    def collect(system_results):
+        for system, result in system_results:
+            print('Processed:', system)
+            results[system] = result
+    if workers <= 1:
+        _init_worker(filename)
+        collect(map(_system_local_recall, systems))
+    else:
+        with Pool(workers, initializer=_init_worker, initargs=(filename,)) as pool:
+            collect(pool.imap(_system_local_recall, systems))
+    return results
+
+################################################################################
+# Sparse local recall scores for many systems at once.
+
+def importance_matrix(importance_index):
+    "Sparse image x vocab matrix with the importance class of each content word."
+    from scipy import sparse
+    index = importance_index
+    return sparse.csr_matrix((index.classes, index.words, index.offsets),
+                             shape=(len(index.image_ids), len(index.vocab)))
+
+
+def generated_matrix(generated, importance_index):
+    "Sparse binary image x vocab matrix with the generated content words."
+    from scipy import sparse
+    positions, word_ids = generated_content_words(generated, importance_index)
+    return sparse.csr_matrix((np.ones(len(positions), dtype=np.int8), (positions, word_ids)),
+                             shape=(len(importance_index.image_ids), len(importance_index.vocab)))
+
+
+def batch_local_recall_scores(all_generated, importance_index):
+    """
+    Compute the local recall scores for a list of systems (or checkpoints) at once.
+
+    The generated words for all systems are stacked into one sparse matrix, which is
+    multiplied element-wise with the importance matrix (repeated for each system).
+    Recall per importance class is then a single bincount. Requires SciPy.
+    Returns a list with the same scores as local_recall_scores, for each system.
+    """
+    from scipy import sparse
+    importance = importance_matrix(importance_index)
+    num_images = importance.shape[0]
+    # Some images have more than five references, so there are more than five classes.
+    stride = max(int(importance.data.max(initial=0)) + 1, 6)
+    total = np.bincount(importance.data, minlength=stride)
+    generated = sparse.vstack([generated_matrix(g, importance_index) for g in all_generated], format='csr')
+    recalled = sparse.vstack([importance] * len(all_generated), format='csr').multiply(generated).tocoo()
+    systems = recalled.row.astype(np.int64) // num_images
+    classes = recalled.data.astype(np.int64)
+    recalled_counts = np.bincount(systems * stride + classes,
+                                  minlength=stride * len(all_generated)).reshape(-1, stride)
+    return [[float(recalled_counts[system, count])/int(total[count]) for count in [1,2,3,4,5]]
+            for system in range(len(all_generated))]
+
 ################################################################################
 # Plot the scores.
 
 def plot_scores(results):
+    plt, sns = setup_plots()
     fig, ax = plt.subplots(figsize=(32,20))
     lw = 8.0
     ms = 25.0
@@ -108,12 +332,8 @@ def plot_scores(results):
         plt.plot(nums, scores,'o-',label=system2label[name],linewidth=lw,markersize=ms, color=system2color[name])
 
     labels = [system2label[name] for name,_ in ordered_systems]
-    legend_markers = [Line2D(range(1), range(1),
-                         linewidth=0,   # Invisible line
-                         marker='o',
-                         markersize=40,
-                         markerfacecolor=system2color[name]) for name,_ in ordered_systems]
-    plt.legend(legend_markers, labels, numpoints=1, loc=2, handletextpad=-0.3, bbox_to_anchor=(0, 1.1))
+    markers = legend_markers([system2color[name] for name,_ in ordered_systems])
+    plt.legend(markers, labels, numpoints=1, loc=2, handletextpad=-0.3, bbox_to_anchor=(0, 1.1))
     
     # labels = ['-'.join(map(str,tup)) for tup in zip(range(0,100,10),range(10,110,10))]
     # labels = list(reversed(labels))
@@ -131,6 +351,21 @@ def plot_scores(results):
 # Compute all the stats.
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute local recall for all systems.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of systems to process in parallel.")
+    parser.add_argument('--score', nargs='+', metavar='FILE',
+                        help="Only compute the scores for these annotated files, all at once, "
+                             "using sparse matrices (requires SciPy).")
+    args = parser.parse_args()
+
+    if args.score:
+        scores = batch_local_recall_scores([mapping_from_file(filename) for filename in args.score],
+                                           load_importance_index())
+        for filename, system_scores in zip(args.score, scores):
+            print(filename, ' '.join('{:.4f}'.format(score) for score in system_scores))
+        raise SystemExit
+
     # Mapping to printable names.
     system2label  = {'Dai-et-al-2017': 'Dai et al. 2017',
                      'Liu-et-al-2017': 'Liu et al. 2017',
@@ -142,9 +377,10 @@ if __name__ == '__main__':
                      'Wu-et-al-2016': 'Wu et al. 2016',
                      'Zhou-et-al-2017': 'Zhou et al. 2017'}
 
-    system2color = dict(zip(sorted(system2label),my_palette))
+    system2color = dict(zip(sorted(system2label),palette()))
 
-    val_index = index_from_file('./Data/COCO/Processed/tagged_val2014.json', tagged=True, lower=True)
+    # Build the importance index for the val data, if it does not exist yet.
+    load_importance_index()
 
     systems = ['Dai-et-al-2017',
                'Liu-et-al-2017',
@@ -156,13 +392,11 @@ if __name__ == '__main__':
                'Wu-et-al-2016',
                'Zhou-et-al-2017']
 
-    all_results = dict()
-    for system in systems:
-        print('Processing:', system)
-        generated = name_to_mapping(system)
-        system_results = dict(scores = local_recall_scores(generated, val_index),
-                              counts = local_recall_counts(generated, val_index))
-        all_results[system] = system_results
+    all_results = systems_local_recall(systems, workers=args.workers)
 
     plot_scores(all_results)
     save_json(all_results, './Data/Output/local_recall.json')
+
+    store = ResultsStore()
+    for system, results in all_results.items():
+        store.store(system, {'local_recall': results['scores']})
@@ -1,10 +1,16 @@
 import json
-import random
+import re
+from array import array
 import numpy as np
 from collections import defaultdict, Counter
-from nltk import ngrams
+from multiprocessing import Pool
 
-random.seed(1234)
+from binary_corpus import BinaryCorpus, is_binary_corpus
+from corpus import Corpus, Vocabulary
+
+# Master seed for the randomized type-token curves.
+# Each repeat gets its own seed, derived from this one.
+CURVE_SEED = 1234
 
 ################################################################################
 # Basic functions
@@ -19,11 +25,23 @@ def chunks(l, n):
         yield l[i:i + n]
 
 
+def ngrams(sequence, n):
+    """
+    Return an iterator over all ngrams (as tuples) in a sequence.
+
+    The same as nltk.ngrams, but without importing NLTK (which takes most of a second).
+    """
+    sequence = list(sequence)
+    return zip(*[sequence[i:] for i in range(n)])
+
+
 class SetEncoder(json.JSONEncoder):
-    "Encoder that saves sets as lists in JSON."
+    "Encoder that saves sets (and NumPy arrays) as lists in JSON."
     def default(self, obj):
-        if isinstance(obj, set):
-            return list(obj)
+        if isinstance(obj, (set, np.ndarray)):
+            return list(obj) if isinstance(obj, set) else obj.tolist()
+        elif isinstance(obj, np.generic):
+            return obj.item()
         else:
             return json.JSONEncoder.default(self, obj)
 
@@ -35,12 +53,116 @@ def load_json(filename):
     return data
 
 
+class JSONStream(object):
+    """
+    Incremental reader for a JSON file, which decodes one value at a time.
+
+    Only the current value (plus at most one chunk of text) is kept in memory.
+    """
+    WHITESPACE = re.compile(r'\s*')
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.file = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        "Add the next chunk to the buffer. Chunks grow with the buffer, to decode large values quickly."
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        "Return the next non-whitespace character (or '' at the end of the file)."
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.read_more()
+
+    def expect(self, characters):
+        "Consume the next character, which should be one of the given characters."
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError('Expected one of {!r} at position {} in {}, found {!r}'.format(
+                characters, self.pos, self.file.name, character))
+        self.pos += 1
+        return character
+
+    def decode(self):
+        "Decode the next value."
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # Numbers may continue in the next chunk, so the value should be followed by text.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read_more()
+
+
+def iter_json_array(filename, key=None, chunk_size=1 << 20):
+    """
+    Yield the elements of a JSON array one by one, without loading the whole file.
+
+    If the file contains an object, the array is the value stored under key.
+    The other values in the object are skipped.
+    """
+    with open(filename) as f:
+        stream = JSONStream(f, chunk_size)
+        if stream.peek() == '{':
+            stream.expect('{')
+            while True:
+                name = stream.decode()
+                stream.expect(':')
+                if name == key:
+                    break
+                stream.decode()
+                if stream.expect(',}') == '}':
+                    raise KeyError(key)
+        stream.expect('[')
+        if stream.peek() == ']':
+            return
+        while True:
+            yield stream.decode()
+            if stream.expect(',]') == ']':
+                return
+
+
+def iter_annotations(filename, chunk_size=1 << 20):
+    """
+    Yield the annotation entries from an MS COCO annotation file, or from a file with
+    system output (a list of entries), one by one.
+
+    The filename may also be a binary corpus directory (see binary_corpus.py).
+    """
+    if is_binary_corpus(filename):
+        return iter(BinaryCorpus(filename))
+    return iter_json_array(filename, key='annotations', chunk_size=chunk_size)
+
+
 def save_json(data, filename):
     "Wrapper function to save the data as JSON."
     with open(filename, 'w') as f:
         json.dump(data, f, cls=SetEncoder)
 
 
+def add_curve_arguments(parser):
+    "Add the options for the randomized type-token curve to an argument parser."
+    parser.add_argument('--curve-repeats', type=int, default=10,
+                        help="Number of random orderings to average the type-token curve over.")
+    return parser
+
+
 def write_csv(rows, header, filename):
     "Write rows to a CSV file."
     with open(filename, 'w') as f:
@@ -76,6 +198,22 @@ def sentence_stats(train_descriptions, gen_descriptions):
             "total_num_novel_descriptions": num_novel_descriptions,
             "percentage_novel": percentage_novel}
 
+def combine_sentence_stats(results, sizes):
+    """
+    Combine the sentence stats for consecutive parts of the generated descriptions
+    (e.g. shards, see sharded_stats.py). Sizes is the number of descriptions in each part.
+    """
+    gen_unique = set().union(*[result['unique_descriptions'] for result in results])
+    novel_gen = set().union(*[result['novel_descriptions'] for result in results])
+    num_novel_descriptions = sum(result['total_num_novel_descriptions'] for result in results)
+    percentage_novel = (num_novel_descriptions/sum(sizes)) * 100
+    return {"unique_descriptions": gen_unique,
+            "num_unique_descriptions": len(gen_unique),
+            "novel_descriptions": novel_gen,
+            "num_novel_description_types": len(novel_gen),
+            "total_num_novel_descriptions": num_novel_descriptions,
+            "percentage_novel": percentage_novel}
+
 ################################################################################
 # Building an index for MS COCO descriptions
 
@@ -87,13 +225,20 @@ def lower_sent(sentence, tagged=False):
         return [word.lower() for word in sentence]
 
 
+def annotation_entries(data):
+    "The annotation entries in MS COCO data, or the entries themselves if data is an iterable."
+    return data['annotations'] if isinstance(data, dict) else data
+
+
 def build_index(data, tagged=False, lower=True):
     """
     Build index of image descriptions for further processing.
+
+    Data is either MS COCO data, or an iterable of entries (see iter_annotations).
     """
     key = 'tagged' if tagged else 'tokenized'
     index = defaultdict(list)
-    for entry in data['annotations']:
+    for entry in annotation_entries(data):
         imgid = entry['image_id']
         if lower:
             description = lower_sent(entry[key], tagged)
@@ -105,8 +250,7 @@ def build_index(data, tagged=False, lower=True):
 
 def index_from_file(filename, tagged=False, lower=True):
     "Wrapper function to get index directly from file."
-    data = load_json(filename)
-    index = build_index(data, tagged=tagged, lower=lower)
+    index = build_index(iter_annotations(filename), tagged=tagged, lower=lower)
     return index
 
 
@@ -117,8 +261,7 @@ def parallel_sentences_from_index(index):
 
 def parallel_sentences_from_file(filename, tagged=False, lower=True):
     "Wrapper function to load parallel sentences directly from a file."
-    data            = load_json(filename)
-    index           = build_index(data, tagged=tagged, lower=lower)
+    index           = build_index(iter_annotations(filename), tagged=tagged, lower=lower)
     parallel_sents  = parallel_sentences_from_index(index)
     return parallel_sents
 
@@ -127,16 +270,15 @@ def parallel_sentences_from_file(filename, tagged=False, lower=True):
 
 def mapping_from_file(filename, tagged=False):
     "Load system output and map image ID to descriptions."
-    data = load_json(filename)
     mapping = {entry['image_id']: entry['tagged' if tagged else 'tokenized']
-                for entry in data}
+                for entry in iter_annotations(filename)}
     return mapping
 
 
 def get_sentences(data, lower=True, tagged=False):
-    "Get a list of tokenized sentences from generated output."
+    "Get a list of tokenized sentences from generated output (or from any iterable of entries)."
     key = 'tagged' if tagged else 'tokenized'
-    sentences = [entry[key] for entry in data]
+    sentences = [entry[key] for entry in annotation_entries(data)]
     if lower:
         return [lower_sent(sent, tagged) for sent in sentences]
     else:
@@ -145,13 +287,63 @@ def get_sentences(data, lower=True, tagged=False):
 
 def sentences_from_file(filename, lower=True, tagged=False):
     "Get sentences from a file containing system output."
-    data = load_json(filename)
-    sentences = get_sentences(data, lower, tagged)
+    sentences = get_sentences(iter_annotations(filename), lower, tagged)
     return sentences
 
+################################################################################
+# Creating an integer-encoded Corpus (see corpus.py).
+
+def corpus_from_file(filename, lower=True):
+    "Get a Corpus from a file containing system output (or a binary corpus)."
+    if is_binary_corpus(filename):
+        return BinaryCorpus(filename).corpus(lower)
+    return Corpus.from_sentences(lower_sent(entry['tokenized']) if lower else entry['tokenized']
+                                 for entry in iter_annotations(filename))
+
+
+def parallel_corpus_from_file(filename, lower=True):
+    """
+    Get a parallel Corpus (one slot per reference) from an MS COCO annotation file.
+
+    The entries are streamed from the file, and each description is encoded as soon
+    as it is read, so that only the compact integer arrays are kept in memory.
+    A binary corpus (see binary_corpus.py) is converted without decoding the descriptions.
+    """
+    if is_binary_corpus(filename):
+        return BinaryCorpus(filename).parallel_corpus(lower)
+    vocab = Vocabulary()
+    index = defaultdict(list)
+    for entry in iter_annotations(filename):
+        description = lower_sent(entry['tokenized']) if lower else entry['tokenized']
+        index[entry['image_id']].append(array('i', vocab.encode(description)))
+    return Corpus.from_slots(list(zip(*index.values())), vocab, encoded=True)
+
 ################################################################################
 # Metrics
 
+# All metrics accept either a list of tokenized sentences or a Corpus.
+# Parallel metrics accept either a list of lists of sentences or a parallel Corpus.
+
+def parallel_slices(parallel_sentences):
+    "Get the list of parallel slots."
+    if isinstance(parallel_sentences, Corpus):
+        return parallel_sentences.slots()
+    return parallel_sentences
+
+
+def as_corpus(sentences):
+    "Encode a list of tokenized sentences as a Corpus (if it isn't one already)."
+    if isinstance(sentences, Corpus):
+        return sentences
+    return Corpus.from_sentences(sentences)
+
+
+def all_tokens(sentences):
+    "Get all tokens as a single list (or as an array of IDs, for a Corpus)."
+    if isinstance(sentences, Corpus):
+        return sentences.flat
+    return [word for sentence in sentences for word in sentence]
+
 # General function to be used with:
 # - average sentence length
 # - type-token-ratio
@@ -159,38 +351,72 @@ def sentences_from_file(filename, lower=True, tagged=False):
 
 def average_function(function, parallel_sentences):
     "Compute average function for a list of lists of tokenized sentences."
-    results = [function(sentences) for sentences in parallel_sentences]
+    results = [function(sentences) for sentences in parallel_slices(parallel_sentences)]
     return float(sum(results))/len(results)
 
 ###########################################
 
+def sentence_lengths(sentences):
+    "Get the length of each sentence."
+    if isinstance(sentences, Corpus):
+        return sentences.lengths
+    return [len(sentence) for sentence in sentences]
+
 def average_sentence_length(sentences):
     "Compute average sentence length for a list of tokenized sentences."
-    lengths = [len(sentence) for sentence in sentences]
-    return float(sum(lengths))/len(lengths)
+    lengths = sentence_lengths(sentences)
+    return float(np.sum(lengths))/len(lengths)
 
 def std_sentence_length(sentences):
     "Compute standard deviation of sentence lengths."
-    lengths = [len(sentence) for sentence in sentences]
+    lengths = sentence_lengths(sentences)
     return np.std(lengths)
 
 ###########################################
 
+def chunk_type_counts(ids, n):
+    "Count the number of types in each complete chunk of n IDs."
+    num_chunks = len(ids) // n
+    if num_chunks == 0:
+        return np.zeros(0, dtype=np.int64)
+    chunked = np.sort(ids[:num_chunks * n].reshape(num_chunks, n), axis=1)
+    return 1 + np.count_nonzero(chunked[:, 1:] != chunked[:, :-1], axis=1)
+
+
+def ngram_ids(corpus, n):
+    """
+    Encode all ngrams in the corpus as integers, or return None if the
+    vocabulary is too large to do this without overflowing int64.
+    """
+    size = max(len(corpus.vocab), 1)
+    if size ** n >= 2 ** 63:
+        return None
+    ids = corpus.flat.astype(np.int64)
+    num_ngrams = max(len(ids) - n + 1, 0)
+    encoded = np.zeros(num_ngrams, dtype=np.int64)
+    for i in range(n):
+        encoded = encoded * size + ids[i:i + num_ngrams]
+    return encoded
+
+
 def type_token_ratio(sentences, n=1000):
     """
     Compute average type-token ratio (normalized over n tokens)
     with a repeated sample of n words.
     """
-    all_words = [word for sentence in sentences for word in sentence]
+    all_words = all_tokens(sentences)
     ttrs = []
     if len(all_words) < n:
         print("Warning: not enough tokens!")
         return None
-    for chunk in chunks(all_words, n):
-        if len(chunk) == n:
-            types = set(chunk)
-            ttr = float(len(types))/n
-            ttrs.append(ttr)
+    if isinstance(sentences, Corpus):
+        ttrs = (chunk_type_counts(all_words, n) / n).tolist()
+    else:
+        for chunk in chunks(all_words, n):
+            if len(chunk) == n:
+                types = set(chunk)
+                ttr = float(len(types))/n
+                ttrs.append(ttr)
     final_ttr = float(sum(ttrs))/len(ttrs)
     return final_ttr
 
@@ -200,13 +426,17 @@ def ngram_ttr(sentences, n=2, window_size=1000):
     Compute average ngram type-token ratio (normalized over window_size ngrams)
     with a repeated sample of n words.
     """
-    all_ngrams = list(ngrams([word for sentence in sentences for word in sentence], n))
-    ttrs = []
-    for chunk in chunks(all_ngrams, window_size):
-        if len(chunk) == window_size:
-            types = set(chunk)
-            ttr = float(len(types))/window_size
-            ttrs.append(ttr)
+    encoded = ngram_ids(sentences, n) if isinstance(sentences, Corpus) else None
+    if encoded is not None:
+        ttrs = (chunk_type_counts(encoded, window_size) / window_size).tolist()
+    else:
+        all_ngrams = list(ngrams([word for sentence in sentences for word in sentence], n))
+        ttrs = []
+        for chunk in chunks(all_ngrams, window_size):
+            if len(chunk) == window_size:
+                types = set(chunk)
+                ttr = float(len(types))/window_size
+                ttrs.append(ttr)
     final_ttr = float(sum(ttrs))/len(ttrs)
     return final_ttr
 
@@ -221,39 +451,144 @@ def trigram_ttr(sentences):
     return ngram_ttr(sentences, n=3)
 
 ###########################################
+# Moving-average type-token ratio (MATTR), using all windows of a fixed size.
+# See: Covington, M. A., & McFall, J. D. (2010). Cutting the Gordian knot: The moving-average type-token ratio (MATTR). Journal of Quantitative Linguistics, 17(2), 94-100.
+
+def stream_ids(corpus, n=1):
+    "Get an array of integers identifying all ngrams (or tokens, for n=1) in the corpus."
+    encoded = corpus.flat if n == 1 else ngram_ids(corpus, n)
+    if encoded is None:
+        all_ngrams = list(ngrams(corpus.flat.tolist(), n))
+        ids = dict()
+        encoded = np.array([ids.setdefault(ngram, len(ids)) for ngram in all_ngrams], dtype=np.int64)
+    return encoded
+
+
+def dense_ngram_ids(sentences, n=1):
+    "Get an array of IDs (0, 1, 2, ...) for all ngrams in the sentences."
+    encoded = stream_ids(as_corpus(sentences), n)
+    return np.unique(encoded, return_inverse=True)[1].ravel()
+
+
+def moving_average_ttr(ids, window=1000):
+    """
+    Compute the average type-token ratio over all windows of `window` consecutive IDs.
+
+    Uses a sliding table with the counts for each ID, so that each step only
+    needs to update the counts for the ID entering and the ID leaving the window.
+    """
+    if len(ids) < window:
+        print("Warning: not enough tokens!")
+        return None
+    ids = ids.tolist()
+    counts = [0] * (max(ids) + 1)
+    types = 0
+    for new in ids[:window]:
+        if counts[new] == 0:
+            types += 1
+        counts[new] += 1
+    total = types
+    for old, new in zip(ids, ids[window:]):
+        counts[old] -= 1
+        if counts[old] == 0:
+            types -= 1
+        if counts[new] == 0:
+            types += 1
+        counts[new] += 1
+        total += types
+    num_windows = len(ids) - window + 1
+    return float(total)/(num_windows * window)
+
+
+def mattr(sentences, window=1000):
+    "Compute the moving-average type-token ratio."
+    return moving_average_ttr(dense_ngram_ids(sentences, n=1), window)
+
+
+def ngram_mattr(sentences, n=2, window=1000):
+    "Compute the moving-average ngram type-token ratio."
+    return moving_average_ttr(dense_ngram_ids(sentences, n), window)
+
+
+def bigram_mattr(sentences):
+    "Compute bigram MATTR"
+    return ngram_mattr(sentences, n=2)
+
+
+def trigram_mattr(sentences):
+    "Compute trigram MATTR"
+    return ngram_mattr(sentences, n=3)
+
+###########################################
+
+def first_occurrence_mask(ids, vocab_size):
+    "Boolean array marking the first occurrence of each ID."
+    positions = np.arange(len(ids))
+    first = np.full(vocab_size, len(ids), dtype=np.int64)
+    np.minimum.at(first, ids, positions)
+    mask = np.zeros(len(ids), dtype=bool)
+    mask[first[first < len(ids)]] = True
+    return mask
+
 
 def type_token_curve(sentences):
     """
     Compute the type-token curve for a given list of sentences.
     
     See: Youmans, G. (1990) Measuring lexical style and competence: the type-token vocabulary curve’. Style 24(Winter): 584-599.
+
+    Returns an array, where curve[i] is the number of types in the first i+1 tokens.
+    Use curve_as_dict to get the curve as a dictionary mapping token counts to type counts.
     """
-    all_words = [word for sentence in sentences for word in sentence]
-    types = set()
-    curve = dict()
-    for i, word in enumerate(all_words,start=1):
-        types.add(word)
-        curve[i] = len(types)
-    return curve
+    corpus = as_corpus(sentences)
+    return np.cumsum(first_occurrence_mask(corpus.flat, len(corpus.vocab)))
+
+
+def curve_as_array(curve):
+    """
+    Compatibility function to convert a curve to an array.
+    Curves in older stats files are dictionaries (with strings as keys, if loaded from JSON).
+    """
+    if isinstance(curve, dict):
+        curve = {int(x): y for x, y in curve.items()}
+        return np.array([curve[x] for x in sorted(curve)], dtype=np.float64)
+    return np.asarray(curve)
+
+
+def curve_as_dict(curve):
+    "Compatibility function to convert a curve to a dictionary, as used by the plotting scripts."
+    if isinstance(curve, dict):
+        return {int(x): y for x, y in curve.items()}
+    return dict(enumerate(np.asarray(curve).tolist(), start=1))
 
 
 def average_curves(curves):
     """
     Helper function to average curves.
+
+    Curves may have different lengths. Each point is averaged over the curves that reach it.
     """
-    avg_curve = defaultdict(list)
-    for d in curves:
-        for x,y in d.items():
-            avg_curve[x].append(y)
-    avg_curve = {x: float(sum(vals))/len(vals) for x,vals in avg_curve.items()}
-    return avg_curve
+    curves = [curve_as_array(curve) for curve in curves]
+    length = max(len(curve) for curve in curves)
+    totals = np.zeros(length, dtype=np.float64)
+    counts = np.zeros(length, dtype=np.int64)
+    for curve in curves:
+        totals[:len(curve)] += curve
+        counts[:len(curve)] += 1
+    return totals / counts
 
 
 def cut_curve(curve, n):
-    "Cut all values above n."
+    """
+    Cut all values above n.
+    Dictionaries are modified in place. The (cut) curve is returned in both cases.
+    """
+    if not isinstance(curve, dict):
+        return curve[:n]
     for i in range(n + 1,               # Cut values above n.
                    max(curve) + 1):     # Including the maximal value.
         del curve[i]
+    return curve
 
 
 def curve_to_coords(curve):
@@ -261,35 +596,102 @@ def curve_to_coords(curve):
     Convert curve to X and Y coordinates.
     Usage: x,y = curve_to_coords(curve)
     """
+    if not isinstance(curve, dict):
+        return np.arange(1, len(curve) + 1), np.asarray(curve)
     return list(zip(*curve.items()))
 
 
-def repeated_random_type_token_curve(sentences, n=10):
+def sentence_keys(indices, seed):
+    """
+    Random sort keys for the sentences at the given positions in the corpus, for the
+    random ordering with this seed (a SeedSequence).
+
+    Each key only depends on the seed and the position (through the SplitMix64
+    mixing function), so the keys for a part of the corpus can be computed without
+    the rest. The mixing function is a bijection, so all keys are different.
+    """
+    offset = seed.generate_state(1, dtype=np.uint64)[0]
+    keys = np.asarray(indices).astype(np.uint64) + offset + np.uint64(0x9E3779B97F4A7C15)
+    keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return keys ^ (keys >> np.uint64(31))
+
+
+def random_order(num_sentences, seed):
+    "Random ordering of the sentences, by their sentence_keys."
+    return np.argsort(sentence_keys(np.arange(num_sentences), seed))
+
+# Corpora shared with the worker processes (see _init_curve_worker).
+_curve_corpora = None
+
+
+def _init_curve_worker(corpora):
+    "Make the corpora available to a worker process."
+    global _curve_corpora
+    _curve_corpora = corpora
+
+
+def _random_curve_task(task):
+    "Compute the curve for one random ordering of one of the corpora."
+    index, seed = task
+    corpus = _curve_corpora[index]
+    order = random_order(len(corpus), seed)
+    return index, type_token_curve(corpus.reorder(order))
+
+
+def summed_random_curves(corpora, n=10, seed=CURVE_SEED, workers=1):
+    """
+    Compute N random type-token curves for each corpus, and return their sums.
+
+    Every (corpus, repeat) pair has its own seed, derived from the master seed.
+    Because the curves are summed as integers, the results do not depend on the
+    number of workers or on the order in which the repeats finish.
+    """
+    corpus_seeds = np.random.SeedSequence(seed).spawn(len(corpora))
+    tasks = [(index, repeat_seed) for index, corpus_seed in enumerate(corpus_seeds)
+                                  for repeat_seed in corpus_seed.spawn(n)]
+    totals = [np.zeros(corpus.num_tokens, dtype=np.int64) for corpus in corpora]
+    if workers <= 1:
+        _init_curve_worker(corpora)
+        for index, curve in map(_random_curve_task, tasks):
+            totals[index] += curve
+    else:
+        with Pool(workers, initializer=_init_curve_worker, initargs=(corpora,)) as pool:
+            for index, curve in pool.imap_unordered(_random_curve_task, tasks):
+                totals[index] += curve
+    return totals
+
+
+def repeated_random_type_token_curve(sentences, n=10, seed=CURVE_SEED, workers=1):
     """
     Perform type token curve analysis N times, randomizing the sentence order.
     
     This makes the curve more reliable than a single TTC evaluation.
+    The repeats can be spread over multiple worker processes.
     """
-    curves = []
-    for i in range(n):
-        shuffled = random.sample(sentences, len(sentences))
-        curve = type_token_curve(shuffled)
-        curves.append(curve)
-    return average_curves(curves)
+    total, = summed_random_curves([as_corpus(sentences)], n, seed, workers)
+    return total / n
 
 
-def curve_for_parallel_sents(parallel_sentences, randomize=True, n=10):
+def curve_for_parallel_sents(parallel_sentences, randomize=True, n=10, seed=CURVE_SEED, workers=1):
     "Average curves for all parallel lists of sentences."
+    slots = [as_corpus(sentences) for sentences in parallel_slices(parallel_sentences)]
     if randomize:
-        curves = [repeated_random_type_token_curve(sentences, n) for sentences in parallel_sentences]
+        curves = [total / n for total in summed_random_curves(slots, n, seed, workers)]
     else:
-        curves = [type_token_curve(sentences) for sentences in parallel_sentences]
+        curves = [type_token_curve(sentences) for sentences in slots]
     return average_curves(curves)
 
 ###########################################
 
 def count_words(sentences):
     "Create a dictionary with counts for all words in the provided sentences."
+    if isinstance(sentences, Corpus):
+        # Order the words by their first occurrence, like the Counter below.
+        ids, first, counts = np.unique(sentences.flat, return_index=True, return_counts=True)
+        order = np.argsort(first)
+        words = sentences.vocab.decode(ids[order].tolist())
+        return Counter(dict(zip(words, counts[order].tolist())))
     return Counter((word for sent in sentences for word in sent))
 
 
@@ -304,7 +706,12 @@ def get_types_tokens(sentences):
 
 def parallel_types_tokens(parallel_sentences):
     "Get type and token counts for parallel sentences."
-    results = [get_types_tokens(sentences) for sentences in parallel_sentences]
+    results = [get_types_tokens(sentences) for sentences in parallel_slices(parallel_sentences)]
+    return combine_types_tokens(results)
+
+
+def combine_types_tokens(results):
+    "Combine the type and token counts for parallel sentences."
     avg_types = sum(result["num_types"] for result in results)/len(results)
     
     all_counts = Counter()
@@ -324,6 +731,96 @@ def parallel_types_tokens(parallel_sentences):
             "total_counts": all_counts,
             "types": all_types}
 
+################################################################################
+# Fused metrics
+#
+# All the metrics in system_stats and parallel_stats can be computed from one
+# array per ngram size, where prev[i] is the position of the previous occurrence
+# of the token (or ngram) at position i:
+#
+# - Token i is the first occurrence of its type in the chunk starting at s if prev[i] < s.
+# - Token i adds a new type to the window starting at s if prev[i] < s <= i < s + window.
+#
+# So we compute these arrays once, and derive all the chunked TTRs, MATTRs, and
+# word counts from them. The results are identical to the separate metrics.
+
+# Key, ngram size, window size.
+CHUNKED_TTRS = [('type_token_ratio', 1, 1000),
+                ('bittr',            2, 1000),
+                ('trittr',           3, 1000),
+                ('ttr10k',           1, 10000),
+                ('ttr100k',          1, 100000)]
+
+MOVING_TTRS  = [('mattr',            1, 1000),
+                ('bimattr',          2, 1000),
+                ('trimattr',         3, 1000),
+                ('mattr10k',         1, 10000),
+                ('mattr100k',        1, 100000)]
+
+# All the scalar metrics produced by fused_stats.
+FUSED_METRICS = (['average_sentence_length', 'std_sentence_length'] +
+                 [key for key, _, _ in CHUNKED_TTRS + MOVING_TTRS])
+
+
+def previous_occurrences(ids):
+    "For each position, get the position of the previous occurrence of the same ID (or -1)."
+    order = np.argsort(ids, kind='stable')
+    same = ids[order[1:]] == ids[order[:-1]]
+    prev = np.full(len(ids), -1, dtype=np.int64)
+    prev[order[1:][same]] = order[:-1][same]
+    return prev
+
+
+def fused_chunked_ttr(prev, window):
+    "Chunked TTR (see type_token_ratio) from the previous occurrences."
+    num_chunks = len(prev) // window
+    if num_chunks == 0:
+        print("Warning: not enough tokens!")
+        return None
+    positions = np.arange(num_chunks * window)
+    new = prev[:num_chunks * window] < positions - positions % window
+    ttrs = (new.reshape(num_chunks, window).sum(axis=1) / window).tolist()
+    return float(sum(ttrs))/len(ttrs)
+
+
+def fused_moving_ttr(prev, window):
+    "Moving-average TTR (see moving_average_ttr) from the previous occurrences."
+    num_windows = len(prev) - window + 1
+    if num_windows <= 0:
+        print("Warning: not enough tokens!")
+        return None
+    positions = np.arange(len(prev))
+    # Range of window starts for which each token adds a new type.
+    first = np.maximum(prev + 1, positions - window + 1)
+    last = np.minimum(positions, num_windows - 1)
+    total = int(np.clip(last - first + 1, 0, None).sum())
+    return float(total)/(num_windows * window)
+
+
+def fused_stats(sentences):
+    "Compute the word counts and all scalar metrics for a list of sentences in one go."
+    corpus = as_corpus(sentences)
+    prevs = {n: previous_occurrences(stream_ids(corpus, n)) for n in (1, 2, 3)}
+    
+    # Word counts, in order of first occurrence.
+    ids = corpus.flat
+    first = ids[prevs[1] < 0]
+    frequencies = np.bincount(ids, minlength=len(corpus.vocab))[first]
+    counts = Counter(dict(zip(corpus.vocab.decode(first.tolist()), frequencies.tolist())))
+    data = {"types": set(counts.keys()),
+            "counts": counts,
+            "num_types": len(counts),
+            "num_tokens": len(ids)}
+    
+    lengths = corpus.lengths
+    data['average_sentence_length'] = float(np.sum(lengths))/len(lengths)
+    data['std_sentence_length']     = np.std(lengths)
+    for key, n, window in CHUNKED_TTRS:
+        data[key] = fused_chunked_ttr(prevs[n], window)
+    for key, n, window in MOVING_TTRS:
+        data[key] = fused_moving_ttr(prevs[n], window)
+    return data
+
 ################################################################################
 # Functions to compute general stats for MS COCO and for individual systems.
 
@@ -335,30 +832,36 @@ def ttr100k(sentences):
     "ttr with 100K tokens."
     return type_token_ratio(sentences, n=100000)
 
+def mattr10k(sentences):
+    "mattr with a window of 10K tokens."
+    return mattr(sentences, window=10000)
+
+def mattr100k(sentences):
+    "mattr with a window of 100K tokens."
+    return mattr(sentences, window=100000)
+
 
-def parallel_stats(parallel_sentences):
-    "Compute all stats for the parallel sentences."
-    data = parallel_types_tokens(parallel_sentences)
-    data['ttr_curve']               = curve_for_parallel_sents(parallel_sentences)
-    data['average_sentence_length'] = average_function(average_sentence_length, parallel_sentences)
-    data['std_sentence_length']     = average_function(std_sentence_length, parallel_sentences)
-    data['type_token_ratio']        = average_function(type_token_ratio, parallel_sentences)
-    data['bittr']                   = average_function(bigram_ttr, parallel_sentences)
-    data['trittr']                  = average_function(trigram_ttr, parallel_sentences)
-    data['ttr10k']                  = average_function(ttr10k, parallel_sentences)
-    data['ttr100k']                 = average_function(ttr100k, parallel_sentences)
+def parallel_stats(parallel_sentences, curve_repeats=10, workers=1):
+    """
+    Compute all stats for the parallel sentences.
+    The type-token curve is averaged over curve_repeats random orderings, using multiple workers.
+    """
+    slots = [as_corpus(sentences) for sentences in parallel_slices(parallel_sentences)]
+    results = [fused_stats(sentences) for sentences in slots]
+    data = combine_types_tokens(results)
+    data['ttr_curve'] = curve_for_parallel_sents(slots, n=curve_repeats, workers=workers)
+    for key in FUSED_METRICS:
+        # Average over the parallel sentences (see average_function).
+        data[key] = float(sum(result[key] for result in results))/len(results)
     return data
 
 
-def system_stats(sentences):
-    "Compute all stats for the different systems."
-    data = get_types_tokens(sentences)
-    data["ttr_curve"]               = repeated_random_type_token_curve(sentences)
-    data['average_sentence_length'] = average_sentence_length(sentences)
-    data['std_sentence_length']     = std_sentence_length(sentences)
-    data['type_token_ratio']        = type_token_ratio(sentences)
-    data['bittr']                   = bigram_ttr(sentences)
-    data['trittr']                  = trigram_ttr(sentences)
-    data['ttr10k']                  = ttr10k(sentences)
-    data['ttr100k']                 = ttr100k(sentences)
+def system_stats(sentences, curve_repeats=10, workers=1):
+    """
+    Compute all stats for the different systems.
+    The type-token curve is averaged over curve_repeats random orderings, using multiple workers.
+    """
+    sentences = as_corpus(sentences)
+    data = fused_stats(sentences)
+    data["ttr_curve"] = repeated_random_type_token_curve(sentences, n=curve_repeats, workers=workers)
     return data
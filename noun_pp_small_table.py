@@ -1,8 +1,5 @@
-import json
 from tabulate import tabulate
-
-with open('Data/Output/nouns_pps.json') as f:
-    data = json.load(f)
+from results_store import open_store
 
 
 system2label  = {'Dai-et-al-2017': 'Dai et al. 2017',
@@ -16,28 +13,25 @@ system2label  = {'Dai-et-al-2017': 'Dai et al. 2017',
                  'Zhou-et-al-2017': 'Zhou et al. 2017'}
 
 def get_system_row(system):
+    data = store.system(system)
     return [system2label[system],
-            '{:.2f}'.format(data[system]['compound_data']['compound_ratio']),
-            len(data[system]['compound_data']['counts_by_length']['2']),
-            '{:.2f}'.format(data[system]['pp_data']['prep_ratio']),
-            len(data[system]['pp_data']['pp_counts_by_length']['1'])]
-
-def get_val_row(data):
-    scores = dict(compound_ratio=[], compound_counts=[], pp_ratio=[], pp_counts=[])
-    for compound_data in data['val']['compound_data']:
-        scores['compound_ratio'].append(compound_data['compound_ratio'])
-        scores['compound_counts'].append(len(compound_data['counts_by_length']['2']))
-    for pp_data in data['val']['pp_data']:
-        scores['pp_ratio'].append(pp_data['prep_ratio'])
-        scores['pp_counts'].append(len(pp_data['pp_counts_by_length']['1']))
-    for key, val in scores.items():
-        scores[key] = sum(val)/len(val)
+            '{:.2f}'.format(data['compound_ratio']),
+            data['compound_types_2'],
+            '{:.2f}'.format(data['prep_ratio']),
+            data['pp_types_1']]
+
+def get_val_row(store):
+    # The results for val are averaged over the parallel descriptions.
+    scores = store.system('val')
     return ['Validation data',
             '{:.2f}'.format(scores['compound_ratio']),
-            round(scores['compound_counts']),
-            '{:.2f}'.format(scores['pp_ratio']),
-            round(scores['pp_counts'])]
+            round(scores['compound_types_2']),
+            '{:.2f}'.format(scores['prep_ratio']),
+            round(scores['pp_types_1'])]
+
 
+noun_pp_keys = ['compound_ratio', 'compound_types_2', 'prep_ratio', 'pp_types_1']
+store = open_store({system: noun_pp_keys for system in list(system2label) + ['val']})
 
 mles  = ['Liu-et-al-2017','Mun-et-al-2017','Shetty-et-al-2016','Tavakoli-et-al-2017',
          'Vinyals-et-al-2017','Wu-et-al-2016','Zhou-et-al-2017']
@@ -45,7 +39,7 @@ gans = ['Dai-et-al-2017', 'Shetty-et-al-2017']
 
 mle_rows = [get_system_row(system) for system in mles]
 gan_rows = [get_system_row(system) for system in gans]
-val_row  = [get_val_row(data)]
+val_row  = [get_val_row(store)]
 
 all_rows = mle_rows + gan_rows + val_row
 
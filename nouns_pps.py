@@ -1,39 +1,72 @@
 from methods import load_json, save_json
+from annotation import MODEL, pps_from_doc, load_model, pipe
+from annotation_cache import AnnotationCache, model_version
+from results_store import ResultsStore
 from collections import defaultdict, Counter
-from tabulate import tabulate
-import spacy
 
 ################################################################################
 # PP stats
 
-nlp = spacy.load('en_core_web_sm', entity=False)
+# The spaCy model is only loaded when captions need to be parsed, and it is the same
+# instance that annotation.py uses (see annotation.load_model).
 
-def pp_stats(entries):
-    "Function to annotate existing coco data"
+def parse_pps(captions):
+    "Parse the captions, and return the (PP, depth) pairs for each caption."
+    nlp = load_model(tag=True, parse=True)
+    return [pps_from_doc(doc) for doc in pipe(nlp, captions, tag=True, batch_size=1000, parse=True)]
+
+
+def pp_stats(entries, cache=None):
+    """
+    Function to annotate existing coco data
+
+    If the entries already contain PPs (annotated with --parse), these are used.
+    Otherwise, the captions are parsed. If an AnnotationCache is provided, only
+    captions that are not in the cache are parsed.
+    """
     print('PPs')
     data = dict()
     data['pp_counter'] = Counter()
     data['level_counter'] = Counter()
     data['pp_counts_by_length'] = defaultdict(Counter)
     data['total_prepositions'] = 0
-    raw_captions = (entry['caption'] for entry in entries)
-    # Let's run this thing in parallel!
-    for doc in nlp.pipe(raw_captions, batch_size=1000, n_threads=4):
-        prepositions = [tok for tok in doc if tok.tag_=='IN']
-        num_prepositions = len(prepositions)
-        data['total_prepositions'] += num_prepositions
-        for head in prepositions:
-            # Get the actual PP.
-            pp = ' '.join([token.orth_.lower() for token in head.subtree])
-            # Count the level PP embedding.
-            levels = len([token for token in head.subtree if token.tag_=='IN'])
+    raw_captions = [entry['caption'] for entry in entries]
+    if all('pps' in entry for entry in entries):
+        all_pps = [entry['pps'] for entry in entries]
+    elif cache is None:
+        all_pps = parse_pps(raw_captions)
+    else:
+        all_pps = cache.cached('pps', raw_captions, model_version(MODEL), parse_pps)
+    for pps in all_pps:
+        data['total_prepositions'] += len(pps)
+        for pp, levels in pps:
             # Count the PP and level.
             data['pp_counter'][pp] += 1
             data['level_counter'][levels] += 1
             data['pp_counts_by_length'][levels][pp] += 1
+    data['num_entries'] = len(entries)
     data['prep_ratio'] = data['total_prepositions']/len(entries)
     return data
 
+
+def combine_pp_stats(results):
+    "Combine the PP stats for consecutive parts of the data (e.g. shards, see sharded_stats.py)."
+    data = dict()
+    data['pp_counter'] = Counter()
+    data['level_counter'] = Counter()
+    data['pp_counts_by_length'] = defaultdict(Counter)
+    data['total_prepositions'] = 0
+    data['num_entries'] = 0
+    for result in results:
+        data['pp_counter'].update(result['pp_counter'])
+        data['level_counter'].update(result['level_counter'])
+        for levels, counts in result['pp_counts_by_length'].items():
+            data['pp_counts_by_length'][levels].update(counts)
+        data['total_prepositions'] += result['total_prepositions']
+        data['num_entries'] += result['num_entries']
+    data['prep_ratio'] = data['total_prepositions']/data['num_entries']
+    return data
+
 ################################################################################
 # Compound stats
 
@@ -54,9 +87,29 @@ def compound_stats(entries):
             data['compound_counts'][compound_string] += 1
             data['counts_by_length'][length][compound_string] += 1
             data['total_compounds'] += 1
+    data['num_entries'] = len(entries)
     data['compound_ratio'] = data['total_compounds']/ len(entries)
     return data
 
+
+def combine_compound_stats(results):
+    "Combine the compound stats for consecutive parts of the data (e.g. shards, see sharded_stats.py)."
+    data = dict()
+    data['compound_lengths'] = Counter()
+    data['compound_counts']  = Counter()
+    data['counts_by_length'] = defaultdict(Counter)
+    data['total_compounds'] = 0
+    data['num_entries'] = 0
+    for result in results:
+        data['compound_lengths'].update(result['compound_lengths'])
+        data['compound_counts'].update(result['compound_counts'])
+        for length, counts in result['counts_by_length'].items():
+            data['counts_by_length'][length].update(counts)
+        data['total_compounds'] += result['total_compounds']
+        data['num_entries'] += result['num_entries']
+    data['compound_ratio'] = data['total_compounds']/ data['num_entries']
+    return data
+
 ################################################################################
 # Helpers
 
@@ -117,6 +170,23 @@ def get_system_row(compound_data, pp_data):
     row = compound_length_counts + compound_ratio + compound_types + pp_levels + prep_ratio + pp_types
     return row
 
+def noun_pp_metrics(compound_data, pp_data):
+    "The numbers in the table, as a dictionary for the results store."
+    metrics = {'compound_ratio': compound_data['compound_ratio'],
+               'compound_types_2': get_compound_types(compound_data, length=2)[0],
+               'prep_ratio': pp_data['prep_ratio'],
+               'pp_types_1': get_num_pp_types(pp_data, level=1)[0]}
+    for length, count in zip(range(2,5), get_compound_lengths(compound_data)):
+        metrics['compound_length_{}'.format(length)] = count
+    for level, count in zip(range(1,6), get_pp_levels(pp_data)):
+        metrics['pp_depth_{}'.format(level)] = count
+    return metrics
+
+def average_metrics(all_metrics):
+    "Average the metrics for the parallel references."
+    return {key: sum(metrics[key] for metrics in all_metrics)/len(all_metrics)
+            for key in all_metrics[0]}
+
 def get_reference_row(all_compound_data, all_pp_data):
     compound_length_counts  = average_rows([get_compound_lengths(data) for data in all_compound_data])
     compound_ratio          = average_rows([get_compound_ratio(data) for data in all_compound_data])
@@ -141,6 +211,8 @@ def get_reference_row(all_compound_data, all_pp_data):
 # Systems..
 
 if __name__ == "__main__":
+    from tabulate import tabulate
+
     systems = ['Dai-et-al-2017',
                'Liu-et-al-2017',
                'Mun-et-al-2017',
@@ -158,11 +230,12 @@ if __name__ == "__main__":
         path = base + name + '/Val/annotated.json'
         return load_json(path)
 
+    cache = AnnotationCache()
     loaded_systems = {system: load_system_data(system) for system in systems}
     for name, entries in loaded_systems.items():
         print(name)
         compound_data = compound_stats(entries)
-        pp_data = pp_stats(entries)
+        pp_data = pp_stats(entries, cache)
         row = [name] + get_system_row(compound_data, pp_data)
         system_rows.append(row)
         all_data[name] = {'pp_data': pp_data, 'compound_data': compound_data}
@@ -174,7 +247,7 @@ if __name__ == "__main__":
     parallel_entries    = parallel_entries(val_tagged)
     print('Val')
     all_compound_data   = list(map(compound_stats, parallel_entries))
-    all_pp_data         = list(map(pp_stats, parallel_entries))
+    all_pp_data         = [pp_stats(entries, cache) for entries in parallel_entries]
 
     val_row             = ['Val'] + get_reference_row(all_compound_data, all_pp_data)
     all_data['val'] = {'pp_data': all_pp_data, 'compound_data': all_compound_data}
@@ -209,3 +282,10 @@ if __name__ == "__main__":
         f.write(table)
 
     save_json(all_data, './Data/Output/nouns_pps.json')
+
+    # Save the numbers in the table to the results store.
+    store = ResultsStore()
+    for name in loaded_systems:
+        store.store(name, noun_pp_metrics(all_data[name]['compound_data'], all_data[name]['pp_data']))
+    store.store('val', average_metrics([noun_pp_metrics(compound_data, pp_data) for compound_data, pp_data
+                                        in zip(all_compound_data, all_pp_data)]))
@@ -0,0 +1,130 @@
+"""
+Hashed index of the MS COCO training data, for computing novelty.
+
+The index stores 64-bit hashes of the normalized training descriptions (see
+methods.normalize_string) and of all training ngrams (n=1..4, lowercased tokens),
+each as a sorted uint64 array in a .npy file. The arrays are memory-mapped, so
+loading the index takes milliseconds instead of parsing the full training JSON.
+
+Hash collisions are possible in principle, but with 64-bit hashes and less than a
+million training descriptions, the probability of even a single collision is
+negligible.
+
+Usage (to build the index):
+
+    python novelty.py [--source ./Data/COCO/Processed/tokenized_train2014.json]
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from corpus import Corpus
+from hashing import hash_string, corpus_ngram_hashes, contains
+from methods import iter_annotations, lower_sent, normalize_string, as_corpus
+
+TRAIN_FILE = './Data/COCO/Processed/tokenized_train2014.json'
+DEFAULT_INDEX = './Data/COCO/Processed/train_index/'
+NGRAM_SIZES = [1, 2, 3, 4]
+
+
+def sentence_hashes(descriptions):
+    "Hash the normalized descriptions."
+    return np.array([hash_string(normalize_string(desc)) for desc in descriptions], dtype=np.uint64)
+
+
+def index_filename(directory, name):
+    return os.path.join(directory, name + '.npy')
+
+
+def build_novelty_index(descriptions, sentences, directory=DEFAULT_INDEX):
+    """
+    Build the index from the raw training descriptions and the tokenized sentences,
+    and save it to the directory.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    corpus = as_corpus(sentences)
+    np.save(index_filename(directory, 'sentences'), np.unique(sentence_hashes(descriptions)))
+    for n in NGRAM_SIZES:
+        np.save(index_filename(directory, '{}grams'.format(n)), np.unique(corpus_ngram_hashes(corpus, n)))
+
+
+def build_index_from_file(filename=TRAIN_FILE, directory=DEFAULT_INDEX):
+    "Build the index from an MS COCO annotation file, streaming the entries from the file."
+    descriptions = []
+    def tokenized():
+        for entry in iter_annotations(filename):
+            descriptions.append(entry['caption'])
+            yield lower_sent(entry['tokenized'])
+    sentences = Corpus.from_sentences(tokenized())
+    build_novelty_index(descriptions, sentences, directory)
+
+
+class NoveltyIndex(object):
+    "Memory-mapped hashes of the training descriptions and ngrams."
+
+    def __init__(self, directory=DEFAULT_INDEX):
+        self.sentences = np.load(index_filename(directory, 'sentences'), mmap_mode='r')
+        self.ngrams = {n: np.load(index_filename(directory, '{}grams'.format(n)), mmap_mode='r')
+                       for n in NGRAM_SIZES}
+
+    def known_descriptions(self, descriptions):
+        "Boolean array indicating which descriptions occur in the training data."
+        return contains(self.sentences, sentence_hashes(descriptions))
+
+    def known_ngrams(self, sentences, n):
+        "Boolean array indicating, for each ngram in the sentences, whether it occurs in the training data."
+        return contains(self.ngrams[n], corpus_ngram_hashes(as_corpus(sentences), n))
+
+    def sentence_stats(self, gen_descriptions):
+        "Same as methods.sentence_stats, using the index instead of the training descriptions."
+        gen_normalized = [normalize_string(desc) for desc in gen_descriptions]
+        gen_unique = set(gen_normalized)
+        unique_list = list(gen_unique)
+        novel_gen = {desc for desc, known in zip(unique_list, self.known_descriptions(unique_list))
+                     if not known}
+
+        num_novel_descriptions = len([d for d in gen_normalized if d in novel_gen])
+        percentage_novel = (num_novel_descriptions/len(gen_descriptions)) * 100
+
+        return {"unique_descriptions": gen_unique,
+                "num_unique_descriptions": len(gen_unique),
+                "novel_descriptions": novel_gen,
+                "num_novel_description_types": len(novel_gen),
+                "total_num_novel_descriptions": num_novel_descriptions,
+                "percentage_novel": percentage_novel}
+
+    def ngram_stats(self, sentences):
+        "Percentage of ngram tokens (n=1..4) in the sentences that never occur in the training data."
+        stats = dict()
+        for n in NGRAM_SIZES:
+            known = self.known_ngrams(sentences, n)
+            novel = len(known) - int(known.sum())
+            stats['percentage_novel_{}grams'.format(n)] = (novel/len(known)) * 100 if len(known) else 0.0
+        return stats
+
+    def novelty_stats(self, gen_descriptions, sentences):
+        "Sentence-level and ngram-level novelty."
+        stats = self.sentence_stats(gen_descriptions)
+        stats.update(self.ngram_stats(sentences))
+        return stats
+
+
+def load_novelty_index(directory=DEFAULT_INDEX, source=TRAIN_FILE):
+    "Load the index, building it from the training data first if necessary."
+    if not os.path.exists(index_filename(directory, 'sentences')):
+        print('Building the novelty index in', directory)
+        build_index_from_file(source, directory)
+    return NoveltyIndex(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the hashed index of the training data.')
+    parser.add_argument('--source', default=TRAIN_FILE,
+                        help="MS COCO annotation file with the training data.")
+    parser.add_argument('--index', default=DEFAULT_INDEX,
+                        help="Directory to store the index in.")
+    args = parser.parse_args()
+    build_index_from_file(args.source, args.index)
@@ -0,0 +1,316 @@
+"""
+Incremental pipeline runner for the full analysis.
+
+Each stage runs one script, and declares its inputs and outputs. A stage depends on
+the stages that produce its inputs. When the pipeline runs, a stage is skipped if:
+
+* all of its outputs exist, and
+* the content of its inputs, the code of the script (and all local modules that it
+  imports), and the command are the same as the last time it ran.
+
+Stages that do not depend on each other (such as global and local recall) are run
+in parallel. The state of the pipeline is stored in Data/Cache/pipeline.json.
+
+Usage:
+
+    python pipeline.py [STAGE ...] [--jobs 4] [--force] [--dry-run] [--skip STAGE ...]
+
+With stage names, only those stages (and the stages they depend on) are considered.
+"""
+
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from fnmatch import fnmatch
+
+STATE_FILE = './Data/Cache/pipeline.json'
+
+SYSTEMS = ['Dai-et-al-2017',
+           'Liu-et-al-2017',
+           'Mun-et-al-2017',
+           'Shetty-et-al-2016',
+           'Shetty-et-al-2017',
+           'Tavakoli-et-al-2017',
+           'Vinyals-et-al-2017',
+           'Wu-et-al-2016',
+           'Zhou-et-al-2017']
+
+SYSTEM_BASE = './Data/Systems/{}/Val/'
+PROCESSED = './Data/COCO/Processed/'
+OUTPUT = './Data/Output/'
+
+################################################################################
+# Stages
+
+class Stage(object):
+    "A script, with the files that it reads and writes."
+
+    def __init__(self, name, command, inputs, outputs):
+        self.name = name
+        self.command = command
+        self.inputs = inputs        # File names or glob patterns.
+        self.outputs = outputs      # File names.
+
+    @property
+    def script(self):
+        return self.command[0]
+
+
+def system_files(filename):
+    "The file with this name for each system."
+    return [SYSTEM_BASE.format(system) + filename for system in SYSTEMS]
+
+
+def system_outputs():
+    "The original output files of the systems. (The same files as in annotate_generated.py.)"
+    return [path for system in SYSTEMS for path in glob.glob(SYSTEM_BASE.format(system) + '*.json')
+            if not os.path.basename(path).startswith('stats.') and not path.endswith('annotated.json')]
+
+
+# The stats files consist of the summary plus the files next to it (see stats_files.py).
+TRAIN_STATS = [PROCESSED + 'train_stats.json', PROCESSED + 'train_stats.*']
+VAL_STATS = [PROCESSED + 'val_stats.json', PROCESSED + 'val_stats.*']
+SYSTEM_STATS = system_files('stats.json') + system_files('stats.*')
+
+# All scalar results are also written to the results store (see results_store.py). It is an
+# output of every stage that writes to it, so the stages that read it depend on all of them.
+RESULTS = OUTPUT + 'results.sqlite'
+
+STAGES = [
+    Stage('annotate_coco', ['annotate_coco.py', '--parse'],
+          inputs=['./Data/COCO/Raw/captions_train2014.json', './Data/COCO/Raw/captions_val2014.json'],
+          outputs=[PROCESSED + 'tokenized_train2014.json', PROCESSED + 'tagged_val2014.json']),
+    Stage('annotate_generated', ['annotate_generated.py', '--parse'],
+          inputs=system_outputs(),
+          outputs=system_files('annotated.json')),
+    Stage('novelty_index', ['novelty.py'],
+          inputs=[PROCESSED + 'tokenized_train2014.json'],
+          outputs=[PROCESSED + 'train_index/sentences.npy']),
+    Stage('coco_stats', ['coco_stats.py'],
+          inputs=[PROCESSED + 'tokenized_train2014.json', PROCESSED + 'tagged_val2014.json',
+                  PROCESSED + 'train_index/sentences.npy'],
+          outputs=[PROCESSED + 'train_stats.json', PROCESSED + 'val_stats.json', RESULTS]),
+    Stage('system_stats', ['system_stats.py'],
+          inputs=system_files('annotated.json') + [PROCESSED + 'train_index/sentences.npy'],
+          outputs=system_files('stats.json') + [RESULTS]),
+    Stage('ttr_curve', ['plot_ttr_curve.py'],
+          inputs=VAL_STATS + SYSTEM_STATS,
+          outputs=[OUTPUT + 'ttr_curve.pdf', OUTPUT + 'ttr_curve_nolegend.pdf']),
+    Stage('global_recall', ['global_recall.py'],
+          inputs=TRAIN_STATS + VAL_STATS + SYSTEM_STATS,
+          outputs=[OUTPUT + 'global_recall.json', OUTPUT + 'percentiles.pdf',
+                   OUTPUT + 'global_recall_table.txt', RESULTS]),
+    Stage('local_recall', ['local_recall.py'],
+          inputs=[PROCESSED + 'tagged_val2014.json'] + system_files('annotated.json'),
+          outputs=[OUTPUT + 'local_recall.json', OUTPUT + 'local_recall.pdf', RESULTS]),
+    Stage('main_table', ['generate_main_table.py'],
+          inputs=TRAIN_STATS + VAL_STATS + SYSTEM_STATS + ['./Data/Systems/bleu_meteor.json',
+                  OUTPUT + 'global_recall.json', OUTPUT + 'local_recall.json', RESULTS],
+          outputs=[OUTPUT + 'main_table.txt']),
+    Stage('ranking_table', ['generate_ranking_table.py'],
+          inputs=TRAIN_STATS + VAL_STATS + SYSTEM_STATS + [OUTPUT + 'local_recall.json'],
+          outputs=[OUTPUT + 'ranking_table.txt']),
+    Stage('nouns_pps', ['nouns_pps.py'],
+          inputs=[PROCESSED + 'tagged_val2014.json'] + system_files('annotated.json'),
+          outputs=[OUTPUT + 'nouns_pps.json', OUTPUT + 'nouns_pps_table.txt', RESULTS]),
+    Stage('compound_plot', ['plot_compound_length.py'],
+          inputs=[OUTPUT + 'nouns_pps.json', RESULTS],
+          outputs=[OUTPUT + 'compound_lengths.pdf']),
+    Stage('pp_plot', ['plot_pp_length.py'],
+          inputs=[OUTPUT + 'nouns_pps.json', RESULTS],
+          outputs=[OUTPUT + 'pp_depths.pdf']),
+]
+
+################################################################################
+# Dependencies
+
+def normalize(path):
+    return os.path.normpath(path)
+
+
+def dependencies(stage, stages):
+    "Names of the stages that produce the inputs of this stage."
+    return {other.name for other in stages if other is not stage
+            and any(fnmatch(normalize(output), normalize(pattern))
+                    for output in other.outputs for pattern in stage.inputs)}
+
+
+def required_stages(targets, stages):
+    "The target stages, and all stages that they depend on."
+    by_name = {stage.name: stage for stage in stages}
+    required = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in required:
+            required.add(name)
+            todo.extend(dependencies(by_name[name], stages))
+    return [stage for stage in stages if stage.name in required]
+
+
+def local_modules(script, directory='.'):
+    "The script, and all modules in the directory that it imports (recursively)."
+    found = []
+    todo = [script]
+    while todo:
+        filename = todo.pop()
+        if filename in found:
+            continue
+        found.append(filename)
+        with open(os.path.join(directory, filename)) as f:
+            tree = ast.parse(f.read(), filename)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = name.split('.')[0] + '.py'
+                if os.path.exists(os.path.join(directory, module)):
+                    todo.append(module)
+    return sorted(found)
+
+################################################################################
+# Content hashes
+
+class FileHashes(object):
+    "Content hashes of files, which are only recomputed when a file's size or mtime changes."
+
+    def __init__(self, known=None):
+        self.known = known or dict()
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        known = self.known.get(path)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            return known['hash']
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        self.known[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': sha.hexdigest()}
+        return sha.hexdigest()
+
+
+def expand(patterns):
+    "All existing files matching the patterns (in a fixed order)."
+    return sorted({normalize(path) for pattern in patterns for path in glob.glob(pattern)})
+
+
+def stage_hash(stage, hashes):
+    "Hash of the command, the code and the inputs of a stage."
+    sha = hashlib.sha1(json.dumps(stage.command).encode('utf-8'))
+    for path in local_modules(stage.script) + expand(stage.inputs):
+        sha.update('{}\t{}\n'.format(path, hashes.file_hash(path)).encode('utf-8'))
+    return sha.hexdigest()
+
+################################################################################
+# Running the pipeline
+
+def load_state(filename=STATE_FILE):
+    if os.path.exists(filename):
+        with open(filename) as f:
+            return json.load(f)
+    return {'stages': dict(), 'files': dict()}
+
+
+def save_state(state, filename=STATE_FILE):
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(filename, 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def is_up_to_date(stage, state, hashes):
+    "Check whether the stage has run before with the same code and inputs."
+    return (all(os.path.exists(output) for output in stage.outputs)
+            and state['stages'].get(stage.name) == stage_hash(stage, hashes))
+
+
+def run_stage(stage):
+    "Run the script for a stage, and return its exit code."
+    print('Running:', ' '.join(stage.command))
+    return subprocess.call([sys.executable] + stage.command)
+
+
+def run_pipeline(stages, jobs=1, force=False, dry_run=False, skip=()):
+    """
+    Run all stages that are not up to date, in dependency order.
+
+    Stages in skip are never run, and their outputs are used as they are.
+    Returns False if a stage failed.
+    """
+    state = load_state()
+    hashes = FileHashes(state['files'])
+    waiting = {stage.name: dependencies(stage, stages) for stage in stages}
+    by_name = {stage.name: stage for stage in stages}
+    running = dict()
+    failed = set()
+    would_run = set()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while waiting or running:
+            # Start all stages whose dependencies are done.
+            busy = set(waiting) | {stage.name for stage in running.values()}
+            for name in [name for name, deps in waiting.items() if not deps & busy]:
+                del waiting[name]
+                stage = by_name[name]
+                if name in skip:
+                    print('Skipping:', name)
+                elif failed & dependencies(stage, stages):
+                    print('Not running:', name, '(a dependency failed)')
+                    failed.add(name)
+                elif not force and not would_run & dependencies(stage, stages) \
+                        and is_up_to_date(stage, state, hashes):
+                    print('Up to date:', name)
+                elif dry_run:
+                    print('Would run:', name)
+                    would_run.add(name)
+                else:
+                    running[executor.submit(run_stage, stage)] = stage
+            if not running:
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                if future.result() == 0:
+                    state['stages'][stage.name] = stage_hash(stage, hashes)
+                    state['files'] = hashes.known
+                    save_state(state)
+                else:
+                    print('Failed:', stage.name)
+                    failed.add(stage.name)
+    return not failed
+
+
+if __name__ == '__main__':
+    names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser(description='Run all stages of the analysis that are not up to date.')
+    parser.add_argument('stages', nargs='*', metavar='STAGE',
+                        help="Only run these stages and their dependencies. Options: " + ', '.join(names))
+    parser.add_argument('--jobs', type=int, default=4,
+                        help="Maximum number of stages to run in parallel.")
+    parser.add_argument('--force', action='store_true',
+                        help="Run all stages, even if they are up to date.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only show which stages would run.")
+    parser.add_argument('--skip', nargs='+', default=[], metavar='STAGE',
+                        help="Never run these stages (e.g. annotate_coco), and use their outputs as they are.")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.stages + args.skip if name not in names]
+    if unknown:
+        parser.error('Unknown stages: ' + ', '.join(unknown))
+    stages = required_stages(args.stages, STAGES) if args.stages else STAGES
+    success = run_pipeline(stages, jobs=args.jobs, force=args.force, dry_run=args.dry_run, skip=args.skip)
+    print('Done.' if success else 'Some stages failed.')
+    sys.exit(0 if success else 1)
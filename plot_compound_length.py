@@ -1,4 +1,4 @@
-import json
+from results_store import open_store
 
 from matplotlib import pyplot as plt
 from matplotlib.lines import Line2D
@@ -21,18 +21,11 @@ system2label  = {'Dai-et-al-2017': 'Dai et al. 2017',
                  'Zhou-et-al-2017': 'Zhou et al. 2017'}
 
 
-with open('Data/Output/nouns_pps.json') as f:
-    data = json.load(f)
+store = open_store({system: ['compound_length_{}'.format(i) for i in [2,3,4]] for system in list(system2label) + ['val']})
 
-def get_val(data):
-    val = {2:[], 3:[], 4:[]}
-    for compound_data in data['val']['compound_data']:
-        val[2].append(compound_data['compound_lengths']['2'])
-        val[3].append(compound_data['compound_lengths']['3'])
-        val[4].append(compound_data['compound_lengths']['4'])
-    for i, results in val.items():
-        val[i] = round(sum(results)/len(results))
-    return val
+def get_val(store):
+    # The results for val are averaged over the parallel descriptions.
+    return {i: round(store.get('val', 'compound_length_{}'.format(i))) for i in [2,3,4]}
 
 # ['compound_lengths']['2']
 
@@ -43,10 +36,10 @@ to_plot = dict(system=[],
 for system, label in system2label.items():
     to_plot['system'].extend([label] * 3)
     to_plot['length'].extend([2,3,4])
-    to_plot['number'].extend([data[system]['compound_data']['compound_lengths'].get(i,0)
-                              for i in ['2','3','4']])
+    to_plot['number'].extend([store.get(system, 'compound_length_{}'.format(i))
+                              for i in [2,3,4]])
 
-val = get_val(data)
+val = get_val(store)
 to_plot['system'].extend(['zzzval'] * 3)
 to_plot['length'].extend([2,3,4])
 to_plot['number'].extend([val[i] for i in [2,3,4]])
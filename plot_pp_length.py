@@ -1,4 +1,4 @@
-import json
+from results_store import open_store
 
 from matplotlib import pyplot as plt
 from matplotlib.lines import Line2D
@@ -25,20 +25,11 @@ system2label  = {'Dai-et-al-2017': 'Dai et al. 2017',
                  'Zhou-et-al-2017': 'Zhou et al. 2017'}
 
 
-with open('Data/Output/nouns_pps.json') as f:
-    data = json.load(f)
+store = open_store({system: ['pp_depth_{}'.format(i) for i in [1,2,3,4,5]] for system in list(system2label) + ['val']})
 
-def get_val(data):
-    val = {1:[], 2:[], 3:[], 4:[], 5:[]}
-    for pp_data in data['val']['pp_data']:
-        val[1].append(pp_data['level_counter']['1'])
-        val[2].append(pp_data['level_counter']['2'])
-        val[3].append(pp_data['level_counter']['3'])
-        val[4].append(pp_data['level_counter']['4'])
-        val[5].append(pp_data['level_counter']['5'])
-    for i, results in val.items():
-        val[i] = round(sum(results)/len(results))
-    return val
+def get_val(store):
+    # The results for val are averaged over the parallel descriptions.
+    return {i: round(store.get('val', 'pp_depth_{}'.format(i))) for i in [1,2,3,4,5]}
 
 to_plot = dict(system=[],
                length=[],
@@ -47,10 +38,10 @@ to_plot = dict(system=[],
 for system, label in system2label.items():
     to_plot['system'].extend([label] * 5)
     to_plot['length'].extend([1,2,3,4,5])
-    to_plot['number'].extend([data[system]['pp_data']['level_counter'].get(i,0)
-                              for i in ['1','2','3','4','5']])
+    to_plot['number'].extend([store.get(system, 'pp_depth_{}'.format(i))
+                              for i in [1,2,3,4,5]])
 
-val = get_val(data)
+val = get_val(store)
 to_plot['system'].extend(['zzzval'] * 5)
 to_plot['length'].extend([1,2,3,4,5])
 to_plot['number'].extend([val[i] for i in [1,2,3,4,5]])
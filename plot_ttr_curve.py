@@ -4,11 +4,12 @@ sns.set_style("whitegrid")
 sns.set_context('paper', font_scale=7)
 sns.set_palette(sns.color_palette("cubehelix", 10))
 
-from methods import load_json, cut_curve, curve_to_coords
+from methods import cut_curve, curve_to_coords, curve_as_dict
+from stats_files import load_stats
 
 def get_curve(stats, n=50000):
     "Prepare curve for plotting"
-    curve = {int(key): val for key,val in stats['ttr_curve'].items()}
+    curve = curve_as_dict(stats['ttr_curve'])
     cut_curve(curve, n)
     return curve
 
@@ -17,7 +18,7 @@ def load_system_stats(name):
     "Load system stats based on the system name."
     base = './Data/Systems/'
     path = base + name + '/Val/stats.json'
-    return load_json(path)
+    return load_stats(path)
 
 
 def load_curve(name):
@@ -60,7 +61,7 @@ systems = ['Dai-et-al-2017',
 
 system_curves = {name: load_curve(name) for name in systems}
 
-val_stats = load_json('./Data/COCO/Processed/val_stats.json')
+val_stats = load_stats('./Data/COCO/Processed/val_stats.json')
 val_curve = get_curve(val_stats)
 plot(val_curve, system_curves, val_label='Val')
 plot(val_curve, system_curves, val_label='Val', legend=False, filename='./Data/Output/ttr_curve_nolegend.pdf')
@@ -4,11 +4,12 @@ sns.set_style("white")
 sns.set_context('paper', font_scale=7)
 sns.set_palette(sns.color_palette("cubehelix", 4))
 
-from methods import load_json, cut_curve, curve_to_coords, average_curves
+from methods import cut_curve, curve_to_coords, curve_as_dict, average_curves
+from stats_files import load_stats
 
 def get_curve(stats, n=50000):
     "Prepare curve for plotting"
-    curve = {int(key): val for key,val in stats['ttr_curve'].items()}
+    curve = curve_as_dict(stats['ttr_curve'])
     cut_curve(curve, n)
     return curve
 
@@ -17,7 +18,7 @@ def load_system_stats(name):
     "Load system stats based on the system name."
     base = './Data/Systems/'
     path = base + name + '/Val/stats.json'
-    return load_json(path)
+    return load_stats(path)
 
 
 def load_curve(name):
@@ -65,12 +66,12 @@ MLE_systems = {'Liu et al. 2017': load_curve('Liu-et-al-2017'),
 to_plot = dict()
 to_plot['Dai et al. 2017']          = load_curve('Dai-et-al-2017')
 to_plot['Shetty et al. 2017']       = load_curve('Shetty-et-al-2017')
-to_plot['Average of other systems'] = average_curves(MLE_systems.values())
+to_plot['Average of other systems'] = curve_as_dict(average_curves(MLE_systems.values()))
 
 best_worst = {'best': MLE_systems['Zhou et al. 2017'],
               'worst': MLE_systems['Liu et al. 2017']}
 
-val_stats = load_json('./Data/COCO/Processed/val_stats.json')
+val_stats = load_stats('./Data/COCO/Processed/val_stats.json')
 val_curve = get_curve(val_stats)
 
 plot(val_curve, to_plot, best_worst, val_label='Validation data')
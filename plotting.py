@@ -0,0 +1,32 @@
+"""
+Plot style for the figures made by global_recall.py and local_recall.py.
+
+matplotlib and seaborn are only imported when a figure is made, so that the metrics
+in these modules can be used (e.g. by analyze_my_system.py) without loading them.
+"""
+
+
+def setup_plots(style='white'):
+    "Import pyplot and seaborn, set the style used for the figures in the paper, and return them."
+    from matplotlib import pyplot as plt
+    import seaborn as sns
+    sns.set_style(style)
+    sns.set_context('paper', font_scale=7)
+    sns.set_palette(palette())
+    return plt, sns
+
+
+def palette():
+    "The colors used for the systems."
+    import seaborn as sns
+    return sns.color_palette("cubehelix", 10)
+
+
+def legend_markers(colors):
+    "Legend handles with a single large dot in each of the colors."
+    from matplotlib.lines import Line2D
+    return [Line2D(range(1), range(1),
+                   linewidth=0,   # Invisible line
+                   marker='o',
+                   markersize=40,
+                   markerfacecolor=color) for color in colors]
@@ -0,0 +1,198 @@
+"""
+Results store for all systems and reference corpora.
+
+All scalar results are stored in one SQLite database, as (system, metric, value)
+rows, indexed by system and by metric. system_stats.py, coco_stats.py,
+global_recall.py, local_recall.py and nouns_pps.py write their results into the
+store, so that the table and plotting scripts do not have to parse all JSON files.
+
+Lists of numbers are stored as separate metrics, numbered from 1. For example, the
+local recall scores are stored as local_recall_1 to local_recall_5.
+The reference corpora are stored as the systems 'train' and 'val'.
+
+The table and plotting scripts open the store with open_store. If the store is empty
+(e.g. in a checkout where the results were computed before the store existed), it is
+first filled from the stats files and the JSON files in Data/Output. If results are
+still missing, the script stops with the names of the scripts that need to run first.
+"""
+
+import os
+import sqlite3
+from collections import Counter, defaultdict
+
+import numpy as np
+
+DEFAULT_STORE = './Data/Output/results.sqlite'
+
+# Seconds to wait for other processes that are writing to the store (e.g. the stages
+# that the pipeline runs in parallel) before giving up.
+BUSY_TIMEOUT = 300
+
+
+def is_number(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+def flatten(results):
+    "Yield (metric, value) pairs for all numbers and lists of numbers in the results."
+    for metric, value in results.items():
+        if is_number(value):
+            yield metric, value.item() if isinstance(value, np.generic) else value
+        elif isinstance(value, (list, tuple)) and value and all(is_number(item) for item in value):
+            for i, item in enumerate(value, start=1):
+                yield '{}_{}'.format(metric, i), item
+
+
+class ResultsStore(object):
+    "SQLite database with a value for each system and metric."
+
+    def __init__(self, filename=DEFAULT_STORE):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(filename, timeout=BUSY_TIMEOUT)
+        # The value column has no type, so that integers and floats are stored as-is.
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                '(system TEXT, metric TEXT, value, PRIMARY KEY (system, metric))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS metric_index ON results (metric, system)')
+        self.connection.commit()
+
+    def store(self, system, results):
+        "Store all numbers (and lists of numbers) in a dictionary of results for a system."
+        rows = [(system, metric, value) for metric, value in flatten(results)]
+        self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', rows)
+        self.connection.commit()
+
+    def get(self, system, metric):
+        "Get a single value (or None)."
+        row = self.connection.execute('SELECT value FROM results WHERE system = ? AND metric = ?',
+                                      (system, metric)).fetchone()
+        return None if row is None else row[0]
+
+    def metric(self, metric):
+        "Dictionary with the value of a metric for each system."
+        query = 'SELECT system, value FROM results WHERE metric = ?'
+        return dict(self.connection.execute(query, (metric,)))
+
+    def system(self, system, metrics=None):
+        "Dictionary with all results for a system (or only the given metrics)."
+        query = 'SELECT metric, value FROM results WHERE system = ?'
+        results = dict(self.connection.execute(query, (system,)))
+        if metrics is None:
+            return results
+        return {metric: results[metric] for metric in metrics}
+
+    def series(self, system, metric):
+        "List of values for a metric that was stored as a list."
+        results = self.system(system)
+        values = []
+        while '{}_{}'.format(metric, len(values) + 1) in results:
+            values.append(results['{}_{}'.format(metric, len(values) + 1)])
+        return values
+
+    def is_empty(self):
+        "Check whether the store has no results at all."
+        return self.connection.execute('SELECT 1 FROM results LIMIT 1').fetchone() is None
+
+    def missing(self, required):
+        "List of (system, metric) pairs without a value, given a dictionary mapping systems to metrics."
+        return [(system, metric) for system, metrics in required.items() for metric in metrics
+                if self.get(system, metric) is None]
+
+    def table(self, systems, metrics):
+        "List of rows, with the values for each of the metrics, for each system."
+        return [[self.get(system, metric) for metric in metrics] for system in systems]
+
+    def close(self):
+        "Close the connection to the database."
+        self.connection.close()
+
+################################################################################
+# Filling the store from the files written by the analysis scripts.
+
+OUTPUT = './Data/Output/'
+SYSTEM_STATS = './Data/Systems/{}/Val/stats.json'
+REFERENCE_STATS = './Data/COCO/Processed/{}_stats.json'
+
+# The script that computes each metric (by prefix). All other metrics are computed by
+# coco_stats.py (for train and val) and system_stats.py (for the systems).
+METRIC_SCRIPTS = [('global_recall', 'global_recall.py'),
+                  ('local_recall', 'local_recall.py'),
+                  ('compound_', 'nouns_pps.py'),
+                  ('pp_', 'nouns_pps.py'),
+                  ('prep_ratio', 'nouns_pps.py')]
+
+
+def script_for(system, metric):
+    "The script that stores the metric for the system."
+    for prefix, script in METRIC_SCRIPTS:
+        if metric.startswith(prefix):
+            return script
+    return 'coco_stats.py' if system in ('train', 'val') else 'system_stats.py'
+
+
+def int_keys(counter, factory=Counter):
+    "Turn the keys of a counter loaded from JSON back into integers."
+    result = factory()
+    result.update({int(key): value for key, value in counter.items()})
+    return result
+
+
+def noun_pp_data_from_json(compound_data, pp_data):
+    "The compound and PP stats, as loaded from nouns_pps.json, with integer lengths and depths."
+    compound_data = dict(compound_data,
+                         compound_lengths=int_keys(compound_data['compound_lengths']),
+                         counts_by_length=int_keys(compound_data['counts_by_length'],
+                                                   lambda: defaultdict(dict)))
+    pp_data = dict(pp_data,
+                   level_counter=int_keys(pp_data['level_counter']),
+                   pp_counts_by_length=int_keys(pp_data['pp_counts_by_length'],
+                                                lambda: defaultdict(dict)))
+    return compound_data, pp_data
+
+
+def fill_from_files(store, systems):
+    "Store the results from all existing stats files and JSON files with results."
+    from methods import load_json
+    from stats_files import load_stats
+    from nouns_pps import noun_pp_metrics, average_metrics
+
+    stats_files = [(name, REFERENCE_STATS.format(name)) for name in ('train', 'val')]
+    stats_files += [(system, SYSTEM_STATS.format(system)) for system in systems]
+    for name, filename in stats_files:
+        if os.path.exists(filename):
+            store.store(name, load_stats(filename))
+    if os.path.exists(OUTPUT + 'global_recall.json'):
+        for system, entry in load_json(OUTPUT + 'global_recall.json').items():
+            store.store(system, {'global_recall': entry['score'],
+                                 'global_recall_percentile': entry['percentiles']['val_scores']})
+    if os.path.exists(OUTPUT + 'local_recall.json'):
+        for system, entry in load_json(OUTPUT + 'local_recall.json').items():
+            store.store(system, {'local_recall': entry['scores']})
+    if os.path.exists(OUTPUT + 'nouns_pps.json'):
+        for name, data in load_json(OUTPUT + 'nouns_pps.json').items():
+            if name == 'val':
+                # Averaged over the parallel descriptions (see nouns_pps.py).
+                store.store(name, average_metrics([noun_pp_metrics(*noun_pp_data_from_json(*pair))
+                                                   for pair in zip(data['compound_data'], data['pp_data'])]))
+            else:
+                store.store(name, noun_pp_metrics(*noun_pp_data_from_json(data['compound_data'], data['pp_data'])))
+
+
+def open_store(required, filename=DEFAULT_STORE):
+    """
+    Open the store for a script that needs results, given as a dictionary mapping systems
+    to the metrics that it needs. An empty store is filled from the existing files first.
+    Stops the script if results are missing.
+    """
+    store = ResultsStore(filename)
+    if store.is_empty():
+        print('The results store is empty. Loading the results from the existing files.')
+        fill_from_files(store, [system for system in required if system not in ('train', 'val')])
+    missing = store.missing(required)
+    if missing:
+        scripts = sorted({script_for(system, metric) for system, metric in missing})
+        examples = ', '.join('{} for {}'.format(metric, system) for system, metric in missing[:3])
+        raise SystemExit('Missing results in {} ({}{}). Run {} first.'.format(
+            filename, examples, ', ...' if len(missing) > 3 else '', ', '.join(scripts)))
+    return store
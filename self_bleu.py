@@ -0,0 +1,217 @@
+"""
+Self-BLEU and pairwise ngram overlap: diversity between the descriptions, rather than
+in the vocabulary.
+
+Self-BLEU scores each description (the hypothesis) with BLEU, using all other
+descriptions as references. Lower is more diverse. Computing this naively compares
+every pair of descriptions, but BLEU only needs, for each ngram in the hypothesis, the
+maximum count of that ngram in any of the references. So we build an inverted index:
+for each ngram (hashed, see hashing.py), the descriptions that contain it, with the
+counts. The maximum over all other descriptions is the highest count in the index,
+unless the hypothesis itself has the highest count, in which case it is the second
+highest count. Everything is computed with a few sorts over all ngrams, so the time is
+roughly linear in the size of the corpus.
+
+We report:
+
+* self_bleu:        corpus-level BLEU (as nltk.translate.bleu_score.corpus_bleu).
+* mean_self_bleu:   the average sentence-level BLEU (as sentence_bleu, with smoothing
+                    method 1), which is the usual definition of Self-BLEU.
+* pairwise_overlap_{n}grams: for a random pair of different descriptions, the average
+                    fraction of ngram types in the first that also occur in the second.
+
+With a sample size, only a random sample of the descriptions is scored, against all
+other descriptions. The ngram sizes are processed in parallel.
+
+Usage:
+
+    python self_bleu.py [FILE ...] [--max-n 4] [--sample 5000] [--workers 4]
+
+Without files, the scores are computed for all systems, and stored in the results store.
+"""
+
+import argparse
+from math import exp, log
+from multiprocessing import Pool
+
+import numpy as np
+
+from hashing import corpus_ngram_hashes
+from methods import as_corpus, sentences_from_file, save_json
+
+SELF_BLEU_SEED = 1234
+
+SYSTEMS = ['Dai-et-al-2017',
+           'Liu-et-al-2017',
+           'Mun-et-al-2017',
+           'Shetty-et-al-2016',
+           'Shetty-et-al-2017',
+           'Tavakoli-et-al-2017',
+           'Vinyals-et-al-2017',
+           'Wu-et-al-2016',
+           'Zhou-et-al-2017']
+SMOOTHING_EPSILON = 0.1   # As nltk's SmoothingFunction().method1.
+
+################################################################################
+# Inverted ngram index
+
+def ngram_overlap(corpus, n):
+    """
+    For each description: the number of ngrams (of size n), the clipped number of ngrams
+    that also occur in the other descriptions (as in BLEU), and the summed overlap with
+    all other descriptions (the number of other descriptions that contain each of its
+    ngram types, divided by the number of ngram types).
+    """
+    hashes = corpus_ngram_hashes(corpus, n)
+    totals = np.maximum(corpus.lengths - n + 1, 0)
+    sentences = np.repeat(np.arange(len(corpus)), totals)
+
+    # Inverted index: (ngram, description, count), sorted by ngram and then by decreasing count.
+    order = np.lexsort((sentences, hashes))
+    hashes, sentences = hashes[order], sentences[order]
+    new_pair = np.ones(len(hashes), dtype=bool)
+    new_pair[1:] = (hashes[1:] != hashes[:-1]) | (sentences[1:] != sentences[:-1])
+    pair_starts = np.flatnonzero(new_pair)
+    counts = np.diff(np.append(pair_starts, len(hashes)))
+    hashes, sentences = hashes[pair_starts], sentences[pair_starts]
+    order = np.lexsort((-counts, hashes))
+    hashes, sentences, counts = hashes[order], sentences[order], counts[order]
+
+    # The two highest counts for each ngram, and the number of descriptions that contain it.
+    new_ngram = np.ones(len(hashes), dtype=bool)
+    new_ngram[1:] = hashes[1:] != hashes[:-1]
+    ngram_starts = np.flatnonzero(new_ngram)
+    frequencies = np.diff(np.append(ngram_starts, len(hashes)))
+    first = counts[ngram_starts]
+    second = np.where(frequencies > 1, counts[np.minimum(ngram_starts + 1, len(counts) - 1)], 0)
+    ngrams = np.repeat(np.arange(len(ngram_starts)), frequencies)
+    others = np.where(counts == first[ngrams], second[ngrams], first[ngrams])
+
+    size = len(corpus)
+    clipped = np.bincount(sentences, weights=np.minimum(counts, others), minlength=size).astype(np.int64)
+    types = np.bincount(sentences, minlength=size)
+    shared = np.bincount(sentences, weights=frequencies[ngrams] - 1, minlength=size)
+    overlap = np.divide(shared, types, out=np.zeros(size), where=types > 0)
+    return totals, clipped, overlap
+
+# Corpus shared with the worker processes (see _init_overlap_worker).
+_overlap_corpus = None
+
+
+def _init_overlap_worker(corpus):
+    "Make the corpus available to a worker process."
+    global _overlap_corpus
+    _overlap_corpus = corpus
+
+
+def _ngram_overlap_task(n):
+    return ngram_overlap(_overlap_corpus, n)
+
+################################################################################
+# Scores
+
+def closest_reference_lengths(lengths):
+    """
+    For each description, the length of the other description that is closest in length
+    (the shorter one in case of a tie), as in BLEU's brevity penalty.
+    """
+    lengths = np.asarray(lengths)
+    frequencies = np.bincount(lengths)
+    available = np.flatnonzero(frequencies)
+    closest = np.zeros(len(frequencies), dtype=np.int64)
+    for length in available:
+        others = available if frequencies[length] > 1 else available[available != length]
+        if len(others):
+            closest[length] = others[np.argmin(np.abs(others - length) * 2 + (others > length))]
+    return closest[lengths]
+
+
+def bleu(clipped, totals, hypothesis_length, reference_length, smoothing=False):
+    "BLEU from the clipped and total ngram counts for n=1..N (uniform weights)."
+    if clipped[0] == 0:
+        return 0.0
+    precisions = []
+    for numerator, denominator in zip(clipped, totals):
+        denominator = max(denominator, 1)
+        if numerator == 0:
+            if not smoothing:
+                return 0.0
+            numerator = SMOOTHING_EPSILON
+        precisions.append(numerator / denominator)
+    if hypothesis_length > reference_length:
+        brevity_penalty = 1.0
+    else:
+        brevity_penalty = exp(1 - reference_length / hypothesis_length) if hypothesis_length else 0.0
+    return brevity_penalty * exp(sum(log(p) for p in precisions) / len(precisions))
+
+
+def self_bleu(sentences, max_n=4, sample=None, seed=SELF_BLEU_SEED, workers=1):
+    """
+    Compute corpus-level and average sentence-level Self-BLEU, and the pairwise ngram
+    overlap for n=1..max_n. With a sample size, only that many (random) descriptions
+    are scored, against all other descriptions.
+    """
+    corpus = as_corpus(sentences)
+    sizes = list(range(1, max_n + 1))
+    if len(corpus) < 2:
+        # There are no other descriptions to compare with.
+        print("Warning: not enough descriptions!")
+        return dict({'self_bleu': None, 'mean_self_bleu': None},
+                    **{'pairwise_overlap_{}grams'.format(n): None for n in sizes})
+    if workers <= 1:
+        _init_overlap_worker(corpus)
+        results = list(map(_ngram_overlap_task, sizes))
+    else:
+        with Pool(min(workers, max_n), initializer=_init_overlap_worker, initargs=(corpus,)) as pool:
+            results = pool.map(_ngram_overlap_task, sizes)
+
+    lengths = corpus.lengths
+    reference_lengths = closest_reference_lengths(lengths)
+    hypotheses = np.arange(len(corpus))
+    if sample is not None and sample < len(corpus):
+        hypotheses = np.sort(np.random.default_rng(seed).choice(len(corpus), sample, replace=False))
+
+    totals = np.array([result[0][hypotheses] for result in results])
+    clipped = np.array([result[1][hypotheses] for result in results])
+    # Like nltk, count at least one ngram for each hypothesis (even if it is shorter than n).
+    data = {'self_bleu': bleu(clipped.sum(axis=1).tolist(), np.maximum(totals, 1).sum(axis=1).tolist(),
+                              int(lengths[hypotheses].sum()), int(reference_lengths[hypotheses].sum())),
+            'mean_self_bleu': float(np.mean([bleu(clipped[:, i].tolist(), totals[:, i].tolist(),
+                                                  int(lengths[h]), int(reference_lengths[h]), smoothing=True)
+                                             for i, h in enumerate(hypotheses.tolist())]))}
+    for n, (_, _, overlap) in zip(sizes, results):
+        data['pairwise_overlap_{}grams'.format(n)] = float(overlap[hypotheses].mean()) / (len(corpus) - 1)
+    return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute Self-BLEU and pairwise ngram overlap.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help="Annotated files with system output (default: all systems).")
+    parser.add_argument('--max-n', type=int, default=4,
+                        help="Maximum ngram size.")
+    parser.add_argument('--sample', type=int,
+                        help="Only score a random sample of this many descriptions.")
+    parser.add_argument('--seed', type=int, default=SELF_BLEU_SEED,
+                        help="Seed for the sample.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes (one for each ngram size).")
+    args = parser.parse_args()
+
+    def scores(filename):
+        return self_bleu(sentences_from_file(filename), args.max_n, args.sample, args.seed, args.workers)
+
+    if args.files:
+        for filename in args.files:
+            print(filename, scores(filename))
+        raise SystemExit
+
+    from results_store import ResultsStore
+
+    store = ResultsStore()
+    all_results = dict()
+    for system in SYSTEMS:
+        print('Processing:', system)
+        all_results[system] = scores('./Data/Systems/' + system + '/Val/annotated.json')
+        store.store(system, all_results[system])
+    save_json(all_results, './Data/Output/self_bleu.json')
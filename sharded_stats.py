@@ -0,0 +1,365 @@
+"""
+Mergeable partial statistics, for computing the stats of very large corpora in shards.
+
+A corpus (e.g. millions of generated descriptions) is split into shards, which are
+processed in parallel, in two passes:
+
+1. shard_summary: the number of sentences and tokens in each shard, and its last
+   tokens. From these, shard_positions computes where each shard starts, and the
+   tokens just before it (the context).
+2. partial_stats: a PartialStats object for each shard, with the word counts, the
+   sum (and sum of squares) of the sentence lengths, the number of new types in each
+   TTR chunk, the MATTR window totals, and the first occurrence of each type in the
+   random orderings for the type-token curve. The context is used to find ngrams and
+   previous occurrences that cross the start of the shard. (Only occurrences within
+   the largest window matter, see the fused metrics in methods.py.)
+
+The random orderings are defined by a random key for each sentence, which only
+depends on its position in the corpus (see methods.sentence_keys). So each shard only
+computes the keys of its own sentences, and the first occurrence of a type in an
+ordering is the occurrence in the sentence with the lowest key. Only finish needs
+the order of all sentences, to turn these into positions on the type-token curve.
+
+PartialStats objects are combined with combine (in corpus order), and finish turns
+the result into exactly the same stats as system_stats (or parallel_stats) on the
+full corpus (up to floating point rounding of the standard deviation of the sentence
+lengths). The stats for nouns and PPs (compound_stats and pp_stats) and the
+sentence-level novelty (sentence_stats) of consecutive parts are combined with
+combine_compound_stats and combine_pp_stats in nouns_pps.py, and with
+combine_sentence_stats in methods.py.
+
+Usage (to compute the stats for system output that is split over multiple files):
+
+    python sharded_stats.py --target stats.json [--workers 8] SHARD [SHARD ...]
+"""
+
+import argparse
+from collections import Counter
+from functools import reduce
+from multiprocessing import Pool
+
+import numpy as np
+
+from corpus import Corpus
+from methods import (as_corpus, corpus_from_file, parallel_slices, stream_ids, previous_occurrences,
+                     combine_types_tokens, average_curves, add_curve_arguments, sentence_keys,
+                     CHUNKED_TTRS, MOVING_TTRS, FUSED_METRICS, CURVE_SEED)
+
+# Largest ngram size and window size of the fused metrics.
+MAX_NGRAM = max(n for _, n, _ in CHUNKED_TTRS + MOVING_TTRS)
+MAX_WINDOW = max(window for _, _, window in CHUNKED_TTRS + MOVING_TTRS)
+
+# Number of tokens before a shard that are needed to compute its partial stats.
+CONTEXT_SIZE = MAX_WINDOW + MAX_NGRAM - 2
+
+
+
+def load_shard(shard):
+    "A shard is a file with system output (or a binary corpus), a list of sentences, or a Corpus."
+    if isinstance(shard, str):
+        return corpus_from_file(shard)
+    return as_corpus(shard)
+
+
+def repeat_seeds(repeats, seed=CURVE_SEED, corpus_index=0, num_corpora=1):
+    """
+    The seeds of the random orderings used for the type-token curve.
+    (The same as in methods.summed_random_curves.)
+    """
+    return np.random.SeedSequence(seed).spawn(num_corpora)[corpus_index].spawn(repeats)
+
+################################################################################
+# First pass: the position of each shard
+
+def shard_summary(shard):
+    "The number of sentences and tokens in a shard, and its last tokens."
+    corpus = load_shard(shard)
+    tail = corpus.flat[max(corpus.num_tokens - CONTEXT_SIZE, 0):]
+    return {'num_sentences': len(corpus),
+            'num_tokens': corpus.num_tokens,
+            'tail': corpus.vocab.decode(tail.tolist())}
+
+
+def shard_positions(summaries):
+    """
+    The first sentence, the first token, and the context (the tokens just before the
+    shard) for each shard, along with the totals for the whole corpus.
+    """
+    positions = []
+    sentences = tokens = 0
+    context = []
+    for summary in summaries:
+        positions.append({'sentence_offset': sentences,
+                          'token_offset': tokens,
+                          'context': context})
+        sentences += summary['num_sentences']
+        tokens += summary['num_tokens']
+        context = (context + summary['tail'])[-CONTEXT_SIZE:] if CONTEXT_SIZE else []
+    return positions, {'num_sentences': sentences, 'num_tokens': tokens}
+
+################################################################################
+# Second pass: partial stats for each shard
+
+class PartialStats(object):
+    """
+    Mergeable statistics for a consecutive part of a corpus.
+
+    - words:        the types in the part, in order of first occurrence.
+    - counts:       int64 array with the frequency of each word.
+    - length_sums:  the number of sentences, and the sum and the sum of squares of
+                    their lengths.
+    - lengths:      list of int64 arrays with the sentence lengths of each shard, only
+                    kept for the type-token curve (see type_token_curve_total).
+    - chunk_counts: for each chunked TTR, a dictionary mapping chunk numbers to the
+                    number of new types in that chunk (for the ngrams in this part).
+    - window_totals: for each MATTR, the summed number of new types over all windows.
+    - curve_keys:   uint64 array (repeats x words) with the key of the sentence with
+                    the first occurrence of each word in each random ordering.
+    - curve_offsets: int64 array (repeats x words) with the position of that occurrence
+                    in the sentence.
+    - settings:     the totals and curve settings, which should be the same for all parts.
+    """
+
+    def __init__(self, words, counts, length_sums, lengths, chunk_counts, window_totals,
+                 curve_keys, curve_offsets, settings):
+        self.words = words
+        self.counts = counts
+        self.length_sums = length_sums
+        self.lengths = lengths
+        self.chunk_counts = chunk_counts
+        self.window_totals = window_totals
+        self.curve_keys = curve_keys
+        self.curve_offsets = curve_offsets
+        self.settings = settings
+
+    def combine(self, other):
+        "Combine with the partial stats for the part of the corpus that directly follows this part."
+        if other.settings != self.settings:
+            raise ValueError('Partial stats with different settings cannot be combined.')
+        index = {word: i for i, word in enumerate(self.words)}
+        new_words = [word for word in other.words if word not in index]
+        words = self.words + new_words
+        for word in new_words:
+            index[word] = len(index)
+        positions = np.array([index[word] for word in other.words], dtype=np.int64)
+
+        counts = np.zeros(len(words), dtype=np.int64)
+        counts[:len(self.words)] = self.counts
+        counts[positions] += other.counts
+
+        # The first occurrence of a word is in the sentence with the lowest key.
+        repeats = self.curve_keys.shape[0]
+        curve_keys = np.zeros((repeats, len(words)), dtype=np.uint64)
+        curve_offsets = np.zeros((repeats, len(words)), dtype=np.int64)
+        curve_keys[:, :len(self.words)] = self.curve_keys
+        curve_offsets[:, :len(self.words)] = self.curve_offsets
+        earlier = np.ones(other.curve_keys.shape, dtype=bool)
+        shared = positions < len(self.words)
+        earlier[:, shared] = other.curve_keys[:, shared] < curve_keys[:, positions[shared]]
+        rows, columns = np.nonzero(earlier)
+        curve_keys[rows, positions[columns]] = other.curve_keys[rows, columns]
+        curve_offsets[rows, positions[columns]] = other.curve_offsets[rows, columns]
+
+        chunk_counts = dict()
+        for key, chunks in self.chunk_counts.items():
+            chunk_counts[key] = dict(chunks)
+            for chunk, count in other.chunk_counts[key].items():
+                chunk_counts[key][chunk] = chunk_counts[key].get(chunk, 0) + count
+        window_totals = {key: total + other.window_totals[key] for key, total in self.window_totals.items()}
+        length_sums = tuple(a + b for a, b in zip(self.length_sums, other.length_sums))
+        return PartialStats(words, counts, length_sums, self.lengths + other.lengths,
+                            chunk_counts, window_totals, curve_keys, curve_offsets, self.settings)
+
+    def type_token_curve_total(self):
+        """
+        The sum of the type-token curves for all random orderings.
+
+        Like system_stats, this needs the length of every sentence, to find the
+        position of the first occurrences in each ordering.
+        """
+        settings = self.settings
+        total = np.zeros(settings['num_tokens'], dtype=np.int64)
+        lengths = np.concatenate(self.lengths)
+        seeds = repeat_seeds(settings['curve_repeats'], settings['seed'],
+                             settings['corpus_index'], settings['num_corpora'])
+        for seed, keys, in_sentence in zip(seeds, self.curve_keys, self.curve_offsets):
+            all_keys = sentence_keys(np.arange(len(lengths)), seed)
+            order = np.argsort(all_keys)
+            offsets = np.concatenate([[0], np.cumsum(lengths[order])])
+            first = offsets[np.searchsorted(all_keys[order], keys)] + in_sentence
+            mask = np.zeros(settings['num_tokens'], dtype=bool)
+            mask[first] = True
+            total += np.cumsum(mask)
+        return total
+
+    def finish(self):
+        "The stats for the whole corpus (see methods.fused_stats and methods.system_stats)."
+        settings = self.settings
+        num_sentences, length_sum, length_squares = self.length_sums
+        if num_sentences != settings['num_sentences']:
+            raise ValueError('The partial stats do not cover the whole corpus.')
+        counts = Counter(dict(zip(self.words, self.counts.tolist())))
+        data = {"types": set(counts.keys()),
+                "counts": counts,
+                "num_types": len(counts),
+                "num_tokens": settings['num_tokens']}
+        data['average_sentence_length'] = float(length_sum)/num_sentences
+        # The variance is computed from the (exact) integer sums, to avoid cancellation.
+        data['std_sentence_length']     = np.sqrt((num_sentences * length_squares - length_sum ** 2)
+                                                  / num_sentences ** 2)
+        for key, n, window in CHUNKED_TTRS:
+            num_chunks = max(settings['num_tokens'] - n + 1, 0) // window
+            if num_chunks == 0:
+                print("Warning: not enough tokens!")
+                data[key] = None
+                continue
+            chunks = self.chunk_counts[key]
+            ttrs = (np.array([chunks.get(chunk, 0) for chunk in range(num_chunks)], dtype=np.int64) / window).tolist()
+            data[key] = float(sum(ttrs))/len(ttrs)
+        for key, n, window in MOVING_TTRS:
+            num_windows = max(settings['num_tokens'] - n + 1, 0) - window + 1
+            if num_windows <= 0:
+                print("Warning: not enough tokens!")
+                data[key] = None
+                continue
+            data[key] = float(self.window_totals[key])/(num_windows * window)
+        if settings['curve_repeats']:
+            data['ttr_curve'] = self.type_token_curve_total() / settings['curve_repeats']
+        return data
+
+
+def partial_stats(shard, position, totals, curve_repeats=10, seed=CURVE_SEED, corpus_index=0, num_corpora=1):
+    "Compute the partial stats for a shard, given its position (see shard_positions)."
+    corpus = load_shard(shard)
+    vocab = corpus.vocab
+    ids = corpus.flat
+    context = np.array(vocab.encode(position['context']), dtype=np.int32)
+    start = position['token_offset'] - len(context)     # Global position of the first context token.
+    stream = Corpus(np.concatenate([context, ids]), np.array([0, len(context) + len(ids)]), vocab)
+    num_tokens = totals['num_tokens']
+
+    # For the fused metrics: the ngrams that end in this shard.
+    prevs = dict()
+    for n in sorted({n for _, n, _ in CHUNKED_TTRS + MOVING_TTRS}):
+        prev = previous_occurrences(stream_ids(stream, n))
+        first = max(len(context) - n + 1, 0)
+        positions = np.arange(first, len(prev)) + start
+        prev = prev[first:]
+        prevs[n] = (positions, np.where(prev < 0, -1, prev + start))
+
+    chunk_counts = dict()
+    for key, n, window in CHUNKED_TTRS:
+        positions, prev = prevs[n]
+        chunk = positions // window
+        new = (prev < chunk * window) & (chunk < max(num_tokens - n + 1, 0) // window)
+        chunk_ids, chunk_totals = np.unique(chunk[new], return_counts=True)
+        chunk_counts[key] = dict(zip(chunk_ids.tolist(), chunk_totals.tolist()))
+
+    window_totals = dict()
+    for key, n, window in MOVING_TTRS:
+        positions, prev = prevs[n]
+        num_windows = max(num_tokens - n + 1, 0) - window + 1
+        first = np.maximum(prev + 1, positions - window + 1)
+        last = np.minimum(positions, num_windows - 1)
+        window_totals[key] = int(np.clip(last - first + 1, 0, None).sum())
+
+    # Word counts, in order of first occurrence.
+    unique, first, counts = np.unique(ids, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    words = vocab.decode(unique[order].tolist())
+
+    # First occurrence of each word in the random orderings: the sentence with the
+    # lowest key, and the first position in that sentence.
+    lengths = corpus.lengths.astype(np.int64)
+    sentence = np.repeat(np.arange(len(corpus)), lengths)
+    in_sentence = np.arange(len(ids)) - np.repeat(corpus.offsets[:-1] - corpus.offsets[0], lengths)
+    indices = position['sentence_offset'] + np.arange(len(corpus))
+    curve_keys = np.empty((curve_repeats, len(words)), dtype=np.uint64)
+    curve_offsets = np.empty((curve_repeats, len(words)), dtype=np.int64)
+    for repeat, repeat_seed in enumerate(repeat_seeds(curve_repeats, seed, corpus_index, num_corpora)):
+        keys = sentence_keys(indices, repeat_seed)[sentence]
+        lowest = np.full(len(vocab), np.iinfo(np.uint64).max, dtype=np.uint64)
+        np.minimum.at(lowest, ids, keys)
+        in_lowest = keys == lowest[ids]
+        offsets = np.full(len(vocab), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(offsets, ids[in_lowest], in_sentence[in_lowest])
+        curve_keys[repeat] = lowest[unique[order]]
+        curve_offsets[repeat] = offsets[unique[order]]
+
+    length_sums = (len(corpus), int(lengths.sum()), int((lengths ** 2).sum()))
+    settings = dict(totals, curve_repeats=curve_repeats, seed=seed,
+                    corpus_index=corpus_index, num_corpora=num_corpora)
+    return PartialStats(words, counts[order].astype(np.int64), length_sums,
+                        [lengths] if curve_repeats else [],
+                        chunk_counts, window_totals, curve_keys, curve_offsets, settings)
+
+
+def combine_all(states):
+    "Combine a list of partial stats, in corpus order."
+    return reduce(PartialStats.combine, states)
+
+################################################################################
+# Map-reduce over shards
+
+def _partial_stats_task(task):
+    return partial_stats(*task)
+
+
+def shard_stats(shards, curve_repeats=10, seed=CURVE_SEED, corpus_index=0, num_corpora=1, pool=None):
+    "Compute and combine the partial stats for a list of shards (in corpus order)."
+    map_function = pool.map if pool is not None else map
+    positions, totals = shard_positions(list(map_function(shard_summary, shards)))
+    tasks = [(shard, position, totals, curve_repeats, seed, corpus_index, num_corpora)
+             for shard, position in zip(shards, positions)]
+    return combine_all(list(map_function(_partial_stats_task, tasks)))
+
+
+def sharded_system_stats(shards, curve_repeats=10, workers=1, seed=CURVE_SEED):
+    """
+    Compute all stats for a corpus that is split into shards, processing the shards
+    in parallel. The results are identical to system_stats on the whole corpus.
+    """
+    if workers <= 1:
+        return shard_stats(shards, curve_repeats, seed).finish()
+    with Pool(workers) as pool:
+        return shard_stats(shards, curve_repeats, seed, pool=pool).finish()
+
+
+def sharded_parallel_stats(shards, curve_repeats=10, workers=1, seed=CURVE_SEED):
+    """
+    Compute all stats for a parallel corpus that is split into shards, where each shard
+    is a list of parallel slots (or a parallel Corpus). The results are identical to
+    parallel_stats on the whole corpus.
+    """
+    slot_shards = list(zip(*[parallel_slices(shard) for shard in shards]))
+    def slot_results(pool=None):
+        return [shard_stats(list(slot), curve_repeats, seed, index, len(slot_shards), pool).finish()
+                for index, slot in enumerate(slot_shards)]
+    if workers <= 1:
+        results = slot_results()
+    else:
+        with Pool(workers) as pool:
+            results = slot_results(pool)
+    data = combine_types_tokens(results)
+    data['ttr_curve'] = average_curves([result['ttr_curve'] for result in results])
+    for key in FUSED_METRICS:
+        # Average over the parallel sentences (see methods.parallel_stats).
+        data[key] = float(sum(result[key] for result in results))/len(results)
+    return data
+
+
+if __name__ == '__main__':
+    from stats_files import save_stats
+
+    parser = argparse.ArgumentParser(description='Compute the stats for system output that is split into shards.')
+    parser.add_argument('shards', nargs='+', metavar='SHARD',
+                        help="Files with system output (or binary corpora), in order.")
+    parser.add_argument('--target', required=True,
+                        help="Stats file to write.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of shards to process in parallel.")
+    add_curve_arguments(parser)
+    args = parser.parse_args()
+
+    stats = sharded_system_stats(args.shards, curve_repeats=args.curve_repeats, workers=args.workers)
+    save_stats(stats, args.target)
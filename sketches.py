@@ -0,0 +1,285 @@
+"""
+Approximate diversity statistics in fixed memory, for very large generated corpora.
+
+The exact metrics keep a Counter with all words, the full set of types, and all
+unique descriptions in memory. This module estimates the same numbers with sketches
+whose size only depends on the requested accuracy:
+
+* HyperLogLog estimates the number of distinct words, ngrams, and descriptions.
+  With relative error e, it uses (1.04/e)**2 registers (rounded up to a power of two)
+  of one byte each. E.g. 16K registers (16 KB) for an error of 1%.
+* A count-min sketch estimates the frequency of each word. Estimates are never too
+  low, and with probability 1 - delta they are at most epsilon * (number of tokens)
+  too high. It uses ceil(ln(1/delta)) x ceil(e/epsilon) counters.
+* The most frequent words are tracked in a fixed-size table of candidates.
+
+All items are hashed with the stable 64-bit hashes from hashing.py (ngrams within
+sentences, as for novelty). ApproximateStats objects can be updated one batch at a
+time, and merged (e.g. for shards processed in parallel).
+
+Usage:
+
+    python sketches.py FILE [FILE ...] [--error 0.01] [--epsilon 0.0001] [--delta 0.01] [--novelty]
+"""
+
+import argparse
+import heapq
+from math import ceil, e, log, log2, sqrt
+
+import numpy as np
+
+from hashing import MULTIPLIER, hash_strings, hash_ngrams, mix
+from methods import as_corpus, lower_sent, iter_annotations, save_json
+from novelty import sentence_hashes
+
+NGRAM_SIZES = [1, 2, 3]
+
+
+def bit_length(values):
+    "Number of bits needed to represent each value in a uint64 array."
+    values = np.array(values, dtype=np.uint64)
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        large = values >= np.uint64(1 << shift)
+        lengths[large] += shift
+        values[large] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+################################################################################
+# Sketches
+
+class HyperLogLog(object):
+    "Estimate the number of distinct hashes, with the given relative (standard) error."
+
+    def __init__(self, error=0.01):
+        self.precision = min(max(ceil(log2((1.04 / error) ** 2)), 4), 24)
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+
+    @property
+    def error(self):
+        "The relative standard error of the estimate."
+        return 1.04 / sqrt(len(self.registers))
+
+    def add(self, hashes):
+        "Add a uint64 array of hashes."
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        rest_bits = 64 - self.precision
+        index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # Position of the first 1-bit in the remaining bits.
+        rank = (rest_bits - bit_length(rest) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        "Add all hashes of another sketch with the same error."
+        if len(other.registers) != len(self.registers):
+            raise ValueError('Only sketches with the same error can be merged.')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        "Estimate the number of distinct hashes."
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction (linear counting).
+            estimate = m * log(m / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch(object):
+    """
+    Estimate the frequency of each hash. Estimates are at most epsilon * total too
+    high, with probability 1 - delta.
+    """
+
+    def __init__(self, epsilon=0.0001, delta=0.01):
+        self.width = int(ceil(e / epsilon))
+        self.depth = int(ceil(log(1 / delta)))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def columns(self, hashes, row):
+        "Column for each hash in a row of the table (with a different hash function for each row)."
+        seed = np.uint64(((row + 1) * int(MULTIPLIER)) & 0xFFFFFFFFFFFFFFFF)
+        row_hashes = mix(hashes + seed)
+        return (row_hashes % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, hashes, counts=None):
+        "Add a uint64 array of hashes (with counts, or once each)."
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        counts = np.ones(len(hashes), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        for row in range(self.depth):
+            np.add.at(self.table[row], self.columns(hashes, row), counts)
+        self.total += int(counts.sum())
+
+    def query(self, hashes):
+        "Estimated frequency of each hash."
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        estimates = np.full(len(hashes), np.iinfo(np.int64).max, dtype=np.int64)
+        for row in range(self.depth):
+            np.minimum(estimates, self.table[row][self.columns(hashes, row)], out=estimates)
+        return estimates
+
+    def merge(self, other):
+        "Add all counts of another sketch with the same size."
+        if self.table.shape != other.table.shape:
+            raise ValueError('Only sketches with the same size can be merged.')
+        self.table += other.table
+        self.total += other.total
+        return self
+
+################################################################################
+# Approximate stats
+
+class ApproximateStats(object):
+    """
+    Approximate type, token, and description counts for a corpus that is added one
+    batch at a time. Memory use does not depend on the size of the corpus.
+
+    - error:        relative error of the distinct counts (HyperLogLog).
+    - epsilon, delta: error bounds for the word frequencies (count-min sketch).
+    - top:          number of most frequent words to keep track of.
+    - novelty_index: optional NoveltyIndex (see novelty.py), to count novel descriptions.
+    """
+
+    def __init__(self, error=0.01, epsilon=0.0001, delta=0.01, top=100, novelty_index=None):
+        self.ngram_types = {n: HyperLogLog(error) for n in NGRAM_SIZES}
+        self.descriptions = HyperLogLog(error)
+        self.novel_descriptions = HyperLogLog(error)
+        self.frequencies = CountMinSketch(epsilon, delta)
+        self.top = top
+        self.candidates = dict()    # Word -> estimated frequency, for the most frequent words.
+        self.novelty_index = novelty_index
+        self.num_sentences = 0
+        self.num_tokens = 0
+        self.sum_squared_lengths = 0
+        self.num_descriptions = 0
+        self.num_novel_descriptions = 0
+
+    def update(self, sentences):
+        "Add a batch of tokenized sentences (or a Corpus)."
+        corpus = as_corpus(sentences)
+        vocab_hashes = hash_strings(corpus.vocab.tokens)
+        token_hashes = vocab_hashes[corpus.flat]
+        for n, sketch in self.ngram_types.items():
+            sketch.add(hash_ngrams(token_hashes, corpus.offsets, n))
+
+        lengths = corpus.lengths
+        self.num_sentences += len(lengths)
+        self.num_tokens += int(lengths.sum())
+        self.sum_squared_lengths += int((lengths.astype(np.int64) ** 2).sum())
+
+        # Word frequencies, and the candidates for the most frequent words.
+        ids, counts = np.unique(corpus.flat, return_counts=True)
+        self.frequencies.add(vocab_hashes[ids], counts)
+        words = corpus.vocab.decode(ids.tolist()) + list(self.candidates)
+        estimates = self.frequencies.query(np.concatenate([vocab_hashes[ids], hash_strings(self.candidates)]))
+        best = heapq.nlargest(self.top, zip(estimates.tolist(), words))
+        self.candidates = {word: estimate for estimate, word in best}
+
+    def update_descriptions(self, descriptions):
+        "Add a batch of raw descriptions (for the number of unique and novel descriptions)."
+        hashes = sentence_hashes(descriptions)
+        self.descriptions.add(hashes)
+        self.num_descriptions += len(hashes)
+        if self.novelty_index is not None:
+            novel = hashes[~self.novelty_index.known_descriptions(descriptions)]
+            self.novel_descriptions.add(novel)
+            self.num_novel_descriptions += len(novel)
+
+    def frequency(self, word):
+        "Estimated frequency of a word."
+        return int(self.frequencies.query(hash_strings([word]))[0])
+
+    def merge(self, other):
+        "Add the counts of another ApproximateStats object with the same settings."
+        for n, sketch in self.ngram_types.items():
+            sketch.merge(other.ngram_types[n])
+        self.descriptions.merge(other.descriptions)
+        self.novel_descriptions.merge(other.novel_descriptions)
+        self.frequencies.merge(other.frequencies)
+        words = list(set(self.candidates) | set(other.candidates))
+        estimates = self.frequencies.query(hash_strings(words)).tolist()
+        self.candidates = dict(heapq.nlargest(self.top, zip(words, estimates), key=lambda pair: pair[1]))
+        for attribute in ['num_sentences', 'num_tokens', 'sum_squared_lengths',
+                          'num_descriptions', 'num_novel_descriptions']:
+            setattr(self, attribute, getattr(self, attribute) + getattr(other, attribute))
+        return self
+
+    def results(self):
+        "The current estimates, with the same keys as the exact stats where possible."
+        mean = self.num_tokens / self.num_sentences if self.num_sentences else 0.0
+        variance = self.sum_squared_lengths / self.num_sentences - mean ** 2 if self.num_sentences else 0.0
+        data = {'num_types': self.ngram_types[1].count(),
+                'num_tokens': self.num_tokens,
+                'average_sentence_length': mean,
+                'std_sentence_length': sqrt(max(variance, 0.0)),
+                'most_common': sorted(self.candidates.items(), key=lambda pair: pair[1], reverse=True),
+                'distinct_count_error': self.ngram_types[1].error,
+                'frequency_error': self.frequencies.total / self.frequencies.width * e}
+        for n in NGRAM_SIZES[1:]:
+            data['num_{}gram_types'.format(n)] = self.ngram_types[n].count()
+        if self.num_descriptions:
+            data['num_unique_descriptions'] = self.descriptions.count()
+        if self.novelty_index is not None and self.num_descriptions:
+            data['num_novel_description_types'] = self.novel_descriptions.count()
+            data['total_num_novel_descriptions'] = self.num_novel_descriptions
+            data['percentage_novel'] = (self.num_novel_descriptions/self.num_descriptions) * 100
+        return data
+
+
+def approximate_stats_from_files(filenames, batch_size=10000, lower=True, **settings):
+    "Stream the entries from files with system output, and compute the approximate stats."
+    stats = ApproximateStats(**settings)
+    for filename in filenames:
+        for batch in chunks_from_iterable(iter_annotations(filename), batch_size):
+            stats.update([lower_sent(entry['tokenized']) if lower else entry['tokenized'] for entry in batch])
+            stats.update_descriptions([entry['caption'] for entry in batch])
+    return stats
+
+
+def chunks_from_iterable(iterable, n):
+    "Yield lists of n items (the last one may be shorter). Like methods.chunks, for iterables."
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Estimate diversity stats in fixed memory.')
+    parser.add_argument('files', nargs='+', metavar='FILE',
+                        help="Annotated files with system output (or binary corpora).")
+    parser.add_argument('--error', type=float, default=0.01,
+                        help="Relative error of the type and description counts.")
+    parser.add_argument('--epsilon', type=float, default=0.0001,
+                        help="Maximum overestimate of word frequencies, relative to the number of tokens.")
+    parser.add_argument('--delta', type=float, default=0.01,
+                        help="Probability that a word frequency exceeds that bound.")
+    parser.add_argument('--novelty', action='store_true',
+                        help="Also count novel descriptions (uses the novelty index, see novelty.py).")
+    parser.add_argument('--target',
+                        help="JSON file to save the results to.")
+    args = parser.parse_args()
+
+    novelty_index = None
+    if args.novelty:
+        from novelty import load_novelty_index
+        novelty_index = load_novelty_index()
+    stats = approximate_stats_from_files(args.files, error=args.error, epsilon=args.epsilon,
+                                         delta=args.delta, novelty_index=novelty_index)
+    results = stats.results()
+    for key, value in sorted(results.items()):
+        if key != 'most_common':
+            print(key, value)
+    if args.target:
+        save_json(results, args.target)
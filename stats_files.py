@@ -0,0 +1,133 @@
+"""
+Saving and loading stats files.
+
+A stats file (e.g. Data/Systems/*/Val/stats.json) only contains the scalar results.
+All other values are stored in separate files next to it, named after the key:
+
+* The type-token curve:  stats.ttr_curve.npy (float32 array).
+* Word counts:           stats.counts.npz, with parallel arrays of word IDs and counts.
+                         The words themselves are stored in stats.vocab.json.
+* All other values:      stats.KEY.json (e.g. the types, or the novel descriptions).
+
+The summary lists these files under 'artifacts'. load_stats only reads the summary,
+and loads the other values when they are first accessed. Old stats files (with all
+values in one JSON file) can still be loaded.
+"""
+
+import os
+from collections import Counter
+
+import numpy as np
+
+from methods import load_json, save_json, curve_as_array
+
+# Keys of the values that are stored as arrays.
+CURVE_KEYS = ['ttr_curve']
+COUNT_KEYS = ['counts', 'total_counts', 'separate_counts']
+
+
+def artifact_filename(filename, key, extension):
+    "Name of the file for one value in the stats file."
+    base, _ = os.path.splitext(filename)
+    return '{}.{}{}'.format(base, key, extension)
+
+
+def is_scalar(value):
+    return value is None or isinstance(value, (bool, int, float, str, np.generic))
+
+################################################################################
+# Saving
+
+def save_counts(counters, vocab, filename):
+    "Save a list of counters as ID and count arrays."
+    arrays = dict()
+    for i, counter in enumerate(counters):
+        arrays['ids_{}'.format(i)] = np.array([vocab.setdefault(word, len(vocab)) for word in counter],
+                                              dtype=np.int32)
+        arrays['counts_{}'.format(i)] = np.array(list(counter.values()), dtype=np.int64)
+    np.savez(filename, **arrays)
+
+
+def save_stats(stats, filename):
+    "Save the scalar stats to filename, and all other values to separate files."
+    summary = dict()
+    artifacts = dict()
+    vocab = dict()
+    for key, value in stats.items():
+        if is_scalar(value):
+            summary[key] = value
+        elif key in CURVE_KEYS:
+            artifacts[key] = artifact_filename(filename, key, '.npy')
+            np.save(artifacts[key], curve_as_array(value).astype(np.float32))
+        elif key in COUNT_KEYS:
+            artifacts[key] = artifact_filename(filename, key, '.npz')
+            save_counts(value if isinstance(value, list) else [value], vocab, artifacts[key])
+        else:
+            artifacts[key] = artifact_filename(filename, key, '.json')
+            save_json(value, artifacts[key])
+    if vocab:
+        save_json(list(vocab), artifact_filename(filename, 'vocab', '.json'))
+    # Store the file names relative to the summary.
+    summary['artifacts'] = {key: os.path.basename(path) for key, path in artifacts.items()}
+    save_json(summary, filename)
+
+################################################################################
+# Loading
+
+class Stats(dict):
+    """
+    Dictionary with the scalar stats, which loads the other values on first access.
+
+    Iterating over a Stats object only gives the keys that have been loaded so far.
+    Use `in` to check whether a value is available.
+    """
+
+    def __init__(self, summary, filename):
+        self.artifacts = summary.pop('artifacts', dict())
+        dict.__init__(self, summary)
+        self.directory = os.path.dirname(filename)
+        self.filename = filename
+        self._vocab = None
+
+    def vocab(self):
+        "The list of words for the word IDs in the count files."
+        if self._vocab is None:
+            self._vocab = load_json(artifact_filename(self.filename, 'vocab', '.json'))
+        return self._vocab
+
+    def load_counts(self, path):
+        "Load the counters saved by save_counts."
+        vocab = self.vocab()
+        with np.load(path) as arrays:
+            num = len(arrays.files) // 2
+            return [Counter(dict(zip([vocab[i] for i in arrays['ids_{}'.format(j)].tolist()],
+                                     arrays['counts_{}'.format(j)].tolist())))
+                    for j in range(num)]
+
+    def load(self, key):
+        "Load one value from its file."
+        path = os.path.join(self.directory, self.artifacts[key])
+        if path.endswith('.npy'):
+            return np.load(path)
+        if path.endswith('.npz'):
+            counters = self.load_counts(path)
+            return counters if key == 'separate_counts' else counters[0]
+        return load_json(path)
+
+    def __missing__(self, key):
+        if key not in self.artifacts:
+            raise KeyError(key)
+        value = self.load(key)
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.artifacts
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def load_stats(filename):
+    "Load a stats file. Values other than the scalar stats are loaded when they are accessed."
+    return Stats(load_json(filename), filename)
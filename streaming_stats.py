@@ -0,0 +1,276 @@
+"""
+Incremental stats for descriptions that arrive one batch at a time (e.g. from a
+generation service), without recomputing anything from scratch.
+
+A StreamingStats object keeps the state of each metric in system_stats:
+
+* the vocabulary and the count of each word;
+* the mean and variance of the sentence lengths (Welford's algorithm);
+* for each ngram size, the last position of every ngram, from which the chunked
+  TTRs and MATTRs are updated as in fused_stats (see methods.py);
+* the position of the first occurrence of each word, for the type-token curve;
+* the unique and novel descriptions, and the number of novel ngrams.
+
+Each update takes time proportional to the size of the batch, and results() can be
+called at any moment. The results are the same as for the complete list of sentences
+(up to floating point rounding of the standard deviation), except for the type-token
+curve: system_stats averages the curve over random orderings of the full corpus,
+which is not possible while the corpus is still growing, so here the curve follows
+the order in which the descriptions arrived.
+
+Usage (to replay an annotated file in batches):
+
+    python streaming_stats.py FILE [--batch-size 1000] [--target stats.json] [--no-novelty]
+"""
+
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from corpus import Corpus, Vocabulary
+from methods import (CHUNKED_TTRS, MOVING_TTRS, previous_occurrences, normalize_string,
+                     lower_sent, iter_annotations)
+from stats_files import save_stats
+
+
+def grow(array, size, fill):
+    "Return the array, extended with the fill value to at least the given size."
+    if len(array) >= size:
+        return array
+    extended = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    extended[:len(array)] = array
+    return extended
+
+
+class NgramStream(object):
+    """
+    Chunked TTRs and MATTRs for the ngrams of size n in a growing stream of token IDs.
+    As in methods.stream_ids, ngrams may cross sentence boundaries.
+    """
+
+    def __init__(self, n, chunk_windows=(), moving_windows=()):
+        self.n = n
+        self.ids = dict()                            # Ngram (tuple of token IDs) -> dense ID.
+        self.last = np.zeros(0, dtype=np.int64)      # Dense ID -> position of its last occurrence.
+        self.context = np.zeros(0, dtype=np.int64)   # Last n-1 token IDs.
+        self.size = 0                                # Number of ngrams so far.
+        self.chunks = {window: [0, 0, 0] for window in chunk_windows}   # Sum of TTRs, number of chunks, types in the open chunk.
+        self.moving = {window: 0 for window in moving_windows}          # Types added to all windows started so far.
+        # Ring buffer with the previous occurrences for the last positions (enough for the largest window).
+        self.recent_prev = np.zeros(max(list(moving_windows) + [0]), dtype=np.int64)
+
+    def encode(self, tokens):
+        "Dense IDs for the ngrams ending in the new tokens."
+        if self.n == 1:
+            return tokens
+        tokens = np.concatenate([self.context, tokens])
+        self.context = tokens[max(len(tokens) - self.n + 1, 0):]
+        num_ngrams = max(len(tokens) - self.n + 1, 0)
+        rows = np.stack([tokens[i:i + num_ngrams] for i in range(self.n)], axis=1)
+        unique, inverse = np.unique(rows, axis=0, return_inverse=True)
+        dense = np.array([self.ids.setdefault(tuple(row), len(self.ids)) for row in unique.tolist()],
+                         dtype=np.int64)
+        return dense[inverse.ravel()]
+
+    def update(self, tokens):
+        """
+        Add the new token IDs to the stream. Returns the previous occurrence of each new
+        ngram (-1 for the first occurrence).
+        """
+        ids = self.encode(tokens)
+        start = self.size
+        positions = start + np.arange(len(ids))
+        self.last = grow(self.last, int(ids.max()) + 1 if len(ids) else 0, -1)
+        prev = previous_occurrences(ids)
+        prev = np.where(prev < 0, self.last[ids], prev + start)
+        # Last occurrence of each ID in this batch.
+        unique, reverse_first = np.unique(ids[::-1], return_index=True)
+        self.last[unique] = positions[::-1][reverse_first]
+        self.size += len(ids)
+
+        for window, state in self.chunks.items():
+            self.update_chunks(state, window, prev, positions)
+        for window in self.moving:
+            self.moving[window] += int((positions - np.maximum(prev + 1, positions - window + 1) + 1).sum())
+        keep = len(self.recent_prev)
+        if keep:
+            self.recent_prev[positions[-keep:] % keep] = prev[-keep:]
+        return prev
+
+    def update_chunks(self, state, window, prev, positions):
+        "Add the types in the new positions to the open chunk, and close all complete chunks."
+        if len(positions) == 0:
+            return
+        first_chunk = positions[0] // window
+        new = prev < positions - positions % window
+        types = np.bincount(positions // window - first_chunk, weights=new).astype(np.int64)
+        types[0] += state[2]
+        complete = self.size // window - first_chunk
+        for count in types[:complete].tolist():
+            state[0] += count / window
+            state[1] += 1
+        state[2] = int(types[complete]) if complete < len(types) else 0
+
+    def chunked_ttr(self, window):
+        "Same as methods.fused_chunked_ttr for the ngrams so far."
+        total, num_chunks, _ = self.chunks[window]
+        return float(total)/num_chunks if num_chunks else None
+
+    def moving_ttr(self, window):
+        "Same as methods.fused_moving_ttr for the ngrams so far."
+        num_windows = self.size - window + 1
+        if num_windows <= 0:
+            return None
+        # Remove the types added to windows that are not complete yet.
+        positions = np.arange(num_windows, self.size)
+        prev = self.recent_prev[positions % len(self.recent_prev)]
+        incomplete = int((positions - np.maximum(np.maximum(prev + 1, positions - window + 1), num_windows) + 1).sum())
+        return float(self.moving[window] - incomplete)/(num_windows * window)
+
+
+class StreamingStats(object):
+    """
+    Stats for a growing list of descriptions. Use update() to add a batch of tokenized
+    sentences (and the raw descriptions, for the novelty stats), and results() to get
+    the current values, with the same keys as system_stats and NoveltyIndex.novelty_stats.
+
+    novelty_index is an optional NoveltyIndex (see novelty.py).
+    """
+
+    def __init__(self, novelty_index=None):
+        self.vocab = Vocabulary()
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.num_sentences = 0
+        self.num_tokens = 0
+        self.mean_length = 0.0
+        self.squared_deviations = 0.0
+        self.first_positions = []
+        sizes = sorted({n for _, n, _ in CHUNKED_TTRS + MOVING_TTRS})
+        self.streams = {n: NgramStream(n,
+                                       [window for _, size, window in CHUNKED_TTRS if size == n],
+                                       [window for _, size, window in MOVING_TTRS if size == n])
+                        for n in sizes}
+        self.novelty_index = novelty_index
+        self.num_descriptions = 0
+        self.unique_descriptions = set()
+        self.novel_descriptions = set()
+        self.num_novel_descriptions = 0
+        self.novel_ngrams = Counter()
+        self.total_ngrams = Counter()
+
+    def update(self, sentences, descriptions=None):
+        "Add a batch of tokenized sentences, and optionally the raw descriptions."
+        corpus = Corpus.from_sentences(sentences, self.vocab)
+        tokens = corpus.flat.astype(np.int64)
+        self.update_lengths(corpus.lengths)
+        self.counts = grow(self.counts, len(self.vocab), 0)
+        self.counts += np.bincount(tokens, minlength=len(self.counts))
+
+        start = self.num_tokens
+        for n, stream in self.streams.items():
+            prev = stream.update(tokens)
+            if n == 1:
+                self.first_positions.append(start + np.flatnonzero(prev < 0))
+        self.num_tokens += len(tokens)
+
+        if descriptions is not None:
+            self.update_descriptions(descriptions, corpus)
+
+    def update_entries(self, entries):
+        "Add a batch of annotated entries (lowercased, as in corpus_from_file)."
+        entries = list(entries)
+        self.update([lower_sent(entry['tokenized']) for entry in entries],
+                    [entry['caption'] for entry in entries])
+
+    def update_lengths(self, lengths):
+        "Welford's algorithm, combining the current mean and variance with those of the batch."
+        if len(lengths) == 0:
+            return
+        batch_mean = float(np.mean(lengths))
+        batch_deviations = float(np.sum((lengths - batch_mean) ** 2))
+        total = self.num_sentences + len(lengths)
+        delta = batch_mean - self.mean_length
+        self.mean_length += delta * len(lengths) / total
+        self.squared_deviations += batch_deviations + delta ** 2 * self.num_sentences * len(lengths) / total
+        self.num_sentences = total
+
+    def update_descriptions(self, descriptions, sentences):
+        "Update the unique and novel descriptions, and the novel ngrams."
+        normalized = [normalize_string(desc) for desc in descriptions]
+        new = list(set(normalized) - self.unique_descriptions)
+        self.unique_descriptions.update(new)
+        self.num_descriptions += len(normalized)
+        if self.novelty_index is None:
+            return
+        self.novel_descriptions.update(desc for desc, known in zip(new, self.novelty_index.known_descriptions(new))
+                                       if not known)
+        self.num_novel_descriptions += sum(1 for desc in normalized if desc in self.novel_descriptions)
+        for n in self.novelty_index.ngrams:
+            known = self.novelty_index.known_ngrams(sentences, n)
+            self.novel_ngrams[n] += len(known) - int(known.sum())
+            self.total_ngrams[n] += len(known)
+
+    def type_token_curve(self):
+        "Number of types in the first i+1 tokens, in the order in which the tokens arrived."
+        mask = np.zeros(self.num_tokens, dtype=bool)
+        for positions in self.first_positions:
+            mask[positions] = True
+        return np.cumsum(mask)
+
+    def results(self):
+        "The current value of all stats."
+        counts = Counter(dict(zip(self.vocab.tokens, self.counts[:len(self.vocab)].tolist())))
+        data = {"types": set(counts.keys()),
+                "counts": counts,
+                "num_types": len(counts),
+                "num_tokens": self.num_tokens}
+        if self.num_sentences:
+            data['average_sentence_length'] = float(self.num_tokens)/self.num_sentences
+            data['std_sentence_length'] = (self.squared_deviations / self.num_sentences) ** 0.5
+        for key, n, window in CHUNKED_TTRS:
+            data[key] = self.streams[n].chunked_ttr(window)
+        for key, n, window in MOVING_TTRS:
+            data[key] = self.streams[n].moving_ttr(window)
+        data['ttr_curve'] = self.type_token_curve()
+
+        if self.num_descriptions:
+            data['unique_descriptions'] = self.unique_descriptions
+            data['num_unique_descriptions'] = len(self.unique_descriptions)
+        if self.novelty_index is not None and self.num_descriptions:
+            data['novel_descriptions'] = self.novel_descriptions
+            data['num_novel_description_types'] = len(self.novel_descriptions)
+            data['total_num_novel_descriptions'] = self.num_novel_descriptions
+            data['percentage_novel'] = (self.num_novel_descriptions/self.num_descriptions) * 100
+            for n, total in self.total_ngrams.items():
+                data['percentage_novel_{}grams'.format(n)] = (self.novel_ngrams[n]/total) * 100 if total else 0.0
+        return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the stats for a file, one batch at a time.')
+    parser.add_argument('source', metavar='FILE',
+                        help="Annotated file with system output.")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="Number of descriptions in each batch.")
+    parser.add_argument('--target',
+                        help="File to save the final stats to (see stats_files.py).")
+    parser.add_argument('--no-novelty', action='store_true',
+                        help="Do not compute the novelty stats (which need the index of the training data).")
+    args = parser.parse_args()
+
+    novelty_index = None
+    if not args.no_novelty:
+        from novelty import load_novelty_index
+        novelty_index = load_novelty_index()
+    stats = StreamingStats(novelty_index)
+    batch = []
+    for entry in iter_annotations(args.source):
+        batch.append(entry)
+        if len(batch) == args.batch_size:
+            stats.update_entries(batch)
+            batch = []
+            print(stats.num_tokens, 'tokens,', len(stats.vocab), 'types, TTR:', stats.streams[1].chunked_ttr(1000))
+    stats.update_entries(batch)
+    if args.target:
+        save_stats(stats.results(), args.target)
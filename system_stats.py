@@ -1,35 +1,49 @@
-from methods import sentences_from_file, system_stats, load_json, save_json, sentence_stats
+import argparse
 
-train_data = load_json('./Data/COCO/Processed/tokenized_train2014.json')
-train_descriptions = [entry['caption'] for entry in train_data['annotations']]
+from methods import corpus_from_file, system_stats, iter_annotations, add_curve_arguments
+from novelty import load_novelty_index
+from stats_files import save_stats
+from results_store import ResultsStore
 
-for folder in ['Dai-et-al-2017',
-               'Liu-et-al-2017',
-               'Mun-et-al-2017',
-               'Shetty-et-al-2016',
-               'Shetty-et-al-2017',
-               'Tavakoli-et-al-2017',
-               'Vinyals-et-al-2017',
-               'Wu-et-al-2016',
-               'Zhou-et-al-2017']:
-    print('Processing:', folder)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute statistics for all systems.')
+    add_curve_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes for the type-token curve.")
+    args = parser.parse_args()
+
+    # Hashed index of the training data (see novelty.py).
+    novelty_index = load_novelty_index()
+    store = ResultsStore()
+
+    for folder in ['Dai-et-al-2017',
+                   'Liu-et-al-2017',
+                   'Mun-et-al-2017',
+                   'Shetty-et-al-2016',
+                   'Shetty-et-al-2017',
+                   'Tavakoli-et-al-2017',
+                   'Vinyals-et-al-2017',
+                   'Wu-et-al-2016',
+                   'Zhou-et-al-2017']:
+        print('Processing:', folder)
     
-    # Define source and target.
-    base = './Data/Systems/'
-    source = base + folder + '/Val/annotated.json'
-    target = base + folder + '/Val/stats.json'
+        # Define source and target.
+        base = './Data/Systems/'
+        source = base + folder + '/Val/annotated.json'
+        target = base + folder + '/Val/stats.json'
     
-    # Load data.
-    sentences = sentences_from_file(source)
+        # Load data.
+        sentences = corpus_from_file(source)
     
-    # Process data.
-    stats = system_stats(sentences)
+        # Process data.
+        stats = system_stats(sentences, curve_repeats=args.curve_repeats, workers=args.workers)
     
-    # Get raw descriptions.
-    gen_descriptions = [entry['caption'] for entry in load_json(source)]
-    extra_stats = sentence_stats(train_descriptions, gen_descriptions)
+        # Get raw descriptions.
+        gen_descriptions = [entry['caption'] for entry in iter_annotations(source)]
+        extra_stats = novelty_index.novelty_stats(gen_descriptions, sentences)
     
-    stats.update(extra_stats)
+        stats.update(extra_stats)
     
-    # Save data.
-    save_json(stats, target)
+        # Save data.
+        save_stats(stats, target)
+        store.store(folder, stats)
@@ -0,0 +1,47 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from bootstrap import BootstrapData, resample_metrics, confidence_intervals
+from corpus import Corpus
+from methods import fused_stats, FUSED_METRICS
+
+
+def grouped_data(num_images=300, seed=0):
+    "Random descriptions for each image (one to five per image), grouped by image."
+    rng = np.random.default_rng(seed)
+    by_image = []
+    for _ in range(num_images):
+        by_image.append([['w{}'.format(int(i)) for i in rng.zipf(1.3, size=rng.integers(3, 15)) % 400]
+                         for _ in range(rng.integers(1, 6))])
+    sentences = [sentence for image in by_image for sentence in image]
+    offsets = np.cumsum([0] + [len(image) for image in by_image])
+    return BootstrapData(Corpus.from_sentences(sentences), offsets), by_image
+
+
+def test_resample_metrics_match_fused_stats():
+    data, by_image = grouped_data()
+    samples = np.stack([np.arange(data.num_images),
+                        np.random.default_rng(1).integers(0, data.num_images, data.num_images)])
+    results = resample_metrics(data, samples)
+    for row, images in enumerate(samples.tolist()):
+        # The descriptions of the drawn images, in the order in which they were drawn.
+        expected = fused_stats([sentence for image in images for sentence in by_image[image]])
+        assert results['num_types'][row] == expected['num_types']
+        for key in FUSED_METRICS:
+            if expected[key] is None:
+                assert np.isnan(results[key][row]), key
+            else:
+                assert results[key][row] == pytest.approx(expected[key], rel=1e-12), key
+
+
+def test_confidence_intervals_do_not_depend_on_workers():
+    data, _ = grouped_data()
+    intervals = confidence_intervals(data, resamples=50, batch_size=8, workers=2)
+    np.testing.assert_equal(intervals, confidence_intervals(data, resamples=50, batch_size=8))
+    for key in ['average_sentence_length', 'type_token_ratio', 'mattr', 'num_types']:
+        interval = intervals[key]
+        assert interval['low'] <= interval['high'] and interval['std'] > 0
+    # The estimate is for the output grouped by image, like the resamples.
+    full = resample_metrics(data, np.arange(data.num_images)[None, :])
+    assert intervals['mattr']['estimate'] == full['mattr'][0]
@@ -0,0 +1,36 @@
+from collections import Counter
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from global_recall import CoverageIndex, get_count_list, most_frequent_omissions, percentiles
+
+VAL_STATS = {'total_counts': Counter({'dog': 50, 'cat': 40, 'man': 35, 'ball': 20, 'grass': 12,
+                                      'frisbee': 9, 'park': 7, 'kite': 5, 'zebra': 3, 'sofa': 2,
+                                      'pier': 1, 'umbrella': 1})}
+LEARNABLE = {'dog', 'cat', 'man', 'ball', 'frisbee', 'kite', 'zebra', 'pier'}
+SYSTEM_TYPES = [{'dog', 'cat', 'grass', 'kite', 'pier', 'spaceship'},
+                {'man', 'ball', 'frisbee', 'zebra', 'sofa'},
+                set()]
+
+
+def test_coverage_matches_sets():
+    index = CoverageIndex(VAL_STATS, LEARNABLE)
+    for types, result in zip(SYSTEM_TYPES, index.coverage(SYSTEM_TYPES)):
+        # The set-based computation of global_recall.coverage.
+        recalled = types & LEARNABLE
+        assert result['recalled'] == recalled
+        assert result['score'] == pytest.approx(len(recalled) / len(LEARNABLE))
+        assert result['not_in_val'] == types - LEARNABLE
+        assert sorted(result['omissions']) == sorted(most_frequent_omissions(recalled, VAL_STATS))
+        expected = percentiles(get_count_list(VAL_STATS), recalled)
+        assert result['percentiles']['val_scores'] == pytest.approx(expected['val_scores'])
+
+
+def test_coverage_of_all_val_words():
+    index = CoverageIndex(VAL_STATS, LEARNABLE)
+    result, = index.coverage([SYSTEM_TYPES[0]], learnable_only=False)
+    recalled = SYSTEM_TYPES[0] & set(VAL_STATS['total_counts'])
+    assert result['recalled'] == recalled
+    assert result['score'] == pytest.approx(len(recalled) / len(LEARNABLE))
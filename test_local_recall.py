@@ -0,0 +1,37 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from local_recall import ImportanceIndex, local_recall, image_recall_counts, batch_local_recall_scores
+
+
+def references(words, num_references):
+    "References where the i-th word occurs in the first num_references - i references."
+    return [[(word, 'NN') for word in words[:num_references - i]] for i in range(num_references)]
+
+# Images with seven and six references, so there are words in classes 6 and 7.
+REF_DATA = {1: references(['dog', 'ball', 'grass', 'park', 'tree', 'sky'], 7),
+            2: references(['cat', 'sofa', 'rug', 'lamp', 'window', 'door'], 6)}
+GENERATED = {1: ['a', 'dog', 'with', 'a', 'ball', 'in', 'the', 'park', 'sky'],
+             2: ['a', 'cat', 'on', 'a', 'rug', 'near', 'a', 'window']}
+
+
+def test_image_recall_counts_match_local_recall():
+    index = ImportanceIndex.from_references(REF_DATA)
+    assert sorted(index.classes.tolist()) == [1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7]
+    recalled, total = image_recall_counts(GENERATED, index)
+    assert recalled.shape == total.shape == (2, 5)
+    assert recalled.sum(axis=0).tolist() == [0, 2, 0, 2, 0]
+    assert total.sum(axis=0).tolist() == [1, 2, 2, 2, 2]
+    scores = recalled.sum(axis=0) / total.sum(axis=0)
+    assert scores.tolist() == pytest.approx(local_recall(GENERATED, index)['scores'])
+
+
+def test_batch_local_recall_scores_match_local_recall():
+    pytest.importorskip('scipy')
+    index = ImportanceIndex.from_references(REF_DATA)
+    # The last system recalls class 7 words, and the first one does not.
+    others = {1: ['a', 'tree'], 2: ['a', 'door']}
+    scores = batch_local_recall_scores([others, GENERATED], index)
+    assert scores[0] == pytest.approx(local_recall(others, index)['scores'])
+    assert scores[1] == pytest.approx(local_recall(GENERATED, index)['scores'])
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from methods import (iter_json_array, fused_stats, get_types_tokens, average_sentence_length,
+                     std_sentence_length, type_token_ratio, ngram_ttr, mattr, ngram_mattr)
+
+ANNOTATIONS = {'info': {'description': 'nested [values], "quotes" and {braces}', 'year': 2014},
+               'images': [{'id': 1, 'file_name': 'a.jpg'}, {'id': 2, 'file_name': 'b.jpg'}],
+               'annotations': [{'image_id': 1, 'id': 12345678, 'caption': 'A dog, running [fast].'},
+                               {'image_id': 2, 'id': 3.25, 'caption': 'Café with "quotes"'},
+                               {'image_id': 2, 'id': -7e3, 'caption': ''}],
+               'licenses': []}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1 << 20])
+def test_iter_json_array_at_any_chunk_boundary(tmp_path, chunk_size):
+    for indent in [None, 2]:
+        filename = str(tmp_path / 'captions.json')
+        with open(filename, 'w') as f:
+            json.dump(ANNOTATIONS, f, indent=indent)
+        entries = list(iter_json_array(filename, key='annotations', chunk_size=chunk_size))
+        assert entries == ANNOTATIONS['annotations']
+        with open(filename, 'w') as f:
+            json.dump([1, 22, 333, [], {}], f, indent=indent)
+        assert list(iter_json_array(filename, chunk_size=chunk_size)) == [1, 22, 333, [], {}]
+
+
+def test_iter_json_array_empty_and_missing(tmp_path):
+    filename = str(tmp_path / 'empty.json')
+    with open(filename, 'w') as f:
+        json.dump({'annotations': [], 'images': []}, f)
+    assert list(iter_json_array(filename, key='annotations', chunk_size=2)) == []
+    with pytest.raises(KeyError):
+        list(iter_json_array(filename, key='captions', chunk_size=2))
+
+
+def test_fused_stats_match_separate_metrics():
+    rng = np.random.default_rng(0)
+    words = ['w{}'.format(int(i)) for i in rng.zipf(1.3, size=40000) % 500]
+    lengths = rng.integers(3, 20, size=2500).tolist()
+    offsets = np.cumsum([0] + lengths).tolist()
+    # Lists of words, so that the metrics below use their original (non-fused) implementations.
+    sentences = [words[start:end] for start, end in zip(offsets, offsets[1:])]
+    data = fused_stats(sentences)
+    expected = get_types_tokens(sentences)
+    assert data['counts'] == expected['counts'] and list(data['counts']) == list(expected['counts'])
+    assert data['num_types'] == expected['num_types'] and data['num_tokens'] == expected['num_tokens']
+    assert data['average_sentence_length'] == average_sentence_length(sentences)
+    assert data['std_sentence_length'] == std_sentence_length(sentences)
+    assert data['type_token_ratio'] == type_token_ratio(sentences)
+    assert data['ttr10k'] == type_token_ratio(sentences, n=10000)
+    assert data['ttr100k'] is None
+    assert data['bittr'] == ngram_ttr(sentences, n=2)
+    assert data['trittr'] == ngram_ttr(sentences, n=3)
+    assert data['mattr'] == mattr(sentences)
+    assert data['mattr10k'] == mattr(sentences, window=10000)
+    assert data['bimattr'] == ngram_mattr(sentences, n=2)
+    assert data['trimattr'] == ngram_mattr(sentences, n=3)
@@ -0,0 +1,30 @@
+import textwrap
+
+from pipeline import Stage, run_pipeline
+
+
+def write_script(path, body):
+    with open(path, 'w') as f:
+        f.write(textwrap.dedent(body))
+
+
+def test_dependent_stage_waits_for_slow_producer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_script('slow.py', """
+        import time
+        time.sleep(1)
+        open('slow.out', 'w').write('done')
+        """)
+    write_script('fast.py', """
+        open('fast.out', 'w').write('done')
+        """)
+    write_script('after_slow.py', """
+        with open('slow.out') as f:
+            open('after.out', 'w').write(f.read())
+        """)
+    stages = [Stage('slow', ['slow.py'], inputs=[], outputs=['slow.out']),
+              Stage('fast', ['fast.py'], inputs=[], outputs=['fast.out']),
+              Stage('after_slow', ['after_slow.py'], inputs=['slow.out'], outputs=['after.out'])]
+    assert run_pipeline(stages, jobs=3)
+    with open('after.out') as f:
+        assert f.read() == 'done'
@@ -0,0 +1,39 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+bleu_score = pytest.importorskip('nltk.translate.bleu_score')
+
+from methods import ngrams
+from self_bleu import self_bleu
+
+SENTENCES = [s.split() for s in ['a man riding a horse on a beach',
+                                 'a man riding a horse',
+                                 'two dogs playing in the grass',
+                                 'a dog playing with a ball in the grass',
+                                 'a horse',
+                                 'a man on a beach with a surfboard',
+                                 'two dogs playing in the grass']]
+
+
+def test_self_bleu_matches_nltk():
+    others = [SENTENCES[:i] + SENTENCES[i + 1:] for i in range(len(SENTENCES))]
+    smoothing = bleu_score.SmoothingFunction().method1
+    result = self_bleu(SENTENCES, max_n=4)
+    assert result['self_bleu'] == pytest.approx(bleu_score.corpus_bleu(others, SENTENCES))
+    expected = np.mean([bleu_score.sentence_bleu(references, hypothesis, smoothing_function=smoothing)
+                        for references, hypothesis in zip(others, SENTENCES)])
+    assert result['mean_self_bleu'] == pytest.approx(expected)
+
+
+def test_pairwise_overlap_matches_brute_force():
+    result = self_bleu(SENTENCES, max_n=3, workers=2)
+    for n in [1, 2, 3]:
+        types = [set(ngrams(sentence, n)) for sentence in SENTENCES]
+        # Descriptions without any ngrams have no overlap.
+        overlaps = [len(a & b) / len(a) if a else 0.0 for i, a in enumerate(types)
+                    for j, b in enumerate(types) if i != j]
+        assert result['pairwise_overlap_{}grams'.format(n)] == pytest.approx(np.mean(overlaps))
+
+
+def test_self_bleu_needs_two_descriptions():
+    assert self_bleu([['a', 'b']])['self_bleu'] is None
@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from methods import system_stats, FUSED_METRICS
+from sharded_stats import sharded_system_stats
+
+
+def random_sentences(num_sentences, seed=0, vocab_size=300):
+    rng = np.random.default_rng(seed)
+    # Skewed word frequencies, so that some words are repeated and others are rare.
+    words = ['w{}'.format(int(i)) for i in rng.zipf(1.3, size=num_sentences * 12) % vocab_size]
+    lengths = rng.integers(3, 20, size=num_sentences)
+    sentences, start = [], 0
+    for length in lengths.tolist():
+        sentences.append(words[start:start + length])
+        start += length
+    return sentences
+
+
+def split(sentences, sizes):
+    shards, start = [], 0
+    for size in sizes:
+        shards.append(sentences[start:start + size])
+        start += size
+    return shards + [sentences[start:]]
+
+
+def assert_same_stats(result, expected):
+    assert result['counts'] == expected['counts']
+    assert list(result['counts']) == list(expected['counts'])
+    assert result['num_tokens'] == expected['num_tokens']
+    for key in FUSED_METRICS:
+        assert result[key] == pytest.approx(expected[key], rel=1e-12), key
+    np.testing.assert_array_equal(result['ttr_curve'], expected['ttr_curve'])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sharded_system_stats_match_system_stats(workers):
+    sentences = random_sentences(400)
+    shards = split(sentences, [37, 150, 1, 90])
+    expected = system_stats(sentences, curve_repeats=3)
+    assert expected['type_token_ratio'] is not None and expected['trimattr'] is not None
+    assert_same_stats(sharded_system_stats(shards, curve_repeats=3, workers=workers), expected)
+
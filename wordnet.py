@@ -1,5 +1,5 @@
 from methods import load_json
-from nltk.corpus import wordnet as wn
+from wordnet_depths import load_depth_table
 from collections import Counter, defaultdict
 import numpy as np
 from tabulate import tabulate
@@ -12,53 +12,43 @@ sns.set_palette(sns.color_palette("cubehelix", 10))
 #################################################################################
 # Main functions
 
-def average_depth(word, pos):
-    "Compute average depth for all synsets corresponding to a word."
-    synsets = wn.synsets(word, pos)
-    depths = [s.min_depth() for s in synsets]
-    avg_depth = np.average(depths)
-    return avg_depth
+# The depths of all nouns are looked up in a precomputed table (see wordnet_depths.py).
 
-
-def depth_stats(entries):
-    # Create a list of all noun tokens.
-    noun_tokens = [word.lower() for entry in entries
-                        for word, pos in entry['tagged']
-                        if pos.startswith('NN')]
+def type_and_token_depths(noun_tokens, depth_table):
+    "Lists with the depth of each noun type and token (ignoring nouns that are not in WordNet)."
     # Create a list of all noun types.
     noun_types        = set(noun_tokens)
-    # Create a dictionary of all average synset depths for each word.
-    depths            = {word: average_depth(word, 'n') for word in noun_types}
+    # Look up the average synset depth for each word.
+    depths            = depth_table.lookup(noun_types)
     # Use the dictionary to create a list of all depths.
     depths_per_type  = [depths[word] for word in noun_types]
     depths_per_token = [depths[word] for word in noun_tokens]
     # Filter weights
     depths_per_type  = [w for w in depths_per_type if not np.isnan(w)]
     depths_per_token = [w for w in depths_per_token if not np.isnan(w)]
-    # Return stats.
+    return depths_per_type, depths_per_token
+
+
+def summary(depths_per_type, depths_per_token):
     return dict(average_type_depth = np.average(depths_per_type),
                 average_token_depth = np.average(depths_per_token),
                 std_type_depth = np.std(depths_per_type),
                 std_token_depth = np.std(depths_per_token))
 
 
-def depth_including_compounds(entries):
+def depth_stats(entries, depth_table):
+    # Create a list of all noun tokens.
+    noun_tokens = [word.lower() for entry in entries
+                        for word, pos in entry['tagged']
+                        if pos.startswith('NN')]
+    # Return stats.
+    return summary(*type_and_token_depths(noun_tokens, depth_table))
+
+
+def depth_including_compounds(entries, depth_table):
     noun_tokens = nouns_from_entries(entries)
-    # Create a list of all noun types.
-    noun_types        = set(noun_tokens)
-    # Create a dictionary of all average synset depths for each word.
-    depths            = {word: average_depth(word, 'n') for word in noun_types}
-    # Use the dictionary to create a list of all depths.
-    depths_per_type  = [depths[word] for word in noun_types]
-    depths_per_token = [depths[word] for word in noun_tokens]
-    # Filter weights
-    depths_per_type  = [w for w in depths_per_type if not np.isnan(w)]
-    depths_per_token = [w for w in depths_per_token if not np.isnan(w)]
     # Return stats.
-    return dict(average_type_depth = np.average(depths_per_type),
-                average_token_depth = np.average(depths_per_token),
-                std_type_depth = np.std(depths_per_type),
-                std_token_depth = np.std(depths_per_token))
+    return summary(*type_and_token_depths(noun_tokens, depth_table))
 
 
 def nouns_from_entries(entries):
@@ -79,18 +69,9 @@ def nouns_from_entries(entries):
             current = []
     return nouns
 
-def get_depths_histogram(entries):
+def get_depths_histogram(entries, depth_table):
     noun_tokens = nouns_from_entries(entries)
-    # Create a list of all noun types.
-    noun_types        = set(noun_tokens)
-    # Create a dictionary of all average synset depths for each word.
-    depths            = {word: average_depth(word, 'n') for word in noun_types}
-    # Use the dictionary to create a list of all depths.
-    depths_per_type  = [depths[word] for word in noun_types]
-    depths_per_token = [depths[word] for word in noun_tokens]
-    # Filter weights
-    depths_per_type  = [w for w in depths_per_type if not np.isnan(w)]
-    depths_per_token = [w for w in depths_per_token if not np.isnan(w)]
+    depths_per_type, depths_per_token = type_and_token_depths(noun_tokens, depth_table)
     # Compute histograms
     return dict(type_histogram = Counter(map(round, depths_per_type)),
                 token_histogram = Counter(map(round, depths_per_token)))
@@ -178,15 +159,17 @@ def get_keys(d, keys):
 ################################################################################
 # Compute stats.
 
+depth_table      = load_depth_table()
+
 ###########################
 # Val
 
 val_tagged       = load_json('./Data/COCO/Processed/tagged_val2014.json')
 parallel_entries = parallel_entries(val_tagged)
-parallel_results = [depth_including_compounds(entries) for entries in parallel_entries]
+parallel_results = [depth_including_compounds(entries, depth_table) for entries in parallel_entries]
 val_result       = average_dicts(parallel_results)
 
-parallel_histos  = [get_depths_histogram(entries) for entries in parallel_entries]
+parallel_histos  = [get_depths_histogram(entries, depth_table) for entries in parallel_entries]
 type_histos = [d['type_histogram'] for d in parallel_histos]
 token_histos = [d['token_histogram'] for d in parallel_histos]
 val_histo = dict(type_histogram=average_dicts(type_histos),
@@ -206,8 +189,11 @@ systems = {'Dai-et-al-2017': "\citeauthor{Dai_2017_ICCV} (\citeyear{Dai_2017_ICC
            'Zhou-et-al-2017': '\citeauthor{zhou2017watch} (\citeyear{zhou2017watch})'}
 
 loaded_systems = {system: load_system_data(system) for system in systems}
-system_results = {system: depth_including_compounds(loaded_data) for system, loaded_data in loaded_systems.items()}
-system_histos = {system: get_depths_histogram(loaded_data) for system, loaded_data in loaded_systems.items()}
+system_results = {system: depth_including_compounds(loaded_data, depth_table) for system, loaded_data in loaded_systems.items()}
+system_histos = {system: get_depths_histogram(loaded_data, depth_table) for system, loaded_data in loaded_systems.items()}
+
+# Store the depths of any nouns that were not in the table yet.
+depth_table.save_if_changed()
 
 ###########################
 # Table
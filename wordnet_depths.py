@@ -0,0 +1,147 @@
+"""
+Precomputed table with the average WordNet depth of each noun.
+
+Looking up the synsets of a word and computing their depths is slow, and wordnet.py
+needs the depths of the same nouns for every system and for every parallel slice
+of the val data. This module computes the depths of all nouns (and compounds, joined
+with underscores) in the MS COCO data and the system output once, using a pool of
+worker processes, and stores them in Data/COCO/Processed/wordnet_depths.json.
+Nouns without any synsets have depth NaN (stored as null).
+
+The table is built automatically the first time it is needed, or you can build it with:
+
+    python wordnet_depths.py [--workers 4]
+
+Words that are not in the table yet (e.g. in the output of a new system) are looked
+up when they are needed, and added to the table.
+"""
+
+import argparse
+import glob
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from nltk.corpus import wordnet as wn
+
+from methods import iter_annotations
+
+DEPTH_TABLE = './Data/COCO/Processed/wordnet_depths.json'
+SOURCES = ['./Data/COCO/Processed/tokenized_train2014.json',
+           './Data/COCO/Processed/tagged_val2014.json'] + sorted(glob.glob('./Data/Systems/*/Val/annotated.json'))
+
+
+def average_depth(word, pos):
+    "Compute average depth for all synsets corresponding to a word."
+    synsets = wn.synsets(word, pos)
+    depths = [s.min_depth() for s in synsets]
+    avg_depth = np.average(depths) if depths else np.nan
+    return avg_depth
+
+
+def noun_depth(word):
+    return average_depth(word, 'n')
+
+
+def nouns_from_tagged(tagged):
+    "Return all nouns in a tagged description, as well as the compounds joined with underscores."
+    nouns = []
+    current = []
+    for token, pos in list(tagged) + [('', '')]:
+        if pos.startswith('NN'):
+            nouns.append(token.lower())
+            current.append(token.lower())
+        elif current:
+            if len(current) > 1:
+                nouns.append('_'.join(current))
+            current = []
+    return nouns
+
+
+def compute_depths(words, workers=1):
+    "Dictionary with the average depth of each word."
+    words = sorted(set(words))
+    if workers > 1 and len(words) > 1:
+        with Pool(workers) as pool:
+            depths = pool.map(noun_depth, words, chunksize=max(1, len(words) // (workers * 4)))
+    else:
+        depths = [noun_depth(word) for word in words]
+    return dict(zip(words, depths))
+
+
+class DepthTable(object):
+    "Average WordNet depth for each noun, with new nouns added when they are first needed."
+
+    def __init__(self, depths=None, filename=DEPTH_TABLE):
+        self.depths = depths or dict()
+        self.filename = filename
+        self.changed = False
+
+    def lookup(self, words, workers=1):
+        "Dictionary with the average depth of each word."
+        missing = set(words) - set(self.depths)
+        if missing:
+            self.depths.update(compute_depths(missing, workers))
+            self.changed = True
+        return {word: self.depths[word] for word in words}
+
+    def __getitem__(self, word):
+        return self.lookup([word])[word]
+
+    def __len__(self):
+        return len(self.depths)
+
+    def save(self, filename=None):
+        "Save the table (with NaN stored as null)."
+        filename = filename or self.filename
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(filename, 'w') as f:
+            json.dump({word: None if np.isnan(depth) else float(depth)
+                       for word, depth in sorted(self.depths.items())}, f)
+        self.changed = False
+
+    def save_if_changed(self):
+        if self.changed:
+            self.save()
+
+    @classmethod
+    def load(cls, filename=DEPTH_TABLE):
+        with open(filename) as f:
+            depths = json.load(f)
+        return cls({word: np.nan if depth is None else depth for word, depth in depths.items()}, filename)
+
+
+def build_depth_table(sources=SOURCES, filename=DEPTH_TABLE, workers=1):
+    "Compute the depths of all nouns and compounds in the annotated files, and save the table."
+    words = set()
+    for source in sources:
+        for entry in iter_annotations(source):
+            words.update(nouns_from_tagged(entry['tagged']))
+    table = DepthTable(compute_depths(words, workers), filename)
+    table.save()
+    return table
+
+
+def load_depth_table(filename=DEPTH_TABLE, sources=SOURCES, workers=1):
+    "Load the depth table, building it first if it does not exist yet."
+    if not os.path.exists(filename):
+        print('Building the WordNet depth table (this only happens once)...')
+        return build_depth_table([source for source in sources if os.path.exists(source)], filename, workers)
+    return DepthTable.load(filename)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the table with the WordNet depth of each noun.')
+    parser.add_argument('--sources', nargs='+', default=SOURCES, metavar='FILE',
+                        help="Annotated files with the nouns to include.")
+    parser.add_argument('--target', default=DEPTH_TABLE,
+                        help="File to store the table in.")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Number of worker processes.")
+    args = parser.parse_args()
+
+    table = build_depth_table(args.sources, args.target, args.workers)
+    print('Computed the depths of', len(table), 'nouns.')